@@ -1,15 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntEnum
-from typing import Literal
+from typing import Any, Dict, List, Literal, Optional
 
 try:
     import fabric  # type: ignore
 
+    from automagician.ssh_pool import SshPool
+
 
     @dataclass
     class SshScp:
         ssh: fabric.connection.Connection
         scp: fabric.transfer.Transfer
+        pool: SshPool
 
 
     @dataclass
@@ -48,7 +51,11 @@ class Machine(IntEnum):
     UNKNOWN = -1
 
 
-@dataclass
+_UNSET = object()  # what a job field holds before __init__ sets it
+
+
+# Job records use slots, as one of each is held for every job ever registered
+@dataclass(slots=True)
 class OptJob:
     """A class to represent an optomization job
 
@@ -57,14 +64,22 @@ class OptJob:
       The machine this job is on
     last_on
       The machine this job was last ran on
+    dirty
+      If this job changed since it was loaded from or written to the database
     """
 
     status: JobStatus
     home_machine: Machine
     last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name != "dirty" and getattr(self, name, _UNSET) != value:
+            object.__setattr__(self, "dirty", True)
+        object.__setattr__(self, name, value)
 
-@dataclass
+
+@dataclass(slots=True)
 class DosJob:
     """Density optomization job
 
@@ -78,6 +93,8 @@ class DosJob:
       The machine the of the optomization job this is connected to
     dos_last_on
       The machine that this job was connected to
+    dirty
+      If this job changed since it was loaded from or written to the database
     """
 
     opt_dir = None
@@ -86,9 +103,15 @@ class DosJob:
     dos_status: JobStatus
     sc_last_on: Machine
     dos_last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name != "dirty" and getattr(self, name, _UNSET) != value:
+            object.__setattr__(self, "dirty", True)
+        object.__setattr__(self, name, value)
 
-@dataclass
+
+@dataclass(slots=True)
 class WavJob:
     """A job ran specifically to obtain a WAVECAR
     opt_id
@@ -100,15 +123,23 @@ class WavJob:
       2 = error
       -1 = running
     wav_last_on
-      The machine that this job was connected to"""
+      The machine that this job was connected to
+    dirty
+      If this job changed since it was loaded from or written to the database"""
 
     opt_dir = None
     opt_id: int | Literal[-1]
     wav_status: JobStatus
     wav_last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name != "dirty" and getattr(self, name, _UNSET) != value:
+            object.__setattr__(self, "dirty", True)
+        object.__setattr__(self, name, value)
 
-@dataclass
+
+@dataclass(slots=True)
 class GoneJob:
     """A record of jobs that can no longer be found"""
 
@@ -118,6 +149,198 @@ class GoneJob:
     last_on: Machine
 
 
+@dataclass
+class DirectoryScan:
+    """The result of listing a single directory while registering jobs
+
+    path
+      The directory that was listed
+    subdirs
+      The names of the directories inside path, in the order they were listed
+    has_opt
+      If path has every file needed for an optimization job
+    is_neb
+      If path is a NEB bundle, meaning it has band, ini, and fin directories
+    has_dos
+      If the automagic_note in path asks for a dos job
+    has_wav
+      If the automagic_note in path asks for a wav job
+    exclude
+      If the automagic_note in path asks for path to be excluded
+    """
+
+    path: str
+    subdirs: List[str]
+    has_opt: bool
+    is_neb: bool
+    has_dos: bool
+    has_wav: bool
+    exclude: bool
+
+
+@dataclass
+class LlOutScan:
+    """What a single read of a job's ll_out found
+
+    has_error
+      If VASP refused to continue with the job
+    converged
+      If VASP reached the required accuracy and stopped the relaxation
+    error_messages
+      Every line that mentions an error, with the surrounding "|" and
+      whitespace removed. Only read when has_error is True, empty otherwise
+    last_step
+      The last ionic step that was reported, or 0 if none were
+    """
+
+    has_error: bool
+    converged: bool
+    error_messages: List[str]
+    last_step: int
+
+
+@dataclass
+class DirectoryIndexEntry:
+    """What the directory index knows about a single directory
+
+    scan
+      The scan of the directory
+    subfile
+      The name of the subfile that the scan was made with
+    mtime_ns / ctime_ns
+      The mtime and ctime of the directory when it was scanned
+    note_mtime_ns / note_ctime_ns
+      The mtime and ctime of the automagic_note in the directory when it was
+      scanned, or -1 if there was not one
+    """
+
+    scan: DirectoryScan
+    subfile: str
+    mtime_ns: int
+    ctime_ns: int
+    note_mtime_ns: int
+    note_ctime_ns: int
+
+
+@dataclass
+class JobFact:
+    """A fact derived from a file, and the state of the file it was read from
+
+    size
+      The size of the file when the fact was read
+    mtime_ns
+      The mtime of the file when the fact was read
+    value
+      The fact itself. Anything that can be stored as json
+    """
+
+    size: int
+    mtime_ns: int
+    value: Any
+
+
+@dataclass
+class CombinedRun:
+    """How much of a single run directory has been added to cmbXDATCAR and cmbFE.dat
+
+    xdatcar_offset
+      How many bytes of the run's XDATCAR have been read
+    xdatcar_started
+      If lines from the run's XDATCAR are being written. The header and first
+      configuration of every run but the first are skipped, as the first
+      configuration is the last configuration of the previous run
+    fe_offset
+      How many bytes of the run's fe.dat have been read
+    """
+
+    xdatcar_offset: int
+    xdatcar_started: bool
+    fe_offset: int
+
+
+@dataclass
+class CombineState:
+    """What has been written to cmbXDATCAR and cmbFE.dat for a job
+
+    runs
+      Every run directory that has been combined, keyed by name, ex "run0"
+    line_count
+      The number of lines in cmbFE.dat
+    step
+      The step of the last line in cmbFE.dat
+    force
+      The force of the last line in cmbFE.dat
+    energy
+      The energy of the last line in cmbFE.dat
+    """
+
+    runs: Dict[str, CombinedRun]
+    line_count: int
+    step: int
+    force: float
+    energy: float
+
+
+@dataclass
+class FileState:
+    """What a delta sync compares to decide if a file changed
+
+    size
+      The size of the file in bytes
+    mtime
+      The modification time of the file, in whole seconds, as tar keeps it
+    """
+
+    size: int
+    mtime: int
+
+
+@dataclass
+class SchedulerJob:
+    """A single job in the scheduler's queue
+
+    job_id
+      The id the scheduler gave the job
+    state
+      The scheduler's short state code, ex "PD" or "R"
+    partition
+      The partition the job was submitted to
+    user
+      The user that submitted the job
+    work_dir
+      The directory the job was submitted from. For a task of a job array
+      automagician submitted, the job directory the task runs in
+    array_job_id
+      The id of the job array this is a task of, or the job id if it is not
+      part of an array
+    array_task_id
+      The index of this task in its job array, or None if it is not part of
+      an array
+    """
+
+    job_id: str
+    state: str
+    partition: str
+    user: str
+    work_dir: str
+    array_job_id: str = ""
+    array_task_id: Optional[int] = None
+
+
+@dataclass
+class SchedulerSnapshot:
+    """The scheduler's queue, as read once at the start of a run
+
+    jobs
+      Every job in the queue, from every user
+    user
+      The user automagician is running as
+    """
+
+    jobs: List[SchedulerJob]
+    user: str
+
+
 class JobLimitError(Exception):
     """What happens if you submit too many jobs"""
 
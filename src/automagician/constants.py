@@ -3,6 +3,7 @@ import os
 LOCK_FILE = f"/tmp/automagician/{os.environ['USER']}-lock"
 LOCK_DIR = "/tmp/automagician"
 DB_NAME = "automagician.db"
+DIRECTORY_INDEX_NAME = "automagician_index.db"
 AUTOMAGIC_REMOTE_DIR = "/automagician_jobs"
 DEFAULT_SUBFILE = "~/fri.sub"
 DEFAULT_SUBFILE_PATH_FRI_HALIFAX = (
@@ -17,8 +18,52 @@ SO_GET_SOFT_PBE_PATH = "/home/wc5879/kingRaychardsArsenal/sogetsoftpbe.py"
 V_FIN_PL_PATH = "vfin.pl"
 PRELIMINARY_RESULTS_NAME = "preliminary_results.dat"
 CONVERGENCE_CERTIFICATE_NAME = "convergence_certificate"
+CMB_XDATCAR_NAME = "cmbXDATCAR"
+CMB_FE_NAME = "cmbFE.dat"
+CMB_STATE_NAME = ".cmb_state.json"
+VASP_ERROR_MARKER = "I REFUSE TO CONTINUE WITH THIS SICK JOB"
+VASP_CONVERGENCE_MARKER = (
+    "reached required accuracy - stopping structural energy minimisation"
+)
 TACC_QUEUE_MAXES = [
     50,
     0,
     200,
 ]  # stampede2 knl normal, frontera normal, ls6 normal respectively # no frontera allocation -> alloc 0
+DISCOVERY_WORKERS = 16  # threads used to list directories while registering
+REVERSE_READ_CHUNK_SIZE = 1 << 16  # bytes read at a time when reading output backwards
+COMBINE_CHUNK_SIZE = 1 << 20  # bytes copied at a time into cmbXDATCAR
+DB_BUSY_TIMEOUT_MS = 30000  # how long to wait for another automagician's write to finish
+DB_MMAP_SIZE = 1 << 28  # bytes of automagician.db to memory map when using WAL
+# directories changed this close to registering starting are not kept in the
+# directory index, as a later change in the same timestamp tick would go unseen.
+# 1 s covers filesystems with second timestamps, ex ext3 and some NFS servers
+DIRECTORY_INDEX_RACY_NS = 10**9
+JOB_CACHE_SIZE = 4096  # clean jobs held in memory per job type when streaming
+JOB_PAGE_SIZE = 1000  # jobs read from the database at a time when streaming
+# job id, state, partition, user, array job id, array task id, work dir
+SQUEUE_FORMAT = "%A|%t|%P|%u|%F|%K|%Z"
+ARRAY_DIR_NAME = ".automagician_arrays"  # job array manifests and output, in home
+ARRAY_MAX_SIZE = 1000  # jobs in a single job array, below slurm's default MaxArraySize
+SLURM_ERROR_STATES = ["BF", "CA", "F", "NF", "OOM", "TO"]
+SGE_ERROR_STATES = ["Eqw"]
+SCANCEL_BATCH_SIZE = 1000  # job ids given to a single scancel
+SUBMIT_WORKERS = 8  # jobs submitted at the same time
+# most jobs submitted at the same time, and least seconds between submissions
+# starting, for the local scheduler and the other Oden machine
+SUBMIT_TARGET_LIMITS = {"local": (4, 0.005), "remote": (4, 0.0)}
+TRANSFER_CHUNK_SIZE = 1 << 20  # bytes sent at a time when copying a job to another machine
+TRANSFER_COMPRESSION = "none"  # "none", "gzip" or "zstd", see transfer.TAR_COMPRESSION_FLAGS
+SYNC_USE_HASH = False  # compare files whose mtime changed by sha256 when syncing jobs
+SSH_MAX_CHANNELS = 8  # commands and transfers run at once over the ssh connection
+SSH_KEEPALIVE_SECONDS = 30  # seconds between keepalives on the ssh connection
+SSH_RETRIES = 1  # times a channel is retried on a new ssh connection
+# how copy_inputs puts each input of a new sc, dos or wav job in its directory,
+# by file name, or "default" for the rest. "reflink" shares the blocks copy on
+# write, "hardlink" and "symlink" share the file itself, so only use them for
+# files the new job never writes, and "copy" copies the bytes. Each falls back
+# to reflink, then to copy
+INPUT_COPY_STRATEGIES = {"default": "reflink"}
+# dos jobs only read CHGCAR, so it is shared with the job it came from, and
+# create_dos_from_sc sets LCHARG=.FALSE. so VASP does not write over it
+DOS_INPUT_COPY_STRATEGIES = {"CHGCAR": "hardlink", "default": "reflink"}
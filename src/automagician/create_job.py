@@ -1,12 +1,17 @@
+import fcntl
 import logging
 import os
 import shutil
-from typing import List
+import stat
+from typing import Callable, Dict, List, Optional
 
+import automagician.constants as constants
 import automagician.machine as machine_file
 import automagician.update_job as update_job
 from automagician.classes import JobLimitError, Machine
 
+FICLONE = 0x40049409  # linux ioctl that clones a file
+
 
 def add_to_sub_queue(
         job_directory: str,
@@ -80,25 +85,19 @@ def create_dos_from_sc(
     """
     subfile = machine_file.get_subfile(machine)
     dos_dir = os.path.normpath(os.path.join(job_directory, "../dos"))
-    # os.mkdir(dos_dir)
-    # shutil.copy(os.path.join(job_directory, subfile), dos_dir)
-    # shutil.copy(os.path.join(job_directory, "KPOINTS"), dos_dir)
-    # shutil.copy(os.path.join(job_directory, "POTCAR"), dos_dir)
-    # shutil.copy(os.path.join(job_directory, "INCAR"), dos_dir)
-    # shutil.copy(os.path.join(job_directory, "CHGCAR"), dos_dir)
 
     # copy over the inputs
-    copy_inputs(subfile, job_directory, dos_dir)
-
-    if os.path.exists(os.path.join(job_directory, "CONTCAR")):
-        shutil.copy(os.path.join(job_directory, "CONTCAR"), dos_dir)
-    else:
-        shutil.copy(os.path.join(job_directory, "POSCAR"), dos_dir)
-
-    update_job.set_incar_tags(
-        os.path.join(dos_dir, "INCAR"), {"ICHARGE": "11", "LORBIT": "11"}
+    methods = copy_inputs(
+        subfile, job_directory, dos_dir, constants.DOS_INPUT_COPY_STRATEGIES
     )
 
+    tags: Dict[str, Optional[str]] = {"ICHARGE": "11", "LORBIT": "11"}
+    if methods.get("CHGCAR") in ["hardlink", "symlink"]:
+        # CHGCAR is shared with the job it came from, so VASP must not write
+        # over it
+        tags["LCHARG"] = ".FALSE."
+    update_job.set_incar_tags(os.path.join(dos_dir, "INCAR"), tags)
+
     add_to_sub_queue(
         job_directory=dos_dir,
         continue_past_limit=continue_past_limit,
@@ -109,20 +108,130 @@ def create_dos_from_sc(
     )
 
 
-def copy_inputs(subfile,
-                job_directory: str,
-                directory: str) -> None:
+def copy_inputs(
+        subfile: str,
+        job_directory: str,
+        directory: str,
+        strategies: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Makes directory and puts the inputs of the job in job_directory in it
+
+    The inputs are the subfile, KPOINTS, POTCAR, INCAR, CHGCAR if it exists,
+    and CONTCAR, or POSCAR if CONTCAR does not exist
+
+    Args:
+        subfile: The name of the subfile
+        job_directory: The directory of the job the inputs are taken from
+        directory: The directory to make
+        strategies: How each file is put in directory, by file name or
+            "default", see INPUT_COPY_STRATEGIES. Defaults to
+            INPUT_COPY_STRATEGIES
+    Returns:
+        How each file was put in directory, by file name, see copy_input
+    """
+    if strategies is None:
+        strategies = constants.INPUT_COPY_STRATEGIES
     os.mkdir(directory)
-    shutil.copy(os.path.join(job_directory, subfile), directory)
-    shutil.copy(os.path.join(job_directory, "KPOINTS"), directory)
-    shutil.copy(os.path.join(job_directory, "POTCAR"), directory)
-    shutil.copy(os.path.join(job_directory, "INCAR"), directory)
+    names = [subfile, "KPOINTS", "POTCAR", "INCAR"]
     if os.path.exists(os.path.join(job_directory, "CHGCAR")):
-        shutil.copy(os.path.join(job_directory, "CHGCAR"), directory)
+        names.append("CHGCAR")
     if os.path.exists(os.path.join(job_directory, "CONTCAR")):
-        shutil.copy(os.path.join(job_directory, "CONTCAR"), directory)
+        names.append("CONTCAR")
     else:
-        shutil.copy(os.path.join(job_directory, "POSCAR"), directory)
+        names.append("POSCAR")
+    return {
+        name: copy_input(
+            os.path.join(job_directory, name),
+            os.path.join(directory, name),
+            strategies.get(name, strategies["default"]),
+        )
+        for name in names
+    }
+
+
+def copy_input(src: str, dst: str, strategy: str) -> str:
+    """Puts the file src at dst, which must not exist yet, using strategy
+
+    If strategy cannot be used here, ex hardlinking across filesystems or
+    reflinking on a filesystem without copy on write, the strategies after
+    it in COPY_FALLBACKS are tried
+
+    Args:
+        src: The file to copy
+        dst: Where to put it
+        strategy: One of COPY_FALLBACKS
+    Returns:
+        The strategy that was used
+    Raises:
+        ValueError: If strategy is not one of COPY_FALLBACKS
+        OSError: If not even copying the bytes worked
+    """
+    logger = logging.getLogger()
+    if strategy not in COPY_FALLBACKS:
+        raise ValueError(f"unknown copy strategy {strategy}")
+    for method in COPY_FALLBACKS[strategy]:
+        try:
+            COPY_METHODS[method](src, dst)
+            return method
+        except OSError as e:
+            if method == "copy":
+                raise
+            logger.debug(f"could not {method} {src} to {dst}: {e}")
+            if os.path.lexists(dst):
+                os.remove(dst)
+    raise AssertionError("every strategy ends with copy")
+
+
+def _reflink(src: str, dst: str) -> None:
+    """Makes dst a copy on write clone of src, sharing its blocks
+
+    Raises:
+        OSError: If the filesystem cannot clone files"""
+    with open(src, "rb") as source, open(dst, "wb") as destination:
+        fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+    shutil.copymode(src, dst)
+    _make_user_writable(dst)
+
+
+def _copy(src: str, dst: str) -> None:
+    """Copies the bytes of src to dst"""
+    shutil.copy(src, dst)
+    _make_user_writable(dst)
+
+
+def _hardlink(src: str, dst: str) -> None:
+    """Makes dst another name for src"""
+    os.link(src, dst)
+
+
+def _symlink(src: str, dst: str) -> None:
+    """Makes dst a relative symlink to src"""
+    os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+
+
+def _make_user_writable(path: str) -> None:
+    """Lets the owner write to path, as VASP writes over some of its inputs
+
+    Copies are the new job's own file, so they are writable even if the
+    file they were copied from was not"""
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+    os.chmod(path, mode | stat.S_IWUSR)
+
+
+COPY_METHODS: Dict[str, Callable[[str, str], None]] = {
+    "hardlink": _hardlink,
+    "symlink": _symlink,
+    "reflink": _reflink,
+    "copy": _copy,
+}
+# the strategies tried, in order, for each strategy
+COPY_FALLBACKS = {
+    "copy": ["copy"],
+    "reflink": ["reflink", "copy"],
+    "hardlink": ["hardlink", "reflink", "copy"],
+    "symlink": ["symlink", "reflink", "copy"],
+}
+
 
 # Create a self-consistent calculation to get WAVECAR for later use
 def create_wav(
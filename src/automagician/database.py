@@ -1,10 +1,190 @@
 import logging
 import os
 import sqlite3
-from typing import Dict, Optional
-
+import sys
+import urllib.parse
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import automagician.constants as constants
 import automagician.update_job as update_job
 from automagician.classes import DosJob, GoneJob, JobStatus, Machine, OptJob, WavJob
+from automagician.job_store import Job, JobStore
+from automagician.job_table import JobTable
+
+
+# The current schema of every table, in the order they are created
+TABLES = {
+    "opt_jobs": "(dir text not null, status int, home_machine int, last_on int, "
+    "id integer primary key)",
+    "dos_jobs": "(opt_id integer primary key references opt_jobs (id) "
+    "on delete cascade, sc_status int, dos_status int, sc_last_on int, "
+    "dos_last_on int)",
+    "wav_jobs": "(opt_id integer primary key references opt_jobs (id) "
+    "on delete cascade, wav_status int, wav_last_on int)",
+    "gone_jobs": "(dir text not null, status int, home_machine int, last_on int, "
+    "id integer primary key)",
+    "insta_submit": "(dir text, machine_name text)",
+}
+INDEXES = [
+    "create unique index if not exists opt_jobs_dir on opt_jobs (dir)",
+    "create index if not exists opt_jobs_status on opt_jobs (status)",
+    "create unique index if not exists gone_jobs_dir on gone_jobs (dir)",
+]
+
+
+def _migrate_to_1(db: sqlite3.Cursor) -> None:
+    """Adds primary keys, indexes, and foreign keys to the job tables
+
+    opt_jobs and gone_jobs get an id that keeps their old rowid, so the
+    opt_ids of dos_jobs and wav_jobs stay valid. dos_jobs and wav_jobs use
+    opt_id as their primary key.
+
+    Of duplicate opt_jobs and gone_jobs the first is kept, as that is the one
+    that was updated, and dos_jobs and wav_jobs that pointed at a removed
+    opt_job are pointed at the kept one. Of duplicate dos_jobs and wav_jobs
+    the last is kept, as that is the one that was loaded. dos_jobs and
+    wav_jobs without an opt_job are removed.
+    """
+    logger = logging.getLogger()
+    for table in ["dos_jobs", "wav_jobs"]:
+        db.execute(
+            f"update {table} set opt_id = (select min(kept.rowid) from "
+            "opt_jobs as kept join opt_jobs as removed on kept.dir = removed.dir "
+            f"where removed.rowid = {table}.opt_id) where opt_id in "
+            "(select rowid from opt_jobs)"
+        )
+    removed = 0
+    for table in ["opt_jobs", "gone_jobs"]:
+        db.execute(
+            f"delete from {table} where rowid not in "
+            f"(select min(rowid) from {table} group by dir)"
+        )
+        removed += db.rowcount
+    for table in ["dos_jobs", "wav_jobs"]:
+        db.execute(
+            f"delete from {table} where rowid not in "
+            f"(select max(rowid) from {table} group by opt_id) "
+            "or opt_id not in (select rowid from opt_jobs)"
+        )
+        removed += db.rowcount
+    if removed > 0:
+        logger.warning(f"removed {removed} duplicate or orphaned jobs from the database")
+
+    for table in ["opt_jobs", "gone_jobs"]:
+        db.execute(
+            f"create table {table}_new (dir text not null, status int, "
+            "home_machine int, last_on int, id integer primary key)"
+        )
+        db.execute(
+            f"insert into {table}_new (id, dir, status, home_machine, last_on) "
+            f"select rowid, dir, status, home_machine, last_on from {table}"
+        )
+        db.execute(f"drop table {table}")
+        db.execute(f"alter table {table}_new rename to {table}")
+    db.execute(
+        "create table dos_jobs_new (opt_id integer primary key references "
+        "opt_jobs (id) on delete cascade, sc_status int, dos_status int, "
+        "sc_last_on int, dos_last_on int)"
+    )
+    db.execute(
+        "insert into dos_jobs_new select opt_id, sc_status, dos_status, "
+        "sc_last_on, dos_last_on from dos_jobs"
+    )
+    db.execute(
+        "create table wav_jobs_new (opt_id integer primary key references "
+        "opt_jobs (id) on delete cascade, wav_status int, wav_last_on int)"
+    )
+    db.execute(
+        "insert into wav_jobs_new select opt_id, wav_status, wav_last_on "
+        "from wav_jobs"
+    )
+    for table in ["dos_jobs", "wav_jobs"]:
+        db.execute(f"drop table {table}")
+        db.execute(f"alter table {table}_new rename to {table}")
+    db.execute("create unique index opt_jobs_dir on opt_jobs (dir)")
+    db.execute("create index opt_jobs_status on opt_jobs (status)")
+    db.execute("create unique index gone_jobs_dir on gone_jobs (dir)")
+
+
+# Every migration, in order. A database with a user_version of n has had the
+# first n applied
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [_migrate_to_1]
+
+# The selects used to load jobs. The id of the opt_job is in every row, to page by
+OPT_JOB_SELECT = "select dir, status, home_machine, last_on, id from opt_jobs"
+DOS_JOB_SELECT = (
+    "select opt_jobs.dir, dos_jobs.opt_id, sc_status, dos_status, sc_last_on, "
+    "dos_last_on from dos_jobs join opt_jobs on opt_jobs.id = dos_jobs.opt_id"
+)
+WAV_JOB_SELECT = (
+    "select opt_jobs.dir, wav_jobs.opt_id, wav_status, wav_last_on from wav_jobs "
+    "join opt_jobs on opt_jobs.id = wav_jobs.opt_id"
+)
+
+JobT = TypeVar("JobT", bound=Job)
+
+
+def _opt_job_from_row(row: Tuple[Any, ...]) -> Tuple[str, OptJob]:
+    """Returns the directory and job of a row selected with OPT_JOB_SELECT
+
+    The directory is interned, so every copy of it held by the job
+    collections, queues, and caches is one string"""
+    return sys.intern(row[0]), OptJob(
+        status=JobStatus(row[1]),
+        home_machine=Machine(row[2]),
+        last_on=Machine(row[3]),
+        dirty=False,
+    )
+
+
+def _dos_job_from_row(row: Tuple[Any, ...]) -> Tuple[str, DosJob]:
+    """Returns the directory and job of a row selected with DOS_JOB_SELECT
+
+    The directory is interned, see _opt_job_from_row"""
+    return sys.intern(os.path.join(row[0], "dos")), DosJob(
+        opt_id=row[1],
+        sc_status=JobStatus(row[2]),
+        dos_status=JobStatus(row[3]),
+        sc_last_on=Machine(row[4]),
+        dos_last_on=Machine(row[5]),
+        dirty=False,
+    )
+
+
+def _wav_job_from_row(row: Tuple[Any, ...]) -> Tuple[str, WavJob]:
+    """Returns the directory and job of a row selected with WAV_JOB_SELECT
+
+    The directory is interned, see _opt_job_from_row"""
+    return sys.intern(os.path.join(row[0], "wav")), WavJob(
+        opt_id=row[1],
+        wav_status=JobStatus(row[2]),
+        wav_last_on=Machine(row[3]),
+        dirty=False,
+    )
+
+
+def _dirty_items(jobs: MutableMapping[str, JobT]) -> List[Tuple[str, JobT]]:
+    """Returns every job in jobs that is dirty, with its directory"""
+    if isinstance(jobs, (JobStore, JobTable)):
+        return jobs.dirty_items()
+    return [(job_dir, job) for job_dir, job in jobs.items() if job.dirty]
+
+
+class DatabaseVersionError(Exception):
+    """What happens if a database opened read only has not been migrated yet"""
+
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
 
 
 class Database:
@@ -17,50 +197,77 @@ class Database:
 
     db: sqlite3.Cursor
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, wal: bool = False, read_only: bool = False):
         """Created a database at path, adding the necessary tables
 
+        Databases made by older versions of automagician are migrated to the
+        current schema.
+
         Args:
           path: Where the database currently exists or should be placed
+          wal: If set, the database is switched to write ahead logging, so
+            readers are not blocked while a pass is writing, and commits do
+            not wait on a full sync. The database stays in this mode for
+            every later connection. Only use this if every automagician that
+            opens the database runs on the same host, as write ahead logging
+            does not work over network file systems shared between hosts
+          read_only: If set, the database is opened read only, and is not
+            created or migrated. Used for reports that should not wait on, or
+            block, a running automagician
+        Raises:
+          DatabaseVersionError: If read_only is set and the database has not
+            been migrated to the current schema
         """
+        logger = logging.getLogger()
+        if read_only:
+            self.db = sqlite3.connect(
+                f"file:{urllib.parse.quote(path)}?mode=ro", uri=True
+            ).cursor()
+            self.db.execute(f"pragma busy_timeout = {constants.DB_BUSY_TIMEOUT_MS}")
+            self.db.execute("pragma query_only = on")
+            version = self.db.execute("pragma user_version").fetchone()[0]
+            if version < len(MIGRATIONS):
+                self.db.connection.close()
+                raise DatabaseVersionError(
+                    f"{path} is at schema version {version}, but version "
+                    f"{len(MIGRATIONS)} is needed. Run automagician once "
+                    "without --report to migrate it"
+                )
+            return
         self.db = sqlite3.connect(path).cursor()
-        has_opt = False
-        has_dos = False
-        has_wav = False
-        has_gone = False
-        has_insta_submit = False
-        for table in self.db.execute(
+        if wal:
+            self.db.execute(f"pragma busy_timeout = {constants.DB_BUSY_TIMEOUT_MS}")
+            self.db.execute("pragma journal_mode = wal")
+            self.db.execute("pragma synchronous = normal")
+            self.db.execute(f"pragma mmap_size = {constants.DB_MMAP_SIZE}")
+        tables = {
+            table[0]
+            for table in self.db.execute(
                 "select name from sqlite_master where type='table'"
-        ):
-            if table[0] == "opt_jobs":
-                has_opt = True
-            elif table[0] == "dos_jobs":
-                has_dos = True
-            elif table[0] == "wav_jobs":
-                has_wav = True
-            elif table[0] == "gone_jobs":
-                has_gone = True
-            elif table[0] == "insta_submit":
-                has_insta_submit = True
-
-        if not has_opt:
-            self.db.execute(
-                "create table opt_jobs (dir text, status int, home_machine int, last_on int)"
-            )
-        if not has_dos:
-            self.db.execute(
-                "create table dos_jobs (opt_id int, sc_status int, dos_status int, sc_last_on int, dos_last_on int)"
-            )
-        if not has_wav:
-            self.db.execute(
-                "create table wav_jobs (opt_id int, wav_status int, wav_last_on int)"
-            )
-        if not has_gone:
-            self.db.execute(
-                "create table gone_jobs (dir text, status int, home_machine int, last_on int)"
             )
-        if not has_insta_submit:
-            self.db.execute("create table insta_submit (dir text, machine_name text)")
+        }
+        version = self.db.execute("pragma user_version").fetchone()[0]
+        if len(tables & TABLES.keys()) == 0:
+            # Nothing to migrate
+            version = len(MIGRATIONS)
+            self.db.execute(f"pragma user_version = {version}")
+        for table, schema in TABLES.items():
+            if table not in tables:
+                self.db.execute(f"create table {table} {schema}")
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info(f"migrating {path} to version {number}")
+            self.db.execute("begin")
+            try:
+                migration(self.db)
+                self.db.execute(f"pragma user_version = {number}")
+                self.db.connection.commit()
+            except Exception:
+                self.db.connection.rollback()
+                raise
+        for index in INDEXES:
+            self.db.execute(index)
+        self.db.connection.commit()
+        self.db.execute("pragma foreign_keys = on")
 
     def get_string_from_db(self, cmd: str) -> str:
         """Executes the command and returns the first result of the query as a string
@@ -100,14 +307,7 @@ class Database:
         Returns:
             A dictionary where the keys are the job directoties, and the values
             are the opt jobs associated with said job directory"""
-        opt_jobs = {}
-        for job in self.db.execute("select * from opt_jobs"):
-            opt_jobs[job[0]] = OptJob(
-                status=JobStatus(job[1]),
-                home_machine=Machine(job[2]),
-                last_on=Machine(job[3]),
-            )
-        return opt_jobs
+        return dict(_opt_job_from_row(row) for row in self.db.execute(OPT_JOB_SELECT))
 
     def get_dos_jobs(self) -> Dict[str, DosJob]:
         """Returns the dos_jobs in this database.
@@ -115,21 +315,7 @@ class Database:
         Returns:
             A dictionary where the keys are the job directoties, and the values
             are the dos jobs associated with said job directory"""
-        dos_jobs = {}
-        for job in self.db.execute("select * from dos_jobs").fetchall():
-            opt_id = job[0]
-            opt_dir = self.get_string_from_db(
-                "select dir from opt_jobs where rowid = " + str(opt_id)
-            )
-            dos_dir = os.path.join(opt_dir, "dos")
-            dos_jobs[dos_dir] = DosJob(
-                opt_id=job[0],
-                sc_status=JobStatus(job[1]),
-                dos_status=JobStatus(job[2]),
-                sc_last_on=Machine(job[3]),
-                dos_last_on=Machine(job[4]),
-            )
-        return dos_jobs
+        return dict(_dos_job_from_row(row) for row in self.db.execute(DOS_JOB_SELECT))
 
     def get_wav_jobs(self) -> Dict[str, WavJob]:
         """Returns the wav_jobs in this database.
@@ -137,17 +323,162 @@ class Database:
         Returns:
             A dictionary where the keys are the job directoties, and the values
             are the wav jobs associated with said job directory"""
-        wav_jobs = {}
-        for job in self.db.execute("select * from wav_jobs").fetchall():
-            opt_id = job[0]
-            opt_dir = self.get_string_from_db(
-                "select dir from opt_jobs where rowid = " + str(opt_id)
-            )
-            wav_dir = os.path.join(opt_dir, "wav")
-            wav_jobs[wav_dir] = WavJob(
-                opt_id=job[0], wav_status=JobStatus(job[1]), wav_last_on=Machine(job[2])
-            )
-        return wav_jobs
+        return dict(_wav_job_from_row(row) for row in self.db.execute(WAV_JOB_SELECT))
+
+    def get_opt_job(self, job_dir: str) -> Optional[OptJob]:
+        """Returns the opt_job at job_dir, or None if there is not one"""
+        row = self.db.execute(OPT_JOB_SELECT + " where dir = ?", (job_dir,)).fetchone()
+        return None if row is None else _opt_job_from_row(row)[1]
+
+    def get_dos_job(self, job_dir: str) -> Optional[DosJob]:
+        """Returns the dos_job keyed by job_dir, or None if there is not one
+
+        Args:
+            job_dir: The directory of the dos job, as it is keyed in get_dos_jobs"""
+        if os.path.basename(job_dir) != "dos":
+            return None
+        row = self.db.execute(
+            DOS_JOB_SELECT + " where opt_jobs.dir = ?", (os.path.dirname(job_dir),)
+        ).fetchone()
+        return None if row is None else _dos_job_from_row(row)[1]
+
+    def get_wav_job(self, job_dir: str) -> Optional[WavJob]:
+        """Returns the wav_job keyed by job_dir, or None if there is not one
+
+        Args:
+            job_dir: The directory of the wav job, as it is keyed in get_wav_jobs"""
+        if os.path.basename(job_dir) != "wav":
+            return None
+        row = self.db.execute(
+            WAV_JOB_SELECT + " where opt_jobs.dir = ?", (os.path.dirname(job_dir),)
+        ).fetchone()
+        return None if row is None else _wav_job_from_row(row)[1]
+
+    def iter_opt_jobs(
+            self,
+            status: Optional[JobStatus] = None,
+            page_size: int = constants.JOB_PAGE_SIZE,
+    ) -> Iterator[Tuple[str, OptJob]]:
+        """Yields the opt_jobs in this database, reading page_size of them at a time
+
+        Args:
+            status: If set only jobs with this status are yielded
+            page_size: How many jobs to read from the database at a time
+        Yields:
+            The directory of each job, and the job"""
+        return self._iter_pages(
+            OPT_JOB_SELECT,
+            "opt_jobs.id",
+            4,
+            _opt_job_from_row,
+            page_size,
+            "" if status is None else f"status = {int(status)} and ",
+        )
+
+    def iter_dos_jobs(
+            self, page_size: int = constants.JOB_PAGE_SIZE
+    ) -> Iterator[Tuple[str, DosJob]]:
+        """Yields the dos_jobs in this database, reading page_size of them at a time
+
+        Args:
+            page_size: How many jobs to read from the database at a time
+        Yields:
+            The directory of each job, and the job"""
+        return self._iter_pages(
+            DOS_JOB_SELECT, "dos_jobs.opt_id", 1, _dos_job_from_row, page_size
+        )
+
+    def iter_wav_jobs(
+            self, page_size: int = constants.JOB_PAGE_SIZE
+    ) -> Iterator[Tuple[str, WavJob]]:
+        """Yields the wav_jobs in this database, reading page_size of them at a time
+
+        Args:
+            page_size: How many jobs to read from the database at a time
+        Yields:
+            The directory of each job, and the job"""
+        return self._iter_pages(
+            WAV_JOB_SELECT, "wav_jobs.opt_id", 1, _wav_job_from_row, page_size
+        )
+
+    def _iter_pages(
+            self,
+            select: str,
+            id_column: str,
+            id_index: int,
+            from_row: Callable[[Tuple[Any, ...]], Tuple[str, JobT]],
+            page_size: int,
+            condition: str = "",
+    ) -> Iterator[Tuple[str, JobT]]:
+        """Yields the jobs a select finds, a page at a time in order of id
+
+        Each page is fetched whole before it is yielded, so the database can be
+        used while iterating.
+
+        Args:
+            select: The select used to load the jobs
+            id_column: The column of the opt_job id, which is paged by
+            id_index: Where the opt_job id is in each row
+            from_row: Turns a row into a job and its directory
+            page_size: How many jobs to read from the database at a time
+            condition: Extra conditions on the jobs, each followed by "and"
+        """
+        last_id = -1
+        while True:
+            rows = self.db.execute(
+                f"{select} where {condition}{id_column} > ? "
+                f"order by {id_column} limit ?",
+                (last_id, page_size),
+            ).fetchall()
+            for row in rows:
+                yield from_row(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][id_index]
+
+    def count_jobs(self, table: str, status: Optional[JobStatus] = None) -> int:
+        """Returns how many jobs are in table
+
+        Args:
+            table: One of opt_jobs, dos_jobs, wav_jobs, or gone_jobs
+            status: If set only opt_jobs or gone_jobs with this status are counted"""
+        condition = "" if status is None else f" where status = {int(status)}"
+        return int(
+            self.db.execute(f"select count(*) from {table}{condition}").fetchone()[0]
+        )
+
+    def get_opt_job_store(
+            self, capacity: int = constants.JOB_CACHE_SIZE
+    ) -> JobStore[OptJob]:
+        """Returns the opt_jobs in this database as a JobStore, which loads them as they are used"""
+        return JobStore(
+            self.get_opt_job,
+            self.iter_opt_jobs,
+            lambda: self.count_jobs("opt_jobs"),
+            capacity,
+        )
+
+    def get_dos_job_store(
+            self, capacity: int = constants.JOB_CACHE_SIZE
+    ) -> JobStore[DosJob]:
+        """Returns the dos_jobs in this database as a JobStore, which loads them as they are used"""
+        return JobStore(
+            self.get_dos_job,
+            self.iter_dos_jobs,
+            lambda: self.count_jobs("dos_jobs"),
+            capacity,
+        )
+
+    def get_wav_job_store(
+            self, capacity: int = constants.JOB_CACHE_SIZE
+    ) -> JobStore[WavJob]:
+        """Returns the wav_jobs in this database as a JobStore, which loads them as they are used"""
+        return JobStore(
+            self.get_wav_job,
+            self.iter_wav_jobs,
+            lambda: self.count_jobs("wav_jobs"),
+            capacity,
+        )
 
     def get_gone_jobs(self) -> Dict[str, GoneJob]:
         """Returns the wav_jobs in this database.
@@ -156,9 +487,12 @@ class Database:
             A dictionary where the keys are the job directories, and the values
             are the gone jobs associated with said job directory"""
         gone_jobs: Dict[str, GoneJob] = {}
-        for job in self.db.execute("select * from gone_jobs"):
-            gone_jobs[job[0]] = GoneJob(
-                old_dir=job[0],
+        for job in self.db.execute(
+                "select dir, status, home_machine, last_on from gone_jobs"
+        ):
+            old_dir = sys.intern(job[0])
+            gone_jobs[old_dir] = GoneJob(
+                old_dir=old_dir,
                 status=JobStatus(job[1]),
                 home_machine=Machine(job[2]),
                 last_on=Machine(job[3]),
@@ -167,45 +501,108 @@ class Database:
 
     def write_job_statuses(
             self,
-            opt_jobs: Dict[str, OptJob],
-            dos_jobs: Dict[str, DosJob],
-            wav_jobs: Dict[str, WavJob],
+            opt_jobs: MutableMapping[str, OptJob],
+            dos_jobs: MutableMapping[str, DosJob],
+            wav_jobs: MutableMapping[str, WavJob],
     ) -> None:
         """Updates the database to include the jobs in opt_jobs, dos_jobs, and wav_jobs
 
         If a job exists in the database, but is not present here that job is not touched
 
+        Only jobs that are dirty are written, and they are no longer dirty
+        once written.
+
         Args:
             opt_jobs: A collection of every opt_job known.
             dos_jobs: A collection of every dos_job known.
             wav_jobs: A collection of every wav_job known.
         """
         logger = logging.getLogger()
-        for job_dir in opt_jobs:
-            self.add_opt_job_to_db(opt_jobs[job_dir], job_dir, commit=False)
+        dirty_opt_jobs = _dirty_items(opt_jobs)
+        self.db.executemany(
+            "insert into opt_jobs (dir, status, home_machine, last_on) "
+            "values (?, ?, ?, ?) on conflict (dir) do update set "
+            "status = excluded.status, home_machine = excluded.home_machine, "
+            "last_on = excluded.last_on",
+            (
+                (job_dir, job.status.value, job.home_machine.value, job.last_on.value)
+                for job_dir, job in dirty_opt_jobs
+            ),
+        )
 
-        for job_dir in dos_jobs:
-            opt_dir = update_job.get_opt_dir(job_dir)
-            try:
-                self.add_dos_job_to_db(dos_jobs[job_dir], opt_dir, commit=False)
-            except ValueError:
-                logger.warning(
-                    f"no opt job at directory {opt_dir}. Expected as was adding a dos_job"
+        opt_ids: Optional[Dict[str, int]] = None
+        written_dos_jobs = []
+        dos_rows = []
+        for job_dir, dos_job in _dirty_items(dos_jobs):
+            if dos_job.opt_id == -1:
+                if opt_ids is None:
+                    opt_ids = self._get_opt_ids()
+                opt_dir = update_job.get_opt_dir(job_dir)
+                if opt_dir not in opt_ids:
+                    logger.warning(
+                        f"no opt job at directory {opt_dir}. Expected as was adding a dos_job"
+                    )
+                    continue
+                dos_job.opt_id = opt_ids[opt_dir]
+            written_dos_jobs.append(dos_job)
+            dos_rows.append(
+                (
+                    dos_job.opt_id,
+                    dos_job.sc_status.value,
+                    dos_job.dos_status.value,
+                    dos_job.sc_last_on.value,
+                    dos_job.dos_last_on.value,
                 )
-                continue
+            )
+        self.db.executemany(
+            "insert into dos_jobs (opt_id, sc_status, dos_status, sc_last_on, "
+            "dos_last_on) values (?, ?, ?, ?, ?) on conflict (opt_id) do update set "
+            "sc_status = excluded.sc_status, dos_status = excluded.dos_status, "
+            "sc_last_on = excluded.sc_last_on, dos_last_on = excluded.dos_last_on",
+            dos_rows,
+        )
 
-        for job_dir in wav_jobs:
-            opt_dir = update_job.get_opt_dir(job_dir)
-            try:
-                self.add_wav_job_to_db(wav_jobs[job_dir], opt_dir, commit=False)
-            except ValueError:
-                logger.warning(
-                    f"no opt job at directory {opt_dir}. Expected as was adding a wav_job"
-                )
-                continue
+        written_wav_jobs = []
+        wav_rows = []
+        for job_dir, wav_job in _dirty_items(wav_jobs):
+            if wav_job.opt_id == -1:
+                if opt_ids is None:
+                    opt_ids = self._get_opt_ids()
+                opt_dir = update_job.get_opt_dir(job_dir)
+                if opt_dir not in opt_ids:
+                    logger.warning(
+                        f"no opt job at directory {opt_dir}. Expected as was adding a wav_job"
+                    )
+                    continue
+                wav_job.opt_id = opt_ids[opt_dir]
+            written_wav_jobs.append(wav_job)
+            wav_rows.append(
+                (wav_job.opt_id, wav_job.wav_status.value, wav_job.wav_last_on.value)
+            )
+        self.db.executemany(
+            "insert into wav_jobs (opt_id, wav_status, wav_last_on) values (?, ?, ?) "
+            "on conflict (opt_id) do update set wav_status = excluded.wav_status, "
+            "wav_last_on = excluded.wav_last_on",
+            wav_rows,
+        )
 
         self.db.connection.commit()
-        logger.info("automagician.db updated")
+        for _, job in dirty_opt_jobs:
+            job.dirty = False
+        for dos_job in written_dos_jobs:
+            dos_job.dirty = False
+        for wav_job in written_wav_jobs:
+            wav_job.dirty = False
+        logger.info(
+            f"automagician.db updated, {len(dirty_opt_jobs)} opt jobs, "
+            f"{len(dos_rows)} dos jobs, and {len(wav_rows)} wav jobs written"
+        )
+
+    def _get_opt_ids(self) -> Dict[str, int]:
+        """Returns the rowid of every opt_job, keyed by directory"""
+        return {
+            row[0]: row[1] for row in self.db.execute("select dir, rowid from opt_jobs")
+        }
 
     def add_opt_job_to_db(
             self, job_to_add: OptJob, opt_dir: str, commit: bool = True
@@ -237,7 +634,8 @@ class Database:
             )
         else:
             self.db.execute(
-                "insert into opt_jobs values (?, ?, ?, ?)",
+                "insert into opt_jobs (dir, status, home_machine, last_on) "
+                "values (?, ?, ?, ?)",
                 [
                     opt_dir,
                     job_to_add.status.value,
@@ -293,7 +691,7 @@ class Database:
             )
         else:
             dos_id = self.db.execute(
-                "SELECT rowid from dos_jobs WHERE rowid = ?", [job_to_add.opt_id]
+                "SELECT rowid from dos_jobs WHERE opt_id = ?", [job_to_add.opt_id]
             ).fetchone()
             if dos_id is not None:
                 self.db.execute(
@@ -362,7 +760,7 @@ class Database:
             )
         else:
             wav_id = self.db.execute(
-                "SELECT rowid from wav_jobs WHERE rowid = ?", [job_to_add.opt_id]
+                "SELECT rowid from wav_jobs WHERE opt_id = ?", [job_to_add.opt_id]
             ).fetchone()
             if wav_id is not None:
                 self.db.execute(
@@ -411,7 +809,8 @@ class Database:
             )
         else:
             self.db.execute(
-                "insert into gone_jobs values (?, ?, ?, ?)",
+                "insert into gone_jobs (dir, status, home_machine, last_on) "
+                "values (?, ?, ?, ?)",
                 [
                     job_to_add.old_dir,
                     job_to_add.status.value,
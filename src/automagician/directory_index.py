@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional
+
+import automagician.constants as constants
+from automagician.classes import DirectoryIndexEntry, DirectoryScan
+
+
+class DirectoryIndex:
+    """A record of every directory seen while registering, kept between runs
+
+    A directory's entry stays valid for as long as the mtime and ctime of the
+    directory, and of its automagic_note if it has one, are unchanged. Adding,
+    removing, or renaming anything in a directory changes its mtime, so a
+    valid entry can be used in place of listing the directory again.
+
+    Timestamps only have the granularity of the filesystem, so a directory
+    changed just after it was scanned can keep the mtime and ctime that were
+    recorded. Like git's racy index check, a directory or automagic_note whose
+    mtime or ctime is within racy_window_ns of the index being opened is not
+    recorded, and is listed again next time.
+
+    Attributes:
+        db: a sqlite3.Cursor object that points to the index. It has the
+            table directories.
+        entries: Every entry in the index, keyed by directory
+        opened_ns: When the index was opened, just before scanning starts
+        racy_window_ns: How close to opened_ns a timestamp has to be for the
+            directory it belongs to not to be recorded
+    """
+
+    db: sqlite3.Cursor
+    entries: Dict[str, DirectoryIndexEntry]
+    opened_ns: int
+    racy_window_ns: int
+
+    def __init__(
+            self, path: str, racy_window_ns: int = constants.DIRECTORY_INDEX_RACY_NS
+    ):
+        """Opens the index at path, creating it if it does not exist
+
+        Args:
+          path: Where the index currently exists or should be placed
+          racy_window_ns: The granularity of filesystem timestamps, see
+            DIRECTORY_INDEX_RACY_NS
+        """
+        self.opened_ns = time.time_ns()
+        self.racy_window_ns = racy_window_ns
+        self.db = sqlite3.connect(path).cursor()
+        self.db.execute(
+            "create table if not exists directories (dir text primary key, "
+            "subfile text, mtime_ns int, ctime_ns int, note_mtime_ns int, "
+            "note_ctime_ns int, has_opt int, is_neb int, has_dos int, "
+            "has_wav int, exclude int, subdirs text)"
+        )
+        self.entries = {}
+        self._changed: Dict[str, DirectoryIndexEntry] = {}
+        self._removed: set[str] = set()
+        for row in self.db.execute("select * from directories"):
+            self.entries[row[0]] = DirectoryIndexEntry(
+                scan=DirectoryScan(
+                    path=row[0],
+                    subdirs=json.loads(row[11]),
+                    has_opt=bool(row[6]),
+                    is_neb=bool(row[7]),
+                    has_dos=bool(row[8]),
+                    has_wav=bool(row[9]),
+                    exclude=bool(row[10]),
+                ),
+                subfile=row[1],
+                mtime_ns=row[2],
+                ctime_ns=row[3],
+                note_mtime_ns=row[4],
+                note_ctime_ns=row[5],
+            )
+
+    def lookup(
+            self, job_dir: str, subfile: str, dir_stat: os.stat_result
+    ) -> Optional[DirectoryScan]:
+        """Returns the recorded scan of job_dir if it is still valid
+
+        Args:
+            job_dir: The directory to look up
+            subfile: The name of the subfile for the current machine. Entries
+                recorded with a different subfile are not valid.
+            dir_stat: The result of os.stat on job_dir
+        Returns:
+            The recorded scan, or None if there is no entry for job_dir, or
+            if anything about job_dir changed since the entry was recorded
+        """
+        entry = self.entries.get(job_dir)
+        if entry is None:
+            return None
+        if (
+                entry.subfile != subfile
+                or entry.mtime_ns != dir_stat.st_mtime_ns
+                or entry.ctime_ns != dir_stat.st_ctime_ns
+        ):
+            return None
+        if entry.note_mtime_ns != -1:
+            note_stat = stat_or_none(os.path.join(job_dir, "automagic_note"))
+            if (
+                    note_stat is None
+                    or entry.note_mtime_ns != note_stat.st_mtime_ns
+                    or entry.note_ctime_ns != note_stat.st_ctime_ns
+            ):
+                return None
+        return entry.scan
+
+    def record(
+            self,
+            scan: DirectoryScan,
+            subfile: str,
+            dir_stat: os.stat_result,
+            note_stat: Optional[os.stat_result],
+    ) -> None:
+        """Records a fresh scan of a directory. Written out by save
+
+        If the directory or its automagic_note changed too close to the index
+        being opened to be told apart from a later change, the scan is not
+        recorded and any older entry for the directory is dropped
+
+        Args:
+            scan: The scan of the directory
+            subfile: The name of the subfile the scan was made with
+            dir_stat: The result of os.stat on the directory, taken before
+                listing it
+            note_stat: The result of os.stat on the automagic_note in the
+                directory, or None if there is not one
+        """
+        if self._is_racy(dir_stat) or (
+                note_stat is not None and self._is_racy(note_stat)
+        ):
+            self.entries.pop(scan.path, None)
+            self._changed.pop(scan.path, None)
+            self._removed.add(scan.path)
+            return
+        entry = DirectoryIndexEntry(
+            scan=scan,
+            subfile=subfile,
+            mtime_ns=dir_stat.st_mtime_ns,
+            ctime_ns=dir_stat.st_ctime_ns,
+            note_mtime_ns=-1 if note_stat is None else note_stat.st_mtime_ns,
+            note_ctime_ns=-1 if note_stat is None else note_stat.st_ctime_ns,
+        )
+        self.entries[scan.path] = entry
+        self._changed[scan.path] = entry
+        self._removed.discard(scan.path)
+
+    def _is_racy(self, path_stat: os.stat_result) -> bool:
+        """Returns if path_stat changed within racy_window_ns of opened_ns"""
+        cutoff = self.opened_ns - self.racy_window_ns
+        return path_stat.st_mtime_ns >= cutoff or path_stat.st_ctime_ns >= cutoff
+
+    def forget_missing(self, root: str, seen: Iterable[str]) -> None:
+        """Forgets every directory under root that was not seen in the last walk
+
+        Args:
+            root: The directory that was walked
+            seen: Every directory that was visited while walking root
+        """
+        seen_set = set(seen)
+        prefix = os.path.join(root, "")
+        for job_dir in list(self.entries):
+            if job_dir in seen_set:
+                continue
+            if job_dir == root or job_dir.startswith(prefix):
+                del self.entries[job_dir]
+                self._changed.pop(job_dir, None)
+                self._removed.add(job_dir)
+
+    def save(self) -> None:
+        """Writes every change made since the index was opened or last saved"""
+        logger = logging.getLogger()
+        self.db.executemany(
+            "insert or replace into directories values "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    job_dir,
+                    entry.subfile,
+                    entry.mtime_ns,
+                    entry.ctime_ns,
+                    entry.note_mtime_ns,
+                    entry.note_ctime_ns,
+                    int(entry.scan.has_opt),
+                    int(entry.scan.is_neb),
+                    int(entry.scan.has_dos),
+                    int(entry.scan.has_wav),
+                    int(entry.scan.exclude),
+                    json.dumps(entry.scan.subdirs),
+                )
+                for job_dir, entry in self._changed.items()
+            ),
+        )
+        self.db.executemany(
+            "delete from directories where dir = ?",
+            ((job_dir,) for job_dir in self._removed),
+        )
+        self.db.connection.commit()
+        logger.debug(
+            f"directory index saved, {len(self._changed)} updated, "
+            f"{len(self._removed)} removed"
+        )
+        self._changed = {}
+        self._removed = set()
+
+    def close(self) -> None:
+        """Closes the connection to the index"""
+        self.db.connection.close()
+
+
+def stat_or_none(path: str) -> Optional[os.stat_result]:
+    """Returns os.stat of path, or None if it can not be stat-ed"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
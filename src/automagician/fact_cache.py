@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Tuple
+
+from automagician.classes import JobFact
+
+
+class FactCache:
+    """Facts derived from job files, kept between runs
+
+    A fact is anything worked out by reading a single file, like if an INCAR
+    sets ISIF = 3, or what a ll_out reported. A fact stays valid for as long as
+    the size and mtime of the file it was read from are unchanged, so files
+    that have not changed since the last run do not need to be read again.
+
+    Attributes:
+        db: a sqlite3.Cursor object that points to the database holding the
+            cache. It has the table job_facts.
+        facts: Every fact in the cache, keyed by (path, kind)
+    """
+
+    db: sqlite3.Cursor
+    facts: Dict[Tuple[str, str], JobFact]
+
+    def __init__(self, db: sqlite3.Cursor):
+        """Loads the cache, creating the job_facts table if it does not exist
+
+        Args:
+          db: A cursor to the database the cache should be kept in
+        """
+        self.db = db
+        self.db.execute(
+            "create table if not exists job_facts (path text, kind text, "
+            "size int, mtime_ns int, value text, primary key (path, kind))"
+        )
+        self.facts = {}
+        self._changed: Dict[Tuple[str, str], JobFact] = {}
+        for row in self.db.execute("select * from job_facts"):
+            self.facts[(row[0], row[1])] = JobFact(
+                size=row[2], mtime_ns=row[3], value=json.loads(row[4])
+            )
+
+    def get(self, path: str, kind: str, compute: Callable[[], Any]) -> Any:
+        """Returns the fact of the given kind about path, computing it if needed
+
+        Args:
+            path: The file the fact is derived from
+            kind: What fact this is, ex "isif3"
+            compute: Works out the fact by reading path. Must return something
+                that can be stored as json. Only called if there is no valid
+                fact recorded
+        Returns:
+            The recorded fact if path has not changed since it was recorded,
+            otherwise what compute returns. If path can not be stat-ed,
+            compute is always called and nothing is recorded
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return compute()
+        key = (path, kind)
+        fact = self.facts.get(key)
+        if (
+                fact is not None
+                and fact.size == stat.st_size
+                and fact.mtime_ns == stat.st_mtime_ns
+        ):
+            return fact.value
+        value = compute()
+        fact = JobFact(size=stat.st_size, mtime_ns=stat.st_mtime_ns, value=value)
+        self.facts[key] = fact
+        self._changed[key] = fact
+        return value
+
+    def save(self) -> None:
+        """Writes every fact recorded since the cache was loaded or last saved"""
+        logger = logging.getLogger()
+        self.db.executemany(
+            "insert or replace into job_facts values (?, ?, ?, ?, ?)",
+            (
+                (path, kind, fact.size, fact.mtime_ns, json.dumps(fact.value))
+                for (path, kind), fact in self._changed.items()
+            ),
+        )
+        self.db.connection.commit()
+        logger.debug(f"fact cache saved, {len(self._changed)} updated")
+        self._changed = {}
@@ -1,11 +1,20 @@
+import dataclasses
+import gzip
+import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import time
+from typing import IO, BinaryIO, List, Optional
 
 import automagician.constants as constants
+import automagician.output_scan as output_scan
 import automagician.update_job as update_job
+from automagician.classes import CombinedRun, CombineState
+
+RUN_DIRECTORY_REGEX = re.compile(r"run(\d+)$")
 
 
 def wrap_up(job_directory: str) -> None:
@@ -58,7 +67,10 @@ def wrap_up(job_directory: str) -> None:
             stderr=subprocess.STDOUT,
         )
         shutil.move("ll_out", largest_run)
-        logger.warning("combine_XDAT_FE disabled due to bugs")
+    try:
+        combine_XDAT_FE(job_directory)
+    except OSError as e:
+        logger.warning(f"could not combine runs in {job_directory}: {e}")
     update_job.optimizer_review(job_directory)
     os.chdir(cwd)
 
@@ -138,3 +150,174 @@ def wav_is_complete(wav_dir: str) -> bool:
     last_modified = os.path.getmtime(os.path.join(wav_dir, "WAVECAR"))
     current_time = time.time()
     return current_time - last_modified > 120  # write stopped more than two minutes ago
+
+
+def combine_XDAT_FE(job_directory: str, rebuild: bool = False) -> CombineState:
+    """Adds the XDATCAR and fe.dat of every run in job_directory to cmbXDATCAR and cmbFE.dat
+
+    Runs are combined in order, run0, run1, ... Only what was not combined the
+    last time this was called is read, using the offsets kept in
+    CMB_STATE_NAME. The header and first configuration of every XDATCAR but
+    the first are skipped. Each line of cmbFE.dat is the line's number in
+    cmbFE.dat followed by the line of the run's fe.dat. A run without a fe.dat
+    has one made from its OUTCAR. XDATCAR.gz and OUTCAR.gz are read if there
+    is no XDATCAR or OUTCAR.
+
+    Args:
+        job_directory: The job directory with the run directories
+        rebuild: If True, cmbXDATCAR and cmbFE.dat are written again from the
+            start. They are also written again if either of them, or the
+            state, is missing
+    Returns:
+        What has been combined. If job_directory has no runs, and nothing
+        was combined before, nothing is written
+    """
+    logger = logging.getLogger()
+    xdatcar_path = os.path.join(job_directory, constants.CMB_XDATCAR_NAME)
+    fe_path = os.path.join(job_directory, constants.CMB_FE_NAME)
+    state = None if rebuild else read_combine_state(job_directory)
+    if state is not None and not (
+            os.path.exists(xdatcar_path) and os.path.exists(fe_path)
+    ):
+        state = None
+    runs = get_run_directories(job_directory)
+    if state is None:
+        state = CombineState(runs={}, line_count=0, step=0, force=0.0, energy=0.0)
+        if len(runs) == 0 and not rebuild:
+            return state
+        mode = "wb"
+    else:
+        mode = "ab"
+    logger.debug(f"combining {len(runs)} runs in {job_directory}")
+    with open(xdatcar_path, mode) as cmb_xdatcar, open(fe_path, mode) as cmb_fe:
+        for run in runs:
+            run_dir = os.path.join(job_directory, run)
+            combined = state.runs.get(run)
+            if combined is None:
+                combined = CombinedRun(
+                    xdatcar_offset=0,
+                    xdatcar_started=len(state.runs) == 0,
+                    fe_offset=0,
+                )
+                state.runs[run] = combined
+            _append_xdatcar(run_dir, combined, cmb_xdatcar)
+            _append_fe(run_dir, combined, state, cmb_fe)
+    state_path = os.path.join(job_directory, constants.CMB_STATE_NAME)
+    with open(state_path + ".tmp", "w") as state_file:
+        json.dump(dataclasses.asdict(state), state_file)
+    os.replace(state_path + ".tmp", state_path)
+    return state
+
+
+def read_combine_state(job_directory: str) -> Optional[CombineState]:
+    """Returns what combine_XDAT_FE has combined for job_directory
+
+    Returns:
+        The state, or None if it is missing or can not be read
+    """
+    try:
+        with open(os.path.join(job_directory, constants.CMB_STATE_NAME), "r") as f:
+            data = json.load(f)
+        data["runs"] = {
+            run: CombinedRun(**combined) for run, combined in data["runs"].items()
+        }
+        return CombineState(**data)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def get_run_directories(job_directory: str) -> List[str]:
+    """Returns the names of the run directories in job_directory, in numeric order"""
+    runs = []
+    for entry in os.scandir(job_directory):
+        run_match = RUN_DIRECTORY_REGEX.match(entry.name)
+        if run_match is not None and entry.is_dir():
+            runs.append((int(run_match.group(1)), entry.name))
+    return [name for _, name in sorted(runs)]
+
+
+def _open_binary_or_gzip(path: str) -> Optional[BinaryIO]:
+    """Opens path for reading, or path + ".gz" if path does not exist
+
+    Returns:
+        The opened file, or None if neither exists
+    """
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        pass
+    try:
+        return gzip.open(path + ".gz", "rb")  # type: ignore
+    except FileNotFoundError:
+        return None
+
+
+def _is_second_configuration(line: bytes) -> bool:
+    """Returns if line starts the second configuration of an XDATCAR"""
+    fields = line.split()
+    if len(fields) == 0 or fields[-1] != b"2":
+        return False
+    return b"configuration=" in line or b"Konfig=" in line
+
+
+def _append_xdatcar(
+        run_dir: str, combined: CombinedRun, cmb_xdatcar: IO[bytes]
+) -> None:
+    """Appends the uncombined part of the XDATCAR in run_dir to cmb_xdatcar
+
+    Only whole lines are appended. combined is updated with what was read
+    """
+    xdatcar = _open_binary_or_gzip(os.path.join(run_dir, "XDATCAR"))
+    if xdatcar is None:
+        return
+    with xdatcar:
+        xdatcar.seek(combined.xdatcar_offset)
+        if not combined.xdatcar_started:
+            for line in xdatcar:
+                if not line.endswith(b"\n"):
+                    return
+                combined.xdatcar_offset += len(line)
+                if _is_second_configuration(line):
+                    combined.xdatcar_started = True
+                    cmb_xdatcar.write(line)
+                    break
+        pending = b""
+        while True:
+            chunk = xdatcar.read(constants.COMBINE_CHUNK_SIZE)
+            if not chunk:
+                return
+            chunk = pending + chunk
+            end = chunk.rfind(b"\n") + 1
+            cmb_xdatcar.write(chunk[:end])
+            combined.xdatcar_offset += end
+            pending = chunk[end:]
+
+
+def _append_fe(
+        run_dir: str, combined: CombinedRun, state: CombineState, cmb_fe: IO[bytes]
+) -> None:
+    """Appends the uncombined lines of the fe.dat in run_dir to cmb_fe
+
+    combined and state are updated with what was read
+    """
+    fe_dat_path = os.path.join(run_dir, "fe.dat")
+    if not os.path.exists(fe_dat_path):
+        outcar_path = os.path.join(run_dir, "OUTCAR")
+        if not (os.path.exists(outcar_path) or os.path.exists(outcar_path + ".gz")):
+            return
+        output_scan.write_fe_dat(run_dir)
+    with open(fe_dat_path, "rb") as fe_dat:
+        fe_dat.seek(combined.fe_offset)
+        for line in fe_dat:
+            if not line.endswith(b"\n"):
+                return
+            combined.fe_offset += len(line)
+            cmb_fe.write(f"{state.line_count}  ".encode() + line)
+            fields = line.split()
+            try:
+                state.step = state.line_count
+                state.force = float(fields[1])
+                state.energy = float(fields[2])
+            except (IndexError, ValueError):
+                pass
+            state.line_count += 1
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from typing import (
+    Callable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import automagician.constants as constants
+
+
+class Job(Protocol):
+    dirty: bool
+
+
+JobT = TypeVar("JobT", bound=Job)
+
+
+class JobStore(MutableMapping[str, JobT]):
+    """A dict like collection of jobs that loads jobs from the database as they are used
+
+    Only the jobs that were looked up recently are held in memory, up to
+    capacity of them. Jobs that are dirty are never dropped, so every change
+    is still there when the jobs are written back with
+    Database.write_job_statuses. Iterating goes through the database a page
+    at a time, so it also does not hold every job in memory at once.
+
+    Attributes:
+        capacity: How many clean jobs to keep in memory
+    """
+
+    capacity: int
+
+    def __init__(
+            self,
+            load: Callable[[str], Optional[JobT]],
+            iterate: Callable[[], Iterator[Tuple[str, JobT]]],
+            count: Callable[[], int],
+            capacity: int = constants.JOB_CACHE_SIZE,
+    ):
+        """Creates a store that has not loaded any jobs yet
+
+        Args:
+            load: Returns the job at a directory from the database, or None if
+                there is not one
+            iterate: Yields every job in the database with its directory
+            count: Returns how many jobs are in the database
+            capacity: How many clean jobs to keep in memory
+        """
+        self.capacity = capacity
+        self._load = load
+        self._iterate = iterate
+        self._count = count
+        self._cache: OrderedDict[str, JobT] = OrderedDict()
+        # Jobs that were not in the database when they were set
+        self._added: Set[str] = set()
+        # Jobs that are still in the database, but were removed from the store
+        self._deleted: Set[str] = set()
+
+    def __getitem__(self, job_dir: str) -> JobT:
+        if job_dir in self._deleted:
+            raise KeyError(job_dir)
+        if job_dir in self._cache:
+            self._cache.move_to_end(job_dir)
+            return self._cache[job_dir]
+        job = self._load(job_dir)
+        if job is None:
+            raise KeyError(job_dir)
+        self._remember(job_dir, job)
+        return job
+
+    def __setitem__(self, job_dir: str, job: JobT) -> None:
+        if job_dir not in self._cache and (
+                job_dir in self._deleted or self._load(job_dir) is None
+        ):
+            self._added.add(job_dir)
+        self._deleted.discard(job_dir)
+        self._remember(job_dir, job)
+
+    def __delitem__(self, job_dir: str) -> None:
+        if job_dir not in self:
+            raise KeyError(job_dir)
+        del self._cache[job_dir]
+        if job_dir in self._added:
+            self._added.remove(job_dir)
+        else:
+            self._deleted.add(job_dir)
+
+    def __iter__(self) -> Iterator[str]:
+        for job_dir, job in self._iterate():
+            if job_dir in self._deleted or job_dir in self._added:
+                continue
+            if job_dir not in self._cache:
+                self._remember(job_dir, job)
+            yield job_dir
+        yield from list(self._added)
+
+    def __len__(self) -> int:
+        length = self._count()
+        length += sum(1 for job_dir in self._added if self._load(job_dir) is None)
+        length -= sum(
+            1 for job_dir in self._deleted if self._load(job_dir) is not None
+        )
+        return length
+
+    def dirty_items(self) -> List[Tuple[str, JobT]]:
+        """Returns every job that changed since it was loaded or written, with its directory"""
+        return [(job_dir, job) for job_dir, job in self._cache.items() if job.dirty]
+
+    def _remember(self, job_dir: str, job: JobT) -> None:
+        """Holds job in memory, dropping the least recently used clean jobs if over capacity"""
+        self._cache[job_dir] = job
+        self._cache.move_to_end(job_dir)
+        skipped = 0
+        while len(self._cache) > self.capacity and skipped < len(self._cache):
+            oldest_dir, oldest = next(iter(self._cache.items()))
+            if oldest.dirty:
+                self._cache.move_to_end(oldest_dir)
+                skipped += 1
+            else:
+                del self._cache[oldest_dir]
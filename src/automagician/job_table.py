@@ -0,0 +1,248 @@
+import dataclasses
+from array import array
+from collections import Counter
+from enum import IntEnum
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+from automagician.job_store import Job
+
+JobT = TypeVar("JobT", bound=Job)
+# rows of a JobTable, an array when numpy is installed
+Rows = Union[Sequence[int], "npt.NDArray[np.int64]"]
+
+
+class JobRow(Generic[JobT]):
+    """A view of one row of a JobTable, used like the job it holds
+
+    Reading a field reads the table, and setting a field writes to the table
+    and marks the row dirty, the same as setting a field of a job. Rows are
+    equal to jobs holding the same values.
+
+    A row stops pointing at its job once a job is deleted from the table.
+    """
+
+    __slots__ = ("_table", "_row")
+
+    _table: "JobTable[JobT]"
+    _row: int
+
+    def __init__(self, table: "JobTable[JobT]", row: int):
+        object.__setattr__(self, "_table", table)
+        object.__setattr__(self, "_row", row)
+
+    def to_job(self) -> JobT:
+        """Returns a copy of the job in this row"""
+        return self._table.job_class(
+            **{name: getattr(self, name) for name in self._table.fields}
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, JobRow):
+            other = other.to_job()
+        return self.to_job() == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return repr(self.to_job())
+
+
+def _row_property(name: str, convert: Callable[[Any], Any]) -> property:
+    """Returns a property reading and writing the column name of a JobRow's table"""
+
+    def get(row: JobRow[Any]) -> Any:
+        return convert(row._table._columns[name][row._row])
+
+    def set(row: JobRow[Any], value: Any) -> None:
+        columns = row._table._columns
+        if name != "dirty" and columns[name][row._row] != int(value):
+            columns["dirty"][row._row] = 1
+        columns[name][row._row] = int(value)
+
+    return property(get, set)
+
+
+def _converter(field_type: Any) -> Callable[[Any], Any]:
+    """Returns what turns a value stored in a column back into a field_type"""
+    if isinstance(field_type, type) and issubclass(field_type, IntEnum):
+        return lambda value: field_type(int(value))
+    if field_type is bool:
+        return bool
+    return int
+
+
+class JobTable(MutableMapping[str, JobT]):
+    """A dict like collection of jobs that stores each field in its own array
+
+    Jobs are looked up by directory as in a dict, but what is returned is a
+    JobRow viewing the table. Keeping fields in arrays lets select, count, and
+    update work on every job at once, using numpy if it is installed.
+
+    Attributes:
+        job_class: The dataclass of the jobs held, like OptJob
+        fields: The names of every field of job_class, all of which hold ints
+        dirs: The directory of the job in each row
+        index: The row of each directory
+    """
+
+    job_class: Type[JobT]
+    fields: List[str]
+    dirs: List[str]
+    index: Dict[str, int]
+
+    def __init__(self, job_class: Type[JobT], jobs: Iterable[Tuple[str, JobT]] = ()):
+        """Creates a table holding jobs
+
+        Args:
+            job_class: The dataclass of the jobs held, every field of which is
+                an int, bool, or IntEnum
+            jobs: The jobs to hold, with their directories
+        """
+        self.job_class = job_class
+        job_fields = dataclasses.fields(job_class)  # type: ignore
+        self.fields = [field.name for field in job_fields]
+        self.dirs = []
+        self.index = {}
+        self._row_class = type(
+            f"{job_class.__name__}Row",
+            (JobRow,),
+            {
+                "__slots__": (),
+                **{
+                    field.name: _row_property(field.name, _converter(field.type))
+                    for field in job_fields
+                },
+            },
+        )
+        self._columns: Dict[str, Any] = {
+            name: np.zeros(16, dtype=np.int64) if np is not None else array("q")
+            for name in self.fields
+        }
+        for job_dir, job in jobs:
+            self[job_dir] = job
+
+    def __getitem__(self, job_dir: str) -> JobT:
+        return cast(JobT, self._row_class(self, self.index[job_dir]))
+
+    def __setitem__(self, job_dir: str, job: JobT) -> None:
+        row = self.index.get(job_dir)
+        if row is None:
+            row = len(self.dirs)
+            self.dirs.append(job_dir)
+            self.index[job_dir] = row
+            for name, column in self._columns.items():
+                if np is None:
+                    column.append(0)
+                elif row == len(column):
+                    self._columns[name] = np.concatenate(
+                        [column, np.zeros(len(column), dtype=np.int64)]
+                    )
+        for name in self.fields:
+            self._columns[name][row] = int(getattr(job, name))
+
+    def __delitem__(self, job_dir: str) -> None:
+        row = self.index.pop(job_dir)
+        last = len(self.dirs) - 1
+        if row != last:
+            self.dirs[row] = self.dirs[last]
+            self.index[self.dirs[row]] = row
+            for column in self._columns.values():
+                column[row] = column[last]
+        self.dirs.pop()
+        if np is None:
+            for column in self._columns.values():
+                column.pop()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.dirs))
+
+    def __len__(self) -> int:
+        return len(self.dirs)
+
+    def __contains__(self, job_dir: object) -> bool:
+        return job_dir in self.index
+
+    def dirty_items(self) -> List[Tuple[str, JobT]]:
+        """Returns every job that changed since it was loaded or written, with its directory"""
+        return [
+            (self.dirs[row], self._row_class(self, row)) for row in self.select(dirty=1)
+        ]
+
+    def select(self, rows: Optional[Rows] = None, /, **equals: int) -> Rows:
+        """Returns the rows where every given field equals the given value
+
+        Args:
+            rows: If set, only these rows are looked at
+            equals: The value each field must have, ex status=JobStatus.RUNNING
+        Returns:
+            The matching rows, in order
+        """
+        length = len(self.dirs)
+        if np is not None:
+            selected = (
+                np.arange(length)
+                if rows is None
+                else np.asarray(rows, dtype=np.int64)
+            )
+            for name, value in equals.items():
+                selected = selected[self._columns[name][selected] == int(value)]
+            return selected
+        selected_list = list(range(length)) if rows is None else list(rows)
+        for name, value in equals.items():
+            column = self._columns[name]
+            selected_list = [row for row in selected_list if column[row] == int(value)]
+        return selected_list
+
+    def count(self, rows: Rows, name: str) -> Dict[int, int]:
+        """Returns how many of rows hold each value of the field name"""
+        if np is not None:
+            values, counts = np.unique(
+                self._columns[name][np.asarray(rows, dtype=np.int64)],
+                return_counts=True,
+            )
+            return {int(value): int(count) for value, count in zip(values, counts)}
+        column = self._columns[name]
+        return dict(Counter(column[row] for row in rows))
+
+    def update_rows(self, rows: Rows, /, **values: int) -> None:
+        """Sets fields of every row in rows, marking them dirty
+
+        Args:
+            rows: The rows to update
+            values: The value to give each field, ex status=JobStatus.INCOMPLETE
+        """
+        if np is not None:
+            row_array = np.asarray(rows, dtype=np.int64)
+            for name, value in values.items():
+                self._columns[name][row_array] = int(value)
+            self._columns["dirty"][row_array] = 1
+            return
+        for name, value in {**values, "dirty": 1}.items():
+            column = self._columns[name]
+            for row in rows:
+                column[row] = int(value)
@@ -8,6 +8,7 @@ from os.path import exists
 from typing import NoReturn
 
 import automagician.constants as constants
+import automagician.transfer as transfer
 from automagician.classes import Machine, SSHConfig
 
 no_fabric = False
@@ -15,6 +16,7 @@ try:
     import fabric  # type: ignore
 
     from automagician.classes import SshScp
+    from automagician.ssh_pool import RemoteBatch, SshPool
 except ImportError:
     print("fabric unavailable")
     no_fabric = True
@@ -82,11 +84,13 @@ def ssh_scp_init(
                     config=fabric.config.Config(overrides={"warn": True}),
                 )
                 scp = fabric.transfer.Transfer(ssh)
-                ssh.run("hostname")
+                pool = SshPool(ssh)
+                if not pool.run("hostname").ok:
+                    raise ConnectionError(hostname)
             except Exception:
                 logger.warning("you need fri-halifax keys for ssh to work")
                 return SSHConfig(config="NoSSH")
-    return SSHConfig(config=SshScp(ssh=ssh, scp=scp))
+    return SSHConfig(config=SshScp(ssh=ssh, scp=scp, pool=pool))
 
 
 def get_machine_name(machine_number: Machine) -> str:
@@ -132,11 +136,14 @@ def write_lockfile(ssh_config: SSHConfig, machine: Machine) -> None:
         os.makedirs(constants.LOCK_DIR)
         subprocess.run(["chmod", "777", constants.LOCK_DIR])
 
+    remote_lock = None
     if machine < 2 and ssh_config.config != "NoSSH":
-        if not ssh_config.config.ssh.run(
-                "test -d " + constants.LOCK_DIR, warn=True, hide=True
-        ).ok:
-            ssh_config.config.ssh.run("mkdir -p " + constants.LOCK_DIR)
+        batch = RemoteBatch()
+        batch.add("mkdir -p " + constants.LOCK_DIR)
+        lock_index = batch.add(
+            "test -e " + constants.LOCK_FILE + " && cat " + constants.LOCK_FILE
+        )
+        remote_lock = batch.run(ssh_config.config.pool)[lock_index]
 
     if exists(constants.LOCK_FILE):
         logger.error(
@@ -148,18 +155,12 @@ def write_lockfile(ssh_config: SSHConfig, machine: Machine) -> None:
             f"if you'd like to override the lock, you can delete {constants.LOCK_FILE} and rerun your process."
         )
         exit()
-    elif (
-        machine < 2
-        and ssh_config.config != "NoSSH"
-        and ssh_config.config.ssh.run(
-            "test -e " + constants.LOCK_FILE, warn=True, hide=True
-        ).ok
-    ):
+    elif remote_lock is not None and remote_lock.ok:
         logger.error(
             "it looks like you already have a remote instance of automagician running--please wait for it to finish. thank you! :)",
         )
         logger.error("other automagician process's details:")
-        ssh_config.config.ssh.run("cat " + constants.LOCK_FILE)
+        print(remote_lock.stdout, end="")
         logger.error(
             f"if you'd like to override the lock, you can delete {constants.LOCK_FILE} on the remote machine and rerun your process",
         )
@@ -169,7 +170,7 @@ def write_lockfile(ssh_config: SSHConfig, machine: Machine) -> None:
         with open(constants.LOCK_FILE, "w") as f:
             f.write(lockstring)
         if machine < 2 and ssh_config.config != "NoSSH":
-            ssh_config.config.ssh.run(
+            ssh_config.config.pool.run(
                 'echo "' + lockstring + '" > ' + constants.LOCK_FILE
             )
 
@@ -195,33 +196,23 @@ def get_subfile(machine: Machine) -> str:
 def scp_put_dir(local: str, remote: str, ssh_config: SSHConfig) -> None:
     """Puts files inside the local directory to the remote directory
 
+    Everything is sent as a single tar stream, see transfer.put_dir
+
     Args:
       remote (str): the directory on the remote machine to transfer files to
       local (str): the directory on the local machine to transfer files from
     Returns:
       None
     """
-    cwd = os.getcwd()
-    os.chdir(local)
-    for f in (
-            subprocess.run(["find", ".", "-type", "f"], capture_output=True)
-                    .stdout.decode("utf-8")
-                    .split("\n")
-    ):
-        if len(f) < 1:
-            continue
-        dirname = os.path.dirname(remote + f[1:])
-        ssh_config.ssh.run("mkdir -p " + dirname)  # type: ignore
-        ssh_config.scp.put(local + f[1:], dirname)  # type: ignore
-    os.chdir(cwd)
+    transfer.put_dir(local, remote, ssh_config.config.pool)  # type: ignore
 
 
 def automagic_exit(machine: Machine, ssh_config: SSHConfig) -> NoReturn:
     """Removes the lockfile and closes ssh if connected via SSH"""
     subprocess.call(["rm", constants.LOCK_FILE])
     if machine < 2 and ssh_config.config != "NoSSH":
-        ssh_config.ssh.run("rm " + constants.LOCK_FILE)  # type: ignore
-        ssh_config.ssh.close()  # type: ignore
+        ssh_config.config.pool.run("rm " + constants.LOCK_FILE)
+        ssh_config.config.pool.close()
     exit()
 
 
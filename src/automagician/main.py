@@ -6,14 +6,26 @@ import logging
 import os
 import sys
 import traceback
+from typing import MutableMapping, Optional
 
 import automagician.constants as constants
+import automagician.finish_job as finish_job
 import automagician.machine as machine_file
 import automagician.process_job as process_job
 import automagician.register as register
+import automagician.scheduler as scheduler
 import automagician.small_functions as small_functions
-from automagician.classes import JobLimitError, JobStatus
-from automagician.database import Database
+from automagician.classes import (
+    DosJob,
+    JobLimitError,
+    JobStatus,
+    OptJob,
+    WavJob,
+)
+from automagician.database import Database, DatabaseVersionError
+from automagician.directory_index import DirectoryIndex
+from automagician.fact_cache import FactCache
+from automagician.job_table import JobTable
 
 
 # def constants_check(is_silent: bool, is_verbose: bool) -> logging.Logger:
@@ -155,7 +167,7 @@ def set_up_parser() -> argparse.ArgumentParser:
         dest="rcmb_flag",
         default=False,
         help="Simply recreate cmbFE.dat and cmbXDATCAR at current working directory",
-    )  # not fully implemented
+    )
     parser.add_argument(
         "--dbplaintext",
         action="store_true",
@@ -163,6 +175,57 @@ def set_up_parser() -> argparse.ArgumentParser:
         default=False,
         help="Print all job status into a readable text file after finishing other commands",
     )  # not fully implemented
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        dest="report_flag",
+        default=False,
+        help="Only write the readable text file of job statuses, reading the database without locking it. Can be run while another automagician is running",
+    )
+    parser.add_argument(
+        "--wal",
+        action="store_true",
+        dest="wal_flag",
+        default=False,
+        help="Switch the database to write ahead logging, so --report does not wait on a running automagician. Only use if every automagician using the database runs on the same host",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        dest="stream_flag",
+        default=False,
+        help="Load jobs from the database as they are needed instead of all at the start. Uses less memory when the database holds many jobs",
+    )
+    parser.add_argument(
+        "--array",
+        action="store_true",
+        dest="array_flag",
+        default=False,
+        help="Submit jobs that share a subfile as slurm job arrays, so they take one sbatch call",
+    )
+    parser.add_argument(
+        "--submit_workers",
+        action="store",
+        dest="submit_workers",
+        type=int,
+        default=constants.SUBMIT_WORKERS,
+        help="How many jobs can be submitted at the same time",
+    )
+    parser.add_argument(
+        "--scheduler",
+        action="store",
+        dest="scheduler",
+        choices=["slurm", "sge", "simulated"],
+        default="slurm",
+        help="The scheduler to submit jobs to. simulated keeps jobs in memory and never runs them, for testing, and needs --db",
+    )
+    parser.add_argument(
+        "--db",
+        action="store",
+        dest="db_path",
+        default=None,
+        help=f"The database to use instead of {constants.DB_NAME} in the home directory",
+    )
     parser.add_argument(
         "--dbcheck",
         action="store_true",
@@ -216,6 +279,12 @@ def main_wrapper(args: argparse.Namespace) -> None:
     sub_queue: list[str] = []
     set_up_logger(args.silent, args.verbose)
     logger = logging.getLogger()
+    fact_cache: Optional[FactCache] = None
+    if args.scheduler == "simulated" and args.db_path is None:
+        # jobs the simulated scheduler "runs" would be recorded as submitted
+        # in the real database
+        logger.error("--scheduler simulated needs a separate database, see --db")
+        return
     try:
         machine = machine_file.get_machine_number()
         home = (
@@ -223,20 +292,50 @@ def main_wrapper(args: argparse.Namespace) -> None:
             if machine < 2
             else os.path.normpath(os.path.join(os.environ["WORK"], ".."))
         )
+        db_path = (
+            os.path.join(home, constants.DB_NAME)
+            if args.db_path is None
+            else args.db_path
+        )
+        if args.report_flag:
+            logger.info(f"Writing plain text db to {constants.PLAIN_TEXT_DB_NAME}")
+            try:
+                reader = Database(db_path, read_only=True)
+            except DatabaseVersionError as e:
+                logger.error(str(e))
+                return
+            reader.write_plain_text_db(
+                os.path.join(home, constants.PLAIN_TEXT_DB_NAME)
+            )
+            reader.db.connection.close()
+            return
         ssh_config = machine_file.ssh_scp_init(machine, home, args.balance, logger)
         logger.debug(f"ssh_config is {str(ssh_config.config)}")
         machine_file.write_lockfile(ssh_config, machine)
-        database = Database(os.path.join(home, constants.DB_NAME))
-        opt_jobs = database.get_opt_jobs()
-        dos_jobs = database.get_dos_jobs()
-        wav_jobs = database.get_wav_jobs()
+        database = Database(db_path, wal=args.wal_flag)
+        fact_cache = FactCache(database.db.connection.cursor())
+        opt_jobs: MutableMapping[str, OptJob]
+        dos_jobs: MutableMapping[str, DosJob]
+        wav_jobs: MutableMapping[str, WavJob]
+        if args.stream_flag:
+            opt_jobs = database.get_opt_job_store()
+            dos_jobs = database.get_dos_job_store()
+            wav_jobs = database.get_wav_job_store()
+        else:
+            opt_jobs = JobTable(OptJob, database.iter_opt_jobs())
+            dos_jobs = JobTable(DosJob, database.iter_dos_jobs())
+            wav_jobs = JobTable(WavJob, database.iter_wav_jobs())
         tacc_queue_sizes = [0, 0, 0]
+        backend = scheduler.get_scheduler(args.scheduler)
+        snapshot = backend.snapshot(os.path.join(home, constants.ARRAY_DIR_NAME))
         process_job.get_submitted_jobs(
             machine,
             opt_jobs,
             dos_jobs,
             wav_jobs,
             tacc_queue_sizes,
+            snapshot,
+            backend,
         )
         preliminary_results = open(
             os.path.join(home, constants.PRELIMINARY_RESULTS_NAME), "w"
@@ -253,8 +352,14 @@ def main_wrapper(args: argparse.Namespace) -> None:
                 small_functions.archive_converged(home)
             if args.resetjobstatus_flag:
                 database.reset_job_status()
+            if args.rcmb_flag:
+                logger.info("Recreating cmbXDATCAR and cmbFE.dat")
+                finish_job.combine_XDAT_FE(os.getcwd(), rebuild=True)
             if args.register:
                 logger.info("Registering all jobs in the current directory")
+                directory_index = DirectoryIndex(
+                    os.path.join(home, constants.DIRECTORY_INDEX_NAME)
+                )
                 register.register(
                     opt_jobs=opt_jobs,
                     dos_jobs=dos_jobs,
@@ -268,23 +373,23 @@ def main_wrapper(args: argparse.Namespace) -> None:
                     limit=args.limit,
                     sub_queue=sub_queue,
                     hit_limit=hit_limit,
+                    directory_index=directory_index,
+                    fact_cache=fact_cache,
                 )
+                directory_index.close()
             if args.process:
                 logger.info("Processing all unconverged optimization jobs")
-                for direc in database.db.execute(
-                        "select dir from opt_jobs where status = ?",
-                        str(JobStatus.INCOMPLETE.value),
-                ):
-                    logger.info("inspecting recorded job: ", direc[0])
+                for job_dir, _ in database.iter_opt_jobs(JobStatus.INCOMPLETE):
+                    logger.info(f"inspecting recorded job: {job_dir}")
                     if args.db_debug_flag:
                         continue
                     else:
-                        if not os.path.exists(direc[0]):
-                            logger.warning(f"{direc[0]} no longer exists!")
+                        if not os.path.exists(job_dir):
+                            logger.warning(f"{job_dir} no longer exists!")
                             continue
                         else:
                             process_job.process_opt(
-                                job_directory=direc[0],
+                                job_directory=job_dir,
                                 machine=machine,
                                 ssh_config=ssh_config,
                                 opt_jobs=opt_jobs,
@@ -295,6 +400,7 @@ def main_wrapper(args: argparse.Namespace) -> None:
                                 limit=args.limit,
                                 sub_queue=sub_queue,
                                 hit_limit=hit_limit,
+                                fact_cache=fact_cache,
                             )
 
         except JobLimitError:
@@ -317,6 +423,10 @@ def main_wrapper(args: argparse.Namespace) -> None:
                 wav_jobs=wav_jobs,
                 database=database,
                 limit=args.limit,
+                snapshot=snapshot,
+                array=args.array_flag,
+                max_workers=args.submit_workers,
+                backend=backend,
             )
             database.write_job_statuses(
                 opt_jobs=opt_jobs,
@@ -354,6 +464,10 @@ def main_wrapper(args: argparse.Namespace) -> None:
             wav_jobs=wav_jobs,
             database=database,
             limit=args.limit,
+            snapshot=snapshot,
+            array=args.array_flag,
+            max_workers=args.submit_workers,
+            backend=backend,
         )
         database.write_job_statuses(
             opt_jobs=opt_jobs,
@@ -364,6 +478,10 @@ def main_wrapper(args: argparse.Namespace) -> None:
             "interrupt received, lock released and job statuses written to sql db",
         )
         machine_file.automagic_exit(machine, ssh_config)
+    finally:
+        # automagic_exit exits, so this runs on every path out of the run
+        if fact_cache is not None:
+            fact_cache.save()
 
 
 if __name__ == "__main__":
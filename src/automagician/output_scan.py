@@ -0,0 +1,218 @@
+import gzip
+import math
+import os
+import re
+from typing import IO, Iterator, List, Optional, Tuple
+
+import automagician.constants as constants
+from automagician.classes import LlOutScan
+
+# Matches the summary line VASP prints after each ionic step, ex
+#    5 F= -.67453622E+01 E0= -.67492274E+01  d E =-.329023E-02
+IONIC_STEP_REGEX = re.compile(r"^\s*(\d+) F=")
+
+
+def scan_ll_out(ll_out_path: str) -> LlOutScan:
+    """Reads ll_out and collects everything automagician needs from it
+
+    VASP reports both convergence and fatal errors at the end of ll_out, so
+    ll_out is read backwards from the end and reading stops as soon as one of
+    them and the last ionic step have been found. The whole file is only read
+    when neither marker is present, or when there was an error and every
+    error message is needed.
+
+    Args:
+        ll_out_path: The path to the ll_out to read
+    Returns:
+        What was found in ll_out
+    Raises:
+        FileNotFoundError: if ll_out does not exist
+    """
+    has_error = False
+    converged = False
+    last_step = -1
+    for line in read_lines_reversed(ll_out_path):
+        if not (has_error or converged):
+            if constants.VASP_ERROR_MARKER in line:
+                has_error = True
+            elif constants.VASP_CONVERGENCE_MARKER in line:
+                converged = True
+        if last_step == -1 and "F=" in line:
+            step_match = IONIC_STEP_REGEX.match(line)
+            if step_match is not None:
+                last_step = int(step_match.group(1))
+        if (has_error or converged) and last_step != -1:
+            break
+    return LlOutScan(
+        has_error=has_error,
+        converged=converged,
+        error_messages=read_error_messages(ll_out_path) if has_error else [],
+        last_step=max(last_step, 0),
+    )
+
+
+def read_force_energy(outcar_path: str) -> List[Tuple[int, float, float, float]]:
+    """Reads the force and energy of every ionic step from an OUTCAR
+
+    This gives the same rows as the fe.dat made by vef.pl. The force is the
+    largest force on a single atom, taken from the "FORCES: max atom" line if
+    VASP was built with VTST, and otherwise found from the TOTAL-FORCE block.
+    The energy is energy(sigma->0).
+
+    Args:
+        outcar_path: The path to the OUTCAR to read. If it does not exist,
+            outcar_path + ".gz" is read instead
+    Returns:
+        A list of (step, force, energy, change in energy since the first step),
+        with steps numbered from 0. Empty if there is no OUTCAR. A step VASP
+        was still writing when the OUTCAR ends is left out
+    """
+    max_atom_forces: List[float] = []
+    total_forces: List[float] = []
+    energies: List[float] = []
+    outcar = _open_text_or_gzip(outcar_path)
+    if outcar is None:
+        return []
+    with outcar:
+        lines = iter(outcar)
+        for line in lines:
+            if "energy  without entropy" in line:
+                energy = _float_field(line, 6)
+                if energy is not None:
+                    energies.append(energy)
+            elif "FORCES: max atom" in line:
+                max_atom_force = _float_field(line, 4)
+                if max_atom_force is not None:
+                    max_atom_forces.append(max_atom_force)
+            elif "TOTAL-FORCE" in line:
+                next(lines, None)
+                largest = 0.0
+                # Only counted once its closing dashes are seen, as the OUTCAR
+                # may end part way through the block
+                complete = False
+                for force_line in lines:
+                    if force_line.lstrip().startswith("-"):
+                        complete = True
+                        break
+                    try:
+                        fx, fy, fz = (float(f) for f in force_line.split()[3:6])
+                    except ValueError:
+                        break
+                    largest = max(largest, math.sqrt(fx * fx + fy * fy + fz * fz))
+                if complete:
+                    total_forces.append(largest)
+    if len(max_atom_forces) >= len(energies):
+        forces = max_atom_forces
+    else:
+        forces = total_forces
+    return [
+        (step, force, energy, energy - energies[0])
+        for step, (force, energy) in enumerate(zip(forces, energies))
+    ]
+
+
+def _float_field(line: str, index: int) -> Optional[float]:
+    """Returns the index-th whitespace separated field of line as a float
+
+    Returns:
+        The field, or None if line was cut off before it
+    """
+    try:
+        return float(line.split()[index])
+    except (IndexError, ValueError):
+        return None
+
+
+def write_fe_dat(job_directory: str) -> None:
+    """Writes fe.dat in job_directory from its OUTCAR, like vef.pl
+
+    Does nothing if fe.dat is newer than OUTCAR. fe.dat is replaced in one
+    step once it is written, so it is never left empty or half written.
+
+    Args:
+        job_directory: The directory with the OUTCAR
+    """
+    outcar_path = os.path.join(job_directory, "OUTCAR")
+    fe_dat_path = os.path.join(job_directory, "fe.dat")
+    try:
+        outcar_mtime = os.stat(outcar_path).st_mtime_ns
+    except FileNotFoundError:
+        outcar_mtime = -1
+    try:
+        if os.stat(fe_dat_path).st_mtime_ns > outcar_mtime:
+            return
+    except FileNotFoundError:
+        pass
+    rows = [
+        f"{step:5d} {force:20.6f} {energy:20.6f} {energy_change:20.6g}\n"
+        for step, force, energy, energy_change in read_force_energy(outcar_path)
+    ]
+    with open(fe_dat_path + ".tmp", "w") as fe_dat:
+        fe_dat.writelines(rows)
+    os.replace(fe_dat_path + ".tmp", fe_dat_path)
+
+
+def _open_text_or_gzip(path: str) -> Optional[IO[str]]:
+    """Opens path for reading as text, or path + ".gz" if path does not exist
+
+    Returns:
+        The opened file, or None if neither exists
+    """
+    try:
+        return open(path, "r", errors="replace")
+    except FileNotFoundError:
+        pass
+    try:
+        return gzip.open(path + ".gz", "rt", errors="replace")
+    except FileNotFoundError:
+        return None
+
+
+def read_error_messages(ll_out_path: str) -> List[str]:
+    """Returns every line of ll_out that mentions an error, in order
+
+    Args:
+        ll_out_path: The path to the ll_out to read
+    Returns:
+        The lines with "ERROR" or "error" in them, with the surrounding "|" and
+        whitespace removed
+    """
+    messages = []
+    with open(ll_out_path, "r", errors="replace") as ll_out:
+        for line in ll_out:
+            if ("ERROR" in line) or ("error" in line):
+                messages.append(line.strip("| \n"))
+    return messages
+
+
+def read_lines_reversed(
+        path: str, chunk_size: int = constants.REVERSE_READ_CHUNK_SIZE
+) -> Iterator[str]:
+    """Yields the lines of a file from last to first, without line endings
+
+    The file is read backwards in blocks of chunk_size bytes, so stopping
+    early only costs reading the end of the file.
+
+    Args:
+        path: The path to the file to read
+        chunk_size: How many bytes to read at a time
+    Raises:
+        FileNotFoundError: if path does not exist
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        partial = b""
+        at_end = True
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + partial).split(b"\n")
+            partial = lines[0]
+            if at_end and lines[-1] == b"":
+                lines.pop()
+            at_end = False
+            for line in reversed(lines[1:]):
+                yield line.decode(errors="replace")
+        if not at_end:
+            yield partial.decode(errors="replace")
@@ -1,27 +1,49 @@
+import dataclasses
+import functools
 import logging
 import os
 import re
-import shutil
-import subprocess
+import shlex
+import sys
 import traceback
 from os.path import exists
-from typing import Dict, List, Literal, TextIO, Tuple
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    MutableMapping,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
 
 import automagician.constants as constants
 import automagician.create_job as create_job
 import automagician.finish_job as finish_job
 import automagician.machine as machine_file
+import automagician.output_scan as output_scan
+import automagician.scheduler as scheduler
+import automagician.transfer as transfer
 import automagician.update_job as update_job
 from automagician.classes import (
     DosJob,
     GoneJob,
     JobStatus,
+    LlOutScan,
     Machine,
     OptJob,
+    SchedulerSnapshot,
     SSHConfig,
     WavJob,
 )
 from automagician.database import Database
+from automagician.fact_cache import FactCache
+from automagician.job_table import JobTable
+from automagician.ssh_pool import RemoteBatch
+from automagician.submit_pool import SubmitPool
 
 try:
     from automagician.classes import SshScp
@@ -30,16 +52,13 @@ try:
     def scp_get_dir(remote: str, local: str, ssh_scp: SshScp) -> None:
         """Puts files inside the remote directory to the local directory
 
+        Everything is sent as a single tar stream, see transfer.get_dir
+
         Args:
             remote: the directory on the remote machine to transfer files from
             local: the directory on the local machine to transfer files to
         """
-        for f in ssh_scp.ssh.run(
-                "cd " + remote + "; find . -type f | cut -c 2-"
-        ).stdout.split("\n"):
-            if len(f) < 1:
-                continue
-            ssh_scp.scp.get(remote + f, local + f)
+        transfer.get_dir(remote, local, ssh_scp.pool)
 
 except ImportError:
     pass
@@ -48,7 +67,7 @@ except ImportError:
 def process_opt(
         job_directory: str,
         machine: Machine,
-        opt_jobs: Dict[str, OptJob],
+        opt_jobs: MutableMapping[str, OptJob],
         clear_certificate: bool,
         home_dir: str,
         ssh_config: SSHConfig,
@@ -57,6 +76,7 @@ def process_opt(
         limit: int,
         sub_queue: List[str],
         hit_limit: bool,
+        fact_cache: Optional[FactCache] = None,
 ) -> None:
     """Processes an opt job, checking to see if it has the required files, and is running
 
@@ -80,6 +100,8 @@ def process_opt(
         limit: How many jobs can currently be submitted at 1 time
         sub_queue: A list of all jobs to be sibmitted
         hit_limit: If the limit has already been set
+        fact_cache: Facts about job files from previous runs. If given, files
+            that have not changed are not read again
     Throws:
         JobLimitError: If the job limit was hit, and continue_past_limit is not
         set
@@ -89,20 +111,19 @@ def process_opt(
     logger.debug(f"process_opt {job_directory}")
     if machine < 2 and ssh_config.config != "NoSSH":
         if opt_jobs[job_directory].last_on == 1 - machine:
-            logger.debug("scping from other machine")
+            logger.debug("syncing from other machine")
             try:
-                shutil.rmtree(job_directory)
-                scp_get_dir(
+                transfer.sync_dir(
                     home_dir + constants.AUTOMAGIC_REMOTE_DIR + job_directory,
                     job_directory,
-                    ssh_config.config,
+                    ssh_config.config.pool,
                 )
+                opt_jobs[job_directory].last_on = machine
             except Exception as e:
                 logger.error(
                     f"Exception {e} occoured while processing an opt job in {job_directory}"
                 )
                 traceback.print_exc()
-            opt_jobs[job_directory].last_on = machine
 
     if not check_has_opt(job_directory, subfile):
         logger.warning(f"No opt files found in {job_directory}!")
@@ -143,16 +164,18 @@ def process_opt(
         )
         return
     error_fixed = False
-    if check_error(job_directory):
+    ll_out_scan = scan_job_ll_out(job_directory, fact_cache)
+    if check_error(job_directory, ll_out_scan):
         logger.warning(f"job in {job_directory} failed!")
         opt_jobs[job_directory].status = JobStatus.ERROR
-        update_job.log_error(job_directory, home_dir)
+        update_job.log_error(job_directory, home_dir, ll_out_scan)
         error_fixed = update_job.fix_error(
             job_directory=job_directory,
+            ll_out_scan=ll_out_scan,
         )
 
     logger.debug(f"Determining convergence of job in {job_directory}")
-    is_converged = determine_convergence(job_directory)
+    is_converged = determine_convergence(job_directory, ll_out_scan, fact_cache)
     if is_converged and not error_fixed:
         process_converged(job_directory, opt_jobs)
     else:
@@ -169,28 +192,67 @@ def process_opt(
 
 
 def get_residueSFE(job_directory: str) -> Tuple[int, float, float]:
-    """Currently returns a tuple of 3 zeroes
+    """Returns the step, force, and energy of the last line of cmbFE.dat
+
+    This is read from the state kept by finish_job.combine_XDAT_FE, so
+    cmbFE.dat is not read. The runs are combined first if they never were
 
-    Goal seems to be to return the step, force, and total energy of the final step in a tuple
+    Args:
+        job_directory: The job directory with the run directories
+    Returns:
+        The step, force, and energy, or 0, 0.0, 0.0 if there are no runs
     """
-    # this function cannot be used before cmbFE can be created correctly
-    return 0, 0.0, 0.0
+    state = finish_job.read_combine_state(job_directory)
+    if state is None:
+        state = finish_job.combine_XDAT_FE(job_directory)
+    return state.step, state.force, state.energy
 
 
-def check_error(job_directory: str) -> bool:
+def scan_job_ll_out(
+        job_directory: str, fact_cache: Optional[FactCache] = None
+) -> LlOutScan:
+    """Scans the ll_out in job_directory, using fact_cache if it is given
+
+    Args:
+      job_directory (str): The directory the job can be found on
+      fact_cache (FactCache): Facts about job files from previous runs
+    Returns:
+      LlOutScan: What was found in ll_out
+    Raises:
+      FileNotFoundError: if there is no ll_out in job_directory"""
+    ll_out_path = os.path.join(job_directory, "ll_out")
+    if fact_cache is None:
+        return output_scan.scan_ll_out(ll_out_path)
+    return LlOutScan(
+        **fact_cache.get(
+            ll_out_path,
+            "ll_out",
+            lambda: dataclasses.asdict(output_scan.scan_ll_out(ll_out_path)),
+        )
+    )
+
+
+def check_error(
+        job_directory: str, ll_out_scan: Optional[LlOutScan] = None
+) -> bool:
     """Returns True if this job reported an error, false otherwise
 
     Args:
       job_directory (str): The directory the job can be found on
+      ll_out_scan (LlOutScan): A scan of the ll_out in job_directory. If None,
+        ll_out is scanned
     Returns:
-      True iff ll_out shows an error, false otherwise"""
+      True iff ll_out shows an error, false otherwise. False if there is no ll_out"""
     logger = logging.getLogger()
-    lloutpath = os.path.join(job_directory, "ll_out")
-    grepout = subprocess.call(
-        ["grep", r"I\ REFUSE\ TO\ CONTINUE\ WITH\ THIS\ SICK\ JOB", lloutpath]
-    )
+    if ll_out_scan is None:
+        try:
+            ll_out_scan = output_scan.scan_ll_out(
+                os.path.join(job_directory, "ll_out")
+            )
+        except FileNotFoundError:
+            return False
 
-    if grepout == 0:
+    if ll_out_scan.has_error:
         logger.warning(f"The job in {job_directory} reported an error!")
         return True
     else:
@@ -198,12 +260,19 @@ def check_error(job_directory: str) -> bool:
 
 
 # This assumes that all converged calculations do not wrap up its last run
-def determine_convergence(job_directory: str) -> bool:
+def determine_convergence(
+        job_directory: str,
+        ll_out_scan: Optional[LlOutScan] = None,
+        fact_cache: Optional[FactCache] = None,
+) -> bool:
     """Returns if this job has converged, Works for all jobs, including bulk relaxition
 
         Creates a fe.dat iff CONTCAR and ll_out exist
     Args:
         job_directory (str): A path to the job directory. NO TRAILING SLASHES
+        ll_out_scan (LlOutScan): A scan of the ll_out in job_directory. If
+            None, ll_out is scanned
+        fact_cache (FactCache): Facts about job files from previous runs
 
     Returns:
         bool: True if the job was converged, False otherise
@@ -223,32 +292,39 @@ def determine_convergence(job_directory: str) -> bool:
     ):
         return False
     # use ll_out to determine convergence
-    logger.debug("running vef.pl")
-    cwd = os.getcwd()
-    os.chdir(job_directory)
-    subprocess.call("vef.pl", stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    os.chdir(cwd)
-    if not grep_ll_out_convergence(os.path.join(job_directory, "ll_out")):
+    logger.debug(f"writing fe.dat for {job_directory}")
+    output_scan.write_fe_dat(job_directory)
+    if ll_out_scan is None:
+        is_converged = grep_ll_out_convergence(os.path.join(job_directory, "ll_out"))
+    else:
+        is_converged = ll_out_scan.converged
+    if not is_converged:
         return False
-    if is_isif3(job_directory):
+    if is_isif3(job_directory, fact_cache):
         logger.debug(f"job in {job_directory} is a bulk relaxation job")
-        return determine_box_convergence(job_directory)
+        return determine_box_convergence(job_directory, fact_cache)
     return True
 
 
-def determine_box_convergence(job_directory: str) -> bool:
+def determine_box_convergence(
+        job_directory: str, fact_cache: Optional[FactCache] = None
+) -> bool:
     """Returns true if box relaxation completed, false otherwise
 
     Args:
       job_directory (str): The directory of the job with the box convergence run
+      fact_cache (FactCache): Facts about job files from previous runs
     Returns:
       bool: True iff there is exactly 1 line in the box relaxation"""
     logger = logging.getLogger()
     logger.debug(f"determining box convergence for {job_directory}")
     fedatname = os.path.join(job_directory, "fe.dat")
-    line_number = 0
-    with open(fedatname, "r") as fedat:
-        line_number = len(fedat.readlines())
+    if fact_cache is None:
+        line_number = count_lines(fedatname)
+    else:
+        line_number = fact_cache.get(
+            fedatname, "line_count", lambda: count_lines(fedatname)
+        )
     if line_number == 0:
         logger.warning(f"The calculation in {job_directory} needs attention")
         return False
@@ -261,22 +337,37 @@ def determine_box_convergence(job_directory: str) -> bool:
 
 
 # Determine if this job needs to be treated differently
-def is_isif3(job_directory: str) -> bool:
+def is_isif3(job_directory: str, fact_cache: Optional[FactCache] = None) -> bool:
     """Returns if the INCAR present in job_directory has the tag ISIF = 3
 
     Args:
       job_directory (str): The directory with the potential box relaxion job
+      fact_cache (FactCache): Facts about job files from previous runs
     Returns:
       True if the INCAR has ISIF = 3 (whitespace ignored), false otherwise
     """
+    incar_path = os.path.join(job_directory, "INCAR")
+    if fact_cache is None:
+        return read_is_isif3(incar_path)
+    return bool(fact_cache.get(incar_path, "isif3", lambda: read_is_isif3(incar_path)))
+
+
+def read_is_isif3(incar_path: str) -> bool:
+    """Returns if the INCAR at incar_path has the tag ISIF = 3"""
     isif3regex = re.compile(r"ISIF\s*=\s*3")
-    with open(os.path.join(job_directory, "INCAR"), "r") as f:
+    with open(incar_path, "r") as f:
         for line in f:
             if isif3regex.match(line):
                 return True
     return False
 
 
+def count_lines(path: str) -> int:
+    """Returns the number of lines in the file at path"""
+    with open(path, "r") as f:
+        return sum(1 for _ in f)
+
+
 def grep_ll_out_convergence(ll_out: str) -> bool:
     """Looks at ll_out to see if the reuqired accuracy has been met
 
@@ -285,18 +376,13 @@ def grep_ll_out_convergence(ll_out: str) -> bool:
     Returns:
       bool: True iff the energy minimization was stopped due to required accuracy being met
       False otherwise"""
-    grep_retcode = subprocess.call(
-        [
-            "grep",
-            "reached required accuracy - stopping structural energy minimisation",
-            ll_out,
-        ],
-        stdout=subprocess.DEVNULL,
-    )
-    return grep_retcode == 0
+    try:
+        return output_scan.scan_ll_out(ll_out).converged
+    except FileNotFoundError:
+        return False
 
 
-def process_converged(job_directory: str, opt_jobs: Dict[str, OptJob]) -> None:
+def process_converged(job_directory: str, opt_jobs: MutableMapping[str, OptJob]) -> None:
     """creates a convergence certificate, and sets the job status to converged
 
     This would combine XCATCAR and FE if that was working
@@ -317,7 +403,7 @@ def process_converged(job_directory: str, opt_jobs: Dict[str, OptJob]) -> None:
 
 def process_unconverged(
         job_directory: str,
-        opt_jobs: Dict[str, OptJob],
+        opt_jobs: MutableMapping[str, OptJob],
         continue_past_limit: bool,
         limit: int,
         sub_queue: List[str],
@@ -378,8 +464,8 @@ def process_unconverged(
 
 def process_dos(
         job_directory: str,
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
         continue_past_limit: bool,
         limit: int,
         sub_queue: List[str],
@@ -475,8 +561,8 @@ def process_dos(
 
 def process_wav(
         job_directory: str,
-        opt_jobs: Dict[str, OptJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        wav_jobs: MutableMapping[str, WavJob],
         continue_past_limit: bool,
         limit: int,
         sub_queue: List[str],
@@ -524,9 +610,11 @@ def process_wav(
 
 def _get_submitted_jobs_slurm(
         machine: Machine,
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
+        snapshot: SchedulerSnapshot,
+        backend: scheduler.Scheduler,
 ) -> None:
     """Gets all currently running jobs and adds them to opt_jobs, dos_jobs, wav_jobs
 
@@ -540,31 +628,31 @@ def _get_submitted_jobs_slurm(
         on if the job reported an error.
 
         If a job reported an error the job is cancelled, and the error is logged
-        so the user can look into the error
+        so the user can look into the error. Every such job is cancelled
+        together once the queue has been read
 
     Args:
         machine: The machine the user is currenty logged into
         opt_jobs: The collection of all opt jobs known by automagican
         dos_jobs: The collection of all dos jobs known by automagican
         wav_jobs: The collection of all wav jobs known by automagican
+        snapshot: The scheduler's queue
+        backend: The scheduler the queue was read from, used to cancel jobs
     """
     logger = logging.getLogger()
-    all_jobs = str(
-        subprocess.check_output(["squeue", "-u", os.environ["USER"], "-o", "%A %t %Z"])
-    ).split("\n")
-    for job in all_jobs[1:-1]:
-        job_arr = job.split()
-        job_id = job_arr[0]
-        job_sstatus = job_arr[1]  # slurm's status code
-        job_dir = job_arr[2]
+    failed_job_ids = []
+    for job in scheduler.get_user_jobs(snapshot):
+        job_id = job.job_id
+        job_sstatus = job.state  # slurm's status code
+        job_dir = sys.intern(job.work_dir)
 
         job_status = JobStatus.RUNNING
 
-        if job_sstatus in ["BF", "CA", "F", "NF", "OOM", "TO"]:
+        if job_sstatus in backend.error_states:
             logger.warning(
                 f"job id={job_id}, dir={job_dir} is in error with status={job_sstatus}"
             )
-            subprocess.call(["scancel", job_id])
+            failed_job_ids.append(job_id)
             job_status = JobStatus.ERROR
         else:
             job_status = JobStatus.RUNNING
@@ -603,14 +691,17 @@ def _get_submitted_jobs_slurm(
             else:
                 opt_jobs[job_dir].status = job_status
                 opt_jobs[job_dir].last_on = machine
+    backend.cancel(failed_job_ids)
 
 
 def get_submitted_jobs(
         machine: Machine,
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
         tacc_queue_sizes: List[int],
+        snapshot: SchedulerSnapshot,
+        backend: Optional[scheduler.Scheduler] = None,
 ) -> None:
     """Ensures only jobs that are actually running have JobStatus.Running set
 
@@ -636,49 +727,71 @@ def get_submitted_jobs(
         dos_jobs: The collection of all dos jobs known by automagican
         wav_jobs: The collection of all wav jobs known by automagican
         tacc_queue_sizes: Shows howmany jobs this user has submitted to TACC
+        snapshot: The scheduler's queue
+        backend: The scheduler the queue was read from. Slurm if not given
     """
+    if backend is None:
+        backend = scheduler.SlurmScheduler()
     if machine in [0, 1]:  # fri
-        for job_dir in opt_jobs:
-            if opt_jobs[job_dir].status == JobStatus.RUNNING:
-                opt_jobs[job_dir].status = JobStatus.INCOMPLETE
-        for job_dir in dos_jobs:
-            if dos_jobs[job_dir].sc_status == JobStatus.RUNNING:
-                dos_jobs[job_dir].sc_status = JobStatus.INCOMPLETE
-            if dos_jobs[job_dir].dos_status == JobStatus.RUNNING:
-                dos_jobs[job_dir].dos_status = JobStatus.INCOMPLETE
-        for job_dir in wav_jobs:
-            if wav_jobs[job_dir].wav_status == JobStatus.RUNNING:
-                wav_jobs[job_dir].wav_status = JobStatus.INCOMPLETE
-        _get_submitted_jobs_slurm(machine, opt_jobs, dos_jobs, wav_jobs)
+        reset_running_jobs(opt_jobs, "status", "last_on", None)
+        reset_running_jobs(dos_jobs, "sc_status", "sc_last_on", None)
+        reset_running_jobs(dos_jobs, "dos_status", "dos_last_on", None)
+        reset_running_jobs(wav_jobs, "wav_status", "wav_last_on", None)
+        _get_submitted_jobs_slurm(
+            machine, opt_jobs, dos_jobs, wav_jobs, snapshot, backend
+        )
     else:  # tacc
-        for job_dir in opt_jobs:
-            if opt_jobs[job_dir].status == JobStatus.RUNNING:
-                tacc_queue_sizes[opt_jobs[job_dir].last_on - 2] = (
-                        tacc_queue_sizes[opt_jobs[job_dir].last_on - 2] + 1
-                )
-                if opt_jobs[job_dir].last_on == machine:
-                    opt_jobs[job_dir].status = JobStatus.INCOMPLETE
-        for job_dir in dos_jobs:
-            if dos_jobs[job_dir].sc_status == JobStatus.RUNNING:
-                tacc_queue_sizes[dos_jobs[job_dir].sc_last_on - 2] = (
-                        tacc_queue_sizes[dos_jobs[job_dir].sc_last_on - 2] + 1
-                )
-                if dos_jobs[job_dir].sc_last_on == machine:
-                    dos_jobs[job_dir].sc_status = JobStatus.INCOMPLETE
-            if dos_jobs[job_dir].dos_status == JobStatus.RUNNING:
-                tacc_queue_sizes[opt_jobs[job_dir].last_on - 2] = (
-                        tacc_queue_sizes[opt_jobs[job_dir].last_on - 2] + 1
-                )
-                if dos_jobs[job_dir].dos_last_on == machine:
-                    dos_jobs[job_dir].dos_status = JobStatus.INCOMPLETE
-        for job_dir in wav_jobs:
-            if wav_jobs[job_dir].wav_status == JobStatus.INCOMPLETE:
-                tacc_queue_sizes[wav_jobs[job_dir].wav_last_on - 2] = (
-                        tacc_queue_sizes[wav_jobs[job_dir].wav_last_on - 2] + 1
-                )
-                if wav_jobs[job_dir].wav_last_on == machine:
-                    wav_jobs[job_dir].wav_status = JobStatus.RUNNING
-        _get_submitted_jobs_slurm(machine, opt_jobs, dos_jobs, wav_jobs)
+        resets: List[Tuple[MutableMapping[str, Any], str, str]] = [
+            (opt_jobs, "status", "last_on"),
+            (dos_jobs, "sc_status", "sc_last_on"),
+            (dos_jobs, "dos_status", "dos_last_on"),
+            (wav_jobs, "wav_status", "wav_last_on"),
+        ]
+        for jobs, status_field, machine_field in resets:
+            running = reset_running_jobs(jobs, status_field, machine_field, machine)
+            for running_machine, count in running.items():
+                if running_machine >= Machine.STAMPEDE2_TACC:
+                    tacc_queue_sizes[running_machine - 2] += count
+        _get_submitted_jobs_slurm(
+            machine, opt_jobs, dos_jobs, wav_jobs, snapshot, backend
+        )
+
+
+def reset_running_jobs(
+        jobs: MutableMapping[str, Any],
+        status_field: str,
+        machine_field: str,
+        machine: Optional[Machine],
+) -> Dict[int, int]:
+    """Sets jobs that are recorded as running back to JobStatus.INCOMPLETE
+
+    If jobs is a JobTable this is done on every job at once
+
+    Args:
+        jobs: The jobs to look through
+        status_field: The field of each job holding the status to reset
+        machine_field: The field of each job holding the machine that status
+            is for
+        machine: If set only jobs running on this machine are reset
+    Returns:
+        How many jobs were running on each machine, before any were reset
+    """
+    if isinstance(jobs, JobTable):
+        running = jobs.select(**{status_field: JobStatus.RUNNING})
+        table_counts = jobs.count(running, machine_field)
+        if machine is not None:
+            running = jobs.select(running, **{machine_field: machine})
+        jobs.update_rows(running, **{status_field: JobStatus.INCOMPLETE})
+        return table_counts
+    counts: Dict[int, int] = {}
+    for job in jobs.values():
+        if getattr(job, status_field) != JobStatus.RUNNING:
+            continue
+        running_machine = getattr(job, machine_field)
+        counts[running_machine] = counts.get(running_machine, 0) + 1
+        if machine is None or running_machine == machine:
+            setattr(job, status_field, JobStatus.INCOMPLETE)
+    return counts
 
 
 def classify_job_dir(job_dir: str) -> Literal["dos", "sc", "wav", "opt"]:
@@ -704,7 +817,7 @@ def classify_job_dir(job_dir: str) -> Literal["dos", "sc", "wav", "opt"]:
 
 def gone_job_check(
         database: Database,
-        opt_jobs: Dict[str, OptJob],
+        opt_jobs: MutableMapping[str, OptJob],
 ) -> Dict[str, GoneJob]:
     """Checks optomization jobs and turns them into gone jobs if they do not exist
 
@@ -714,14 +827,9 @@ def gone_job_check(
     Deletes the gone jobs from the opt_jobs table
     """
     logger = logging.getLogger()
-    my_opt_jobs = database.get_opt_jobs()
-    logger.info(f"COUNT OF OPT_JOBS: {len(my_opt_jobs)}")
-    # for direc in db.execute('select dir from opt_jobs where status = 1'):
+    logger.info(f"COUNT OF OPT_JOBS: {database.count_jobs('opt_jobs')}")
     gone_jobs_list: List[GoneJob] = []
-    for job_dir in my_opt_jobs:
-        current_opt_job = my_opt_jobs[job_dir]
-        if current_opt_job.status != JobStatus.INCOMPLETE:
-            continue
+    for job_dir, current_opt_job in database.iter_opt_jobs(JobStatus.INCOMPLETE):
         if not exists(job_dir):
             logger.warning(f"{job_dir} no longer exists!")
             logger.warning(f"direc is {job_dir}")
@@ -751,10 +859,25 @@ def check_has_opt(job_path: str, subfile: str) -> bool:
      bool: True if the list contains all of POSCAR, POTCAR, INCAR, KPOINTS,
      and the subfile.
     """
-    files = os.listdir(job_path)
+    return has_opt_files(os.listdir(job_path), subfile)
+
+
+def has_opt_files(files: Iterable[str], subfile: str) -> bool:
+    """Checks if files contains the nessicary files for an optimization job
+
+    Used when the directory has already been listed, so it does not need to
+    be listed again
+    Args:
+     files: The names of everything in a directory
+     subfile: The name of the subfile for the current machine
+    Returns:
+     bool: True if files contains all of POSCAR, POTCAR, INCAR, KPOINTS,
+     and the subfile.
+    """
+    file_set = set(files)
     calc_files = ["POSCAR", "POTCAR", "INCAR", "KPOINTS", subfile]
     for target_file in calc_files:
-        if target_file not in files:
+        if target_file not in file_set:
             return False
     return True
 
@@ -766,19 +889,40 @@ def submit_queue(
         sub_queue: List[str],
         home: str,
         tacc_queue_sizes: List[int],
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
         database: Database,
         limit: bool,
+        snapshot: SchedulerSnapshot,
+        array: bool = False,
+        max_workers: int = constants.SUBMIT_WORKERS,
+        backend: Optional[scheduler.Scheduler] = None,
 ) -> None:
     """Sumbits the jobs to the quene of the machine
 
     When submitting to fri-halifax attempts to balance files based on how many jobs are in the quene
 
     When sumbitting to tacc  tires to derermine if it will hit the limit then sumbits the jobs
+
+    snapshot is the scheduler's queue, used to know how many jobs are in the
+    queue of this machine
+
+    If array is set, jobs submitted to this machine that share a subfile
+    template are submitted together as job arrays
+
+    Jobs are submitted by a SubmitPool of up to max_workers threads, so jobs
+    sent to the other machine are transferred while local jobs are submitted.
+    Once every transfer finished, the jobs sent to the other machine are
+    submitted there by a single RemoteBatch. The status of every job is set
+    once all of them have been submitted
+
+    Local jobs are submitted to backend, Slurm if it is not given. Jobs sent
+    to the other machine are always submitted with sbatch
     """
     logger = logging.getLogger()
+    if backend is None:
+        backend = scheduler.SlurmScheduler()
     if len(sub_queue) >= limit:
         logger.warning(
             f"Hit limit of {limit}, Will not submit any jobs. Submission quene was {len(sub_queue)} jobs in size"
@@ -787,105 +931,96 @@ def submit_queue(
     subfile = machine_file.get_subfile(machine)
     logger.debug("starting queue submit")
     cwd = os.getcwd()
-    if machine is Machine.FRI or machine is Machine.HALIFAX:  # fri-halifax
-        other_subfile = machine_file.get_subfile(Machine(1 - machine))
-
-        this_machine_job_count = len(
-            str(subprocess.run(["squeue"], capture_output=True).stdout).split(r"\n")
-        )
-        other_machine_job_count = 0
-        match ssh_config.config:
-            case "NoSSH":
-                other_machine_job_count = 0
-            case SshScp(ssh=ssh):
-                other_machine_job_count = int(ssh.run("squeue", hide=True).stdout)
-        diff_in_size = this_machine_job_count - other_machine_job_count
-        num_to_sub = len(sub_queue)
-        num_to_sub_there = num_to_sub / 2 + diff_in_size
-
-        if not balance:
-            num_to_sub_there = 0
-        elif ssh_config.config == "NoSSH":
-            num_to_sub_there = 0
-        elif num_to_sub_there < 0:
-            num_to_sub_there = 0
-        elif num_to_sub_there > num_to_sub:
-            num_to_sub_there = num_to_sub
-
-        logger.debug(
-            f"num to sub here is {str(num_to_sub - num_to_sub_there)} , num to sub there is {str(num_to_sub_there)}"
-        )
-
-        sub_queue_index = 0
-        while sub_queue_index < num_to_sub_there:
-            job_dir = sub_queue[sub_queue_index]
-            update_job.switch_subfile(job_dir, other_subfile, subfile, machine)
-            new_loc = home + constants.AUTOMAGIC_REMOTE_DIR + job_dir
-            machine_file.scp_put_dir(job_dir, new_loc, ssh_config)
-            ssh_config.ssh.run("cd " + new_loc + " && sbatch " + other_subfile)  # type: ignore
-            update_job.set_status_for_newly_submitted_job(
-                job_dir, Machine(1 - machine), dos_jobs, wav_jobs, opt_jobs, False
+    pool = SubmitPool(max_workers=max_workers)
+    remote_locs: Dict[str, str] = {}
+    other_subfile = ""
+    try:
+        if machine is Machine.FRI or machine is Machine.HALIFAX:  # fri-halifax
+            other_subfile = machine_file.get_subfile(Machine(1 - machine))
+
+            this_machine_job_count = len(snapshot.jobs)
+            other_machine_job_count = 0
+            match ssh_config.config:
+                case "NoSSH":
+                    other_machine_job_count = 0
+                case SshScp(pool=ssh_pool):
+                    # -r lists each array task on its own line, as the
+                    # snapshot of this machine does
+                    other_machine_job_count = len(
+                        ssh_pool.run("squeue -h -r").stdout.splitlines()
+                    )
+            diff_in_size = this_machine_job_count - other_machine_job_count
+            num_to_sub = len(sub_queue)
+            num_to_sub_there = num_to_sub / 2 + diff_in_size
+
+            if not balance:
+                num_to_sub_there = 0
+            elif ssh_config.config == "NoSSH":
+                num_to_sub_there = 0
+            elif num_to_sub_there < 0:
+                num_to_sub_there = 0
+            elif num_to_sub_there > num_to_sub:
+                num_to_sub_there = num_to_sub
+
+            logger.debug(
+                f"num to sub here is {str(num_to_sub - num_to_sub_there)} , num to sub there is {str(num_to_sub_there)}"
             )
-            sub_queue_index = sub_queue_index + 1
-
-        while sub_queue_index < num_to_sub:
-            job_dir = sub_queue[sub_queue_index]
-            os.chdir(job_dir)
-            sbatch_process = subprocess.run(["sbatch", os.path.join(job_dir, subfile)])
-            print(sbatch_process)
-            print(sbatch_process.returncode)
-            if sbatch_process.returncode != 0:
-                logger.warning(
-                    f"sbatch exited with error code {sbatch_process.returncode} for the job in {job_dir}. "
+
+            sub_queue_index = 0
+            while sub_queue_index < num_to_sub_there:
+                job_dir = sub_queue[sub_queue_index]
+                update_job.switch_subfile(job_dir, other_subfile, subfile, machine)
+                new_loc = home + constants.AUTOMAGIC_REMOTE_DIR + job_dir
+                remote_locs[job_dir] = new_loc
+                pool.submit(
+                    "remote",
+                    job_dir,
+                    Machine(1 - machine),
+                    functools.partial(_put_remote, job_dir, new_loc, ssh_config),
                 )
-            update_job.set_status_for_newly_submitted_job(
-                job_dir,
-                machine,
-                dos_jobs,
-                wav_jobs,
-                opt_jobs,
-                sbatch_process.returncode != 0,
-            )
-            sub_queue_index = sub_queue_index + 1
+                sub_queue_index = sub_queue_index + 1
+
+            local_job_dirs = sub_queue[sub_queue_index:num_to_sub]
+
+        else:  # tacc
+            num_to_sub = len(sub_queue)
+            logger.debug("num to submit is " + str(num_to_sub))
+            num_can_sub = [0, 0, 0]
+            total_free_spaces = 0
+            num_will_sub = [0, 0, 0]
+            # will_hit_limit = False
 
-    else:  # tacc
-        num_to_sub = len(sub_queue)
-        logger.debug("num to submit is " + str(num_to_sub))
-        num_can_sub = [0, 0, 0]
-        total_free_spaces = 0
-        num_will_sub = [0, 0, 0]
-        # will_hit_limit = False
-
-        for i in range(0, 3):
-            num_can_sub[i] = constants.TACC_QUEUE_MAXES[i] - tacc_queue_sizes[i]
-            total_free_spaces = total_free_spaces + num_can_sub[i]
-
-        if not balance:
-            total_free_spaces = num_can_sub[0]
-            num_can_sub[1] = 0
-            num_can_sub[2] = 0
-
-        if total_free_spaces < num_to_sub:
-            num_will_sub = num_can_sub
-            # will_hit_limit = True
-        else:
             for i in range(0, 3):
-                if total_free_spaces == 0:
-                    continue
-                num_will_sub[i] = round(num_can_sub[i] * num_to_sub / total_free_spaces)
-                num_to_sub = num_to_sub - num_will_sub[i]
-                total_free_spaces = total_free_spaces - num_can_sub[i]
-
-        sub_queue_index = 0
-        for i in range(0, 3):
-            for _ in range(0, num_will_sub[i]):
-                job_dir = sub_queue[sub_queue_index]
-                os.chdir(job_dir)
-                if i + 2 == machine:
-                    subprocess.call(
-                        ["sbatch", machine_file.get_subfile(Machine(i + 2))]
+                num_can_sub[i] = constants.TACC_QUEUE_MAXES[i] - tacc_queue_sizes[i]
+                total_free_spaces = total_free_spaces + num_can_sub[i]
+
+            if not balance:
+                total_free_spaces = num_can_sub[0]
+                num_can_sub[1] = 0
+                num_can_sub[2] = 0
+
+            if total_free_spaces < num_to_sub:
+                num_will_sub = num_can_sub
+                # will_hit_limit = True
+            else:
+                for i in range(0, 3):
+                    if total_free_spaces == 0:
+                        continue
+                    num_will_sub[i] = round(
+                        num_can_sub[i] * num_to_sub / total_free_spaces
                     )
-                else:
+                    num_to_sub = num_to_sub - num_will_sub[i]
+                    total_free_spaces = total_free_spaces - num_can_sub[i]
+
+            sub_queue_index = 0
+            local_job_dirs = []
+            for i in range(0, 3):
+                for _ in range(0, num_will_sub[i]):
+                    job_dir = sub_queue[sub_queue_index]
+                    sub_queue_index = sub_queue_index + 1
+                    if i + 2 == machine:
+                        local_job_dirs.append(job_dir)
+                        continue
                     update_job.switch_subfile(
                         job_dir,
                         machine_file.get_subfile(Machine(i + 2)),
@@ -895,11 +1030,147 @@ def submit_queue(
                     add_to_insta_submit(
                         job_dir, machine_file.get_machine_name(Machine(i + 2)), database
                     )
+                    update_job.set_status_for_newly_submitted_job(
+                        job_dir, Machine(i + 2), dos_jobs, wav_jobs, opt_jobs, False
+                    )
+
+        if array and backend.supports_arrays:
+            local_job_dirs = submit_arrays(
+                local_job_dirs,
+                machine,
+                subfile,
+                home,
+                opt_jobs,
+                dos_jobs,
+                wav_jobs,
+                backend,
+            )
+        for job_dir in local_job_dirs:
+            pool.submit(
+                "local",
+                job_dir,
+                machine,
+                functools.partial(backend.submit, job_dir, subfile),
+            )
+        results = pool.results()
+        sbatch_failed = _sbatch_remote(
+            {
+                job_dir: remote_locs[job_dir]
+                for job_dir, _, error in results
+                if job_dir in remote_locs and not error
+            },
+            other_subfile,
+            ssh_config,
+        )
+        for job_dir, job_machine, error in results:
+            update_job.set_status_for_newly_submitted_job(
+                job_dir,
+                job_machine,
+                dos_jobs,
+                wav_jobs,
+                opt_jobs,
+                error or sbatch_failed.get(job_dir, False),
+            )
+    finally:
+        pool.close()
+        os.chdir(cwd)
+
+
+def _put_remote(job_dir: str, new_loc: str, ssh_config: SSHConfig) -> bool:
+    """Copies the job in job_dir to new_loc on the other machine
+
+    Returns:
+        False, failing to copy raises instead"""
+    machine_file.scp_put_dir(job_dir, new_loc, ssh_config)
+    return False
+
+
+def _sbatch_remote(
+        new_locs: Dict[str, str], other_subfile: str, ssh_config: SSHConfig
+) -> Dict[str, bool]:
+    """Submits every job copied to the other machine with one RemoteBatch
+
+    Args:
+        new_locs: Where each job was copied to on the other machine, keyed
+            by its directory on this machine
+        other_subfile: The subfile the jobs are submitted with there
+        ssh_config: The connection to the other machine
+    Returns:
+        If sbatch failed, for every job in new_locs
+    """
+    logger = logging.getLogger()
+    if len(new_locs) == 0:
+        return {}
+    batch = RemoteBatch()
+    for new_loc in new_locs.values():
+        batch.add("cd " + shlex.quote(new_loc) + " && sbatch " + other_subfile)
+    try:
+        results = batch.run(ssh_config.config.pool)  # type: ignore
+    except Exception as e:
+        logger.warning(
+            f"Exception {e} occoured while submitting jobs on the other machine"
+        )
+        return {job_dir: True for job_dir in new_locs}
+    failed = {}
+    for job_dir, result in zip(new_locs, results):
+        if result.failed:
+            logger.warning(
+                f"sbatch exited with error code {result.return_code} for the job in {job_dir} on the other machine. "
+            )
+        failed[job_dir] = result.failed
+    return failed
+
+
+def submit_arrays(
+        job_dirs: List[str],
+        machine: Machine,
+        subfile: str,
+        home: str,
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
+        backend: Optional[scheduler.Scheduler] = None,
+) -> List[str]:
+    """Submits jobs that share a subfile template to machine as job arrays
+
+    Jobs are grouped by scheduler.array_template, and each group of more than
+    one job is submitted as job arrays of up to constants.ARRAY_MAX_SIZE jobs.
+    The status of every job in a job array is set as if it were submitted on
+    its own
+
+    Args:
+        job_dirs: The jobs to submit
+        machine: The machine the user is currenty logged into
+        subfile: The name of the subfile for machine
+        home: The home directory, job array manifests are kept in it
+        opt_jobs: The collection of all opt jobs known by automagican
+        dos_jobs: The collection of all dos jobs known by automagican
+        wav_jobs: The collection of all wav jobs known by automagican
+        backend: The scheduler to submit the job arrays to. Slurm if not given
+    Returns:
+        The jobs that were not submitted as part of a job array, and still
+        need to be submitted one by one
+    """
+    if backend is None:
+        backend = scheduler.SlurmScheduler()
+    array_dir = os.path.join(home, constants.ARRAY_DIR_NAME)
+    groups: Dict[Optional[str], List[str]] = {}
+    for job_dir in job_dirs:
+        template = scheduler.array_template(os.path.join(job_dir, subfile))
+        groups.setdefault(template, []).append(job_dir)
+    remaining: Set[str] = set()
+    for template, group in groups.items():
+        if template is None or len(group) < 2:
+            remaining.update(group)
+            continue
+        for start in range(0, len(group), constants.ARRAY_MAX_SIZE):
+            batch = group[start : start + constants.ARRAY_MAX_SIZE]
+            error = backend.submit_array(batch, template, array_dir) is None
+            for job_dir in batch:
                 update_job.set_status_for_newly_submitted_job(
-                    job_dir, Machine(i + 2), dos_jobs, wav_jobs, opt_jobs, False
+                    job_dir, machine, dos_jobs, wav_jobs, opt_jobs, error
                 )
-                sub_queue_index = sub_queue_index + 1
-    os.chdir(cwd)
+    return [job_dir for job_dir in job_dirs if job_dir in remaining]
 
 
 def add_to_insta_submit(job_dir: str, machine: str, database: Database) -> None:
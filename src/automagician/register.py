@@ -1,17 +1,30 @@
 import logging
 import os
 import re
-from typing import Dict, List, TextIO
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, MutableMapping, Optional, TextIO, Tuple
 
+import automagician.constants as constants
 import automagician.machine as machine_file
 import automagician.process_job as process_job
-from automagician.classes import DosJob, JobStatus, Machine, OptJob, SSHConfig, WavJob
+from automagician.classes import (
+    DirectoryScan,
+    DosJob,
+    JobStatus,
+    Machine,
+    OptJob,
+    SSHConfig,
+    WavJob,
+)
+from automagician.directory_index import DirectoryIndex, stat_or_none
+from automagician.fact_cache import FactCache
 
 
 def register(
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
         machine: Machine,
         clear_certificate: bool,
         home_dir: str,
@@ -21,6 +34,8 @@ def register(
         limit: int,
         sub_queue: List[str],
         hit_limit: bool,
+        directory_index: Optional[DirectoryIndex] = None,
+        fact_cache: Optional[FactCache] = None,
 ) -> None:
     """Adds jobs to opt_jobs, dos_jobs, and wav_jobs, and their associated queues.
 
@@ -31,7 +46,11 @@ def register(
     Processes the queues
 
     Args:
-      None
+      directory_index: If set, directories that have not changed since the
+        index last saw them are not listed again, and the index is updated
+        and saved with what was found
+      fact_cache: Facts about job files from previous runs, passed on to
+        process_opt
     Returns:
       None
     Changes:
@@ -48,41 +67,23 @@ def register(
     opt_queue = []
     dos_queue = []
     wav_queue = []
-    for job_dir, subdirs, files in os.walk(os.getcwd(), followlinks=True):
-        if exclude_regex(job_dir):
-            continue
-
-        job_dir = job_dir.strip("\n")
+    scans = scan_tree(os.getcwd(), subfile, directory_index=directory_index)
+    if directory_index is not None:
+        directory_index.forget_missing(os.getcwd(), (scan.path for scan in scans))
+        directory_index.save()
+    for scan in scans:
+        job_dir = sys.intern(scan.path.strip("\n"))
         logger.info(
             "Registrator looking at " + "\x1b[0;49;34m" + job_dir + "\x1b[0m"
         )  # Should show directory in blue text
 
-        has_dos = False
-        has_wav = False
-        exclude = False
-        if os.path.exists(os.path.join(job_dir, "automagic_note")):
-            with open(os.path.join(job_dir, "automagic_note"), "r") as f:
-                for line in f:
-                    if line == "dos\n":
-                        has_dos = True
-                        break
-                    elif line == "wav\n":
-                        has_wav = True
-                        break
-                    elif line == "exclude\n":
-                        exclude = True
-                        break
-
-        has_opt = process_job.check_has_opt(job_dir, subfile)
-        if not has_opt:
+        has_dos = scan.has_dos
+        has_wav = scan.has_wav
+        exclude = scan.exclude
+        if not scan.has_opt:
             continue
 
-        dirs_lowercase = {item.lower() for item in subdirs}
-        if (
-                ("band" in dirs_lowercase)
-                and ("ini" in dirs_lowercase)
-                and ("fin" in dirs_lowercase)
-        ):
+        if scan.is_neb:
             logger.debug("Found a NEB job bundle")
             NEB_paths_arr.append(job_dir)
             logger.info(f"NEB located at {job_dir}")
@@ -118,7 +119,155 @@ def register(
         limit=limit,
         sub_queue=sub_queue,
         hit_limit=hit_limit,
+        fact_cache=fact_cache,
+    )
+
+
+def read_automagic_note(note_path: str) -> Tuple[bool, bool, bool]:
+    """Reads an automagic_note, stopping at the first line that it understands
+
+    Args:
+        note_path: The path to the automagic_note
+    Returns:
+        A tuple of has_dos, has_wav, and exclude. At most one of these is True
+    """
+    has_dos = False
+    has_wav = False
+    exclude = False
+    with open(note_path, "r") as f:
+        for line in f:
+            if line == "dos\n":
+                has_dos = True
+                break
+            elif line == "wav\n":
+                has_wav = True
+                break
+            elif line == "exclude\n":
+                exclude = True
+                break
+    return has_dos, has_wav, exclude
+
+
+def scan_directory(
+        job_dir: str,
+        subfile: str,
+        directory_index: Optional[DirectoryIndex] = None,
+) -> DirectoryScan:
+    """Lists job_dir a single time and classifies it from that listing
+
+    The same listing is used to find the subdirectories to walk into, check
+    for the files needed by an optimization job, and check for an
+    automagic_note, so each directory costs one listing instead of three.
+
+    Args:
+        job_dir: The directory to list
+        subfile: The name of the subfile for the current machine
+        directory_index: If set, and job_dir has not changed since the index
+            recorded it, the recorded scan is returned without listing
+            job_dir. Otherwise the new scan is recorded in the index
+    Returns:
+        The classification of job_dir. If job_dir cannot be listed it is
+        treated as an empty directory, the same as os.walk does
+    """
+    logger = logging.getLogger()
+    dir_stat = None
+    if directory_index is not None:
+        # stat before listing, so a change made while listing is seen next time
+        dir_stat = stat_or_none(job_dir)
+        if dir_stat is not None:
+            recorded_scan = directory_index.lookup(job_dir, subfile, dir_stat)
+            if recorded_scan is not None:
+                return recorded_scan
+
+    files: List[str] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(job_dir) as entries:
+            for entry in entries:
+                files.append(entry.name)
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning(f"could not list {job_dir}: {e}")
+
+    has_dos = False
+    has_wav = False
+    exclude = False
+    note_stat = None
+    if "automagic_note" in files:
+        note_path = os.path.join(job_dir, "automagic_note")
+        if directory_index is not None:
+            note_stat = stat_or_none(note_path)
+        has_dos, has_wav, exclude = read_automagic_note(note_path)
+
+    dirs_lowercase = {item.lower() for item in subdirs}
+    scan = DirectoryScan(
+        path=job_dir,
+        subdirs=subdirs,
+        has_opt=process_job.has_opt_files(files, subfile),
+        is_neb=("band" in dirs_lowercase)
+        and ("ini" in dirs_lowercase)
+        and ("fin" in dirs_lowercase),
+        has_dos=has_dos,
+        has_wav=has_wav,
+        exclude=exclude,
     )
+    if directory_index is not None and dir_stat is not None:
+        directory_index.record(scan, subfile, dir_stat, note_stat)
+    return scan
+
+
+def scan_tree(
+        root: str,
+        subfile: str,
+        max_workers: int = constants.DISCOVERY_WORKERS,
+        directory_index: Optional[DirectoryIndex] = None,
+) -> List[DirectoryScan]:
+    """Lists every directory under root using a pool of threads
+
+    Directories matching exclude_regex are not listed, and neither is anything
+    under them, as every path under an excluded directory is also excluded.
+    Symbolic links to directories are followed.
+
+    Args:
+        root: The directory to start from
+        subfile: The name of the subfile for the current machine
+        max_workers: How many directories can be listed at the same time
+        directory_index: If set, used to skip listing directories that have
+            not changed since the last walk. See scan_directory
+    Returns:
+        The scan of every directory, in the same order os.walk would visit them
+    """
+    scans: Dict[str, DirectoryScan] = {}
+    level = [] if exclude_regex(root) else [root]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(level) > 0:
+            next_level = []
+            for scan in executor.map(
+                    lambda d: scan_directory(d, subfile, directory_index), level
+            ):
+                scans[scan.path] = scan
+                for subdir in scan.subdirs:
+                    child = os.path.join(scan.path, subdir)
+                    if not exclude_regex(child):
+                        next_level.append(child)
+            level = next_level
+
+    # Each level was listed together, so put the scans back in the top down
+    # order that os.walk uses. This keeps the order jobs are submitted in stable
+    ordered_scans = []
+    to_visit = [root]
+    while len(to_visit) > 0:
+        current = scans.get(to_visit.pop())
+        if current is None:
+            continue
+        ordered_scans.append(current)
+        for subdir in reversed(current.subdirs):
+            to_visit.append(os.path.join(current.path, subdir))
+    return ordered_scans
 
 
 def exclude_regex(job_dir: str) -> bool:
@@ -131,9 +280,9 @@ def process_queue(
         dos_queue: List[str],
         wav_queue: List[str],
         machine: Machine,
-        opt_jobs: Dict[str, OptJob],
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
         clear_certificate: bool,
         home_dir: str,
         ssh_config: SSHConfig,
@@ -142,6 +291,7 @@ def process_queue(
         limit: int,
         sub_queue: List[str],
         hit_limit: bool,
+        fact_cache: Optional[FactCache] = None,
 ) -> None:
     """Processes the jobs in each of the quenes, updates opt jobs if the job was no longer found in the correct directory
 
@@ -164,6 +314,7 @@ def process_queue(
                 limit=limit,
                 sub_queue=sub_queue,
                 hit_limit=hit_limit,
+                fact_cache=fact_cache,
             )
         else:
             logger.warning(f"job is no longer found at {job_dir}")
@@ -0,0 +1,510 @@
+import logging
+import os
+import re
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Protocol
+
+import automagician.constants as constants
+from automagician.classes import SchedulerJob, SchedulerSnapshot
+
+
+class Scheduler(Protocol):
+    """Something jobs can be submitted to, like slurm
+
+    Attributes:
+        name: The name used to choose the scheduler, ex "slurm"
+        error_states: The short state codes of jobs that have failed
+        supports_arrays: If submit_array can be used
+    """
+
+    name: str
+    error_states: List[str]
+    supports_arrays: bool
+
+    def snapshot(self, array_dir: Optional[str] = None) -> SchedulerSnapshot:
+        """Reads every job in the queue, see take_snapshot"""
+        ...
+
+    def submit(self, job_dir: str, subfile: str) -> bool:
+        """Submits the job in job_dir, returning True if submitting failed"""
+        ...
+
+    def submit_array(
+            self, job_dirs: List[str], template: str, array_dir: str
+    ) -> Optional[str]:
+        """Submits jobs as a job array, see submit_array"""
+        ...
+
+    def cancel(self, job_ids: List[str]) -> Dict[str, bool]:
+        """Cancels jobs, returning if each one was cancelled keyed by job id"""
+        ...
+
+
+def take_snapshot(array_dir: Optional[str] = None) -> SchedulerSnapshot:
+    """Reads every job in the queue with a single call to squeue
+
+    Each task of a job array is listed as its own job. If array_dir is given,
+    tasks of job arrays automagician submitted have their work_dir set to
+    the job directory they run in, and the manifests of job arrays that are
+    no longer in the queue are removed
+
+    Args:
+        array_dir: The directory job array manifests are kept in
+    Returns:
+        The jobs in the queue, from every user, and the current user"""
+    logger = logging.getLogger()
+    output = subprocess.run(
+        ["squeue", "-h", "-r", "-o", constants.SQUEUE_FORMAT],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    jobs = parse_squeue(output)
+    logger.debug(f"{len(jobs)} jobs in the queue")
+    if array_dir is not None:
+        map_array_tasks(jobs, array_dir)
+    return SchedulerSnapshot(jobs=jobs, user=os.environ["USER"])
+
+
+def parse_squeue(output: str) -> List[SchedulerJob]:
+    """Parses the output of squeue run with constants.SQUEUE_FORMAT and no header
+
+    Args:
+        output: What squeue printed
+    Returns:
+        A SchedulerJob for each line of output"""
+    jobs = []
+    for line in output.splitlines():
+        if line.strip() == "":
+            continue
+        fields = [field.strip() for field in line.split("|", 6)]
+        job_id, state, partition, user, array_job_id, array_task, work_dir = fields
+        array_task_id = int(array_task) if array_task.isdigit() else None
+        if array_task_id is not None:
+            # The task's own id is not known until it starts, this always is
+            job_id = f"{array_job_id}_{array_task_id}"
+        jobs.append(
+            SchedulerJob(
+                job_id=job_id,
+                state=state,
+                partition=partition,
+                user=user,
+                work_dir=work_dir,
+                array_job_id=array_job_id,
+                array_task_id=array_task_id,
+            )
+        )
+    return jobs
+
+
+def map_array_tasks(jobs: List[SchedulerJob], array_dir: str) -> None:
+    """Sets the work_dir of job array tasks to the job directory they run in
+
+    Only job arrays with a manifest in array_dir are changed. The manifests of
+    job arrays not in jobs are removed, along with the script and output of
+    the job array
+
+    Args:
+        jobs: Every job in the queue
+        array_dir: The directory job array manifests are kept in
+    """
+    if not os.path.isdir(array_dir):
+        return
+    manifests: Dict[str, Optional[List[str]]] = {}
+    for job in jobs:
+        if job.array_task_id is None:
+            continue
+        if job.array_job_id not in manifests:
+            manifests[job.array_job_id] = read_array_manifest(
+                array_dir, job.array_job_id
+            )
+        manifest = manifests[job.array_job_id]
+        if manifest is not None and job.array_task_id < len(manifest):
+            job.work_dir = manifest[job.array_task_id]
+    for name in os.listdir(array_dir):
+        if not name.endswith(".manifest"):
+            continue
+        array_job_id = name[: -len(".manifest")]
+        if array_job_id not in manifests:
+            _remove_array_files(array_dir, array_job_id)
+
+
+def read_array_manifest(array_dir: str, array_job_id: str) -> Optional[List[str]]:
+    """Reads which job directory each task of a job array runs in
+
+    Args:
+        array_dir: The directory job array manifests are kept in
+        array_job_id: The id of the job array
+    Returns:
+        The job directory of each task, in task order, or None if
+        automagician did not submit the job array"""
+    try:
+        with open(os.path.join(array_dir, array_job_id + ".manifest"), "r") as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_array_files(array_dir: str, array_job_id: str) -> None:
+    """Removes the manifest, script and output of a job array"""
+    link = os.path.join(array_dir, array_job_id + ".manifest")
+    manifest = os.path.realpath(link)
+    paths = [link, manifest, os.path.splitext(manifest)[0] + ".sub"]
+    paths += [
+        os.path.join(array_dir, name)
+        for name in os.listdir(array_dir)
+        if name.startswith(array_job_id + "_") and name.endswith(".out")
+    ]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_user_jobs(snapshot: SchedulerSnapshot) -> List[SchedulerJob]:
+    """Returns the jobs in snapshot that were submitted by the current user"""
+    return [job for job in snapshot.jobs if job.user == snapshot.user]
+
+
+def cancel_jobs(job_ids: List[str]) -> Dict[str, bool]:
+    """Cancels jobs, giving scancel up to constants.SCANCEL_BATCH_SIZE ids at a time
+
+    Args:
+        job_ids: The ids of the jobs to cancel
+    Returns:
+        If each job was cancelled, keyed by job id. A job that scancel
+        reported an error for was not cancelled"""
+    logger = logging.getLogger()
+    cancelled: Dict[str, bool] = {}
+    for start in range(0, len(job_ids), constants.SCANCEL_BATCH_SIZE):
+        batch = job_ids[start : start + constants.SCANCEL_BATCH_SIZE]
+        process = subprocess.run(["scancel", *batch], capture_output=True, text=True)
+        failed = set(re.findall(r"job id (\S+?):", process.stderr))
+        if process.returncode != 0 and len(failed) == 0:
+            failed = set(batch)
+        for job_id in batch:
+            cancelled[job_id] = job_id not in failed
+            if cancelled[job_id]:
+                logger.info(f"cancelled job id={job_id}")
+            else:
+                logger.warning(f"could not cancel job id={job_id}")
+    return cancelled
+
+
+def submit_job(job_dir: str, subfile: str) -> bool:
+    """Submits the job in job_dir with sbatch, from job_dir
+
+    Returns:
+        True if sbatch failed"""
+    logger = logging.getLogger()
+    sbatch_process = subprocess.run(
+        ["sbatch", os.path.join(job_dir, subfile)], cwd=job_dir
+    )
+    logger.debug(f"{sbatch_process}")
+    if sbatch_process.returncode != 0:
+        logger.warning(
+            f"sbatch exited with error code {sbatch_process.returncode} for the job in {job_dir}. "
+        )
+    return sbatch_process.returncode != 0
+
+
+def _directive_value(line: str, short: str, long: str) -> Optional[str]:
+    """Returns the value of an #SBATCH option in line, or None if it is not set
+
+    Args:
+        line: A line of a subfile
+        short: The short form of the option, ex "-o"
+        long: The long form of the option, ex "--output"
+    """
+    parts = line.split()
+    if len(parts) < 2 or parts[0] != "#SBATCH":
+        return None
+    if parts[1].startswith(long + "="):
+        return parts[1][len(long) + 1 :]
+    if parts[1] in (short, long) and len(parts) > 2:
+        return parts[2]
+    return None
+
+
+def array_template(subfile_path: str) -> Optional[str]:
+    """Returns what a subfile has in common with copies for other jobs
+
+    Every job has its own copy of the subfile, which only differs from the
+    others by the job name. Jobs with the same template can be submitted as
+    one job array
+
+    Args:
+        subfile_path: The path to the subfile
+    Returns:
+        The subfile without the job name, or None if the subfile cannot be
+        run as part of a job array. This happens if it does not exist, or
+        its output file name uses a replacement symbol, ex %j
+    """
+    try:
+        with open(subfile_path, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    template = []
+    for line in lines:
+        if _directive_value(line, "-J", "--job-name") is not None:
+            continue
+        for short, long in (("-o", "--output"), ("-e", "--error")):
+            value = _directive_value(line, short, long)
+            if value is not None and "%" in value:
+                return None
+        template.append(line)
+    return "".join(template)
+
+
+def write_array_script(template: str, manifest_path: str, script_path: str) -> None:
+    """Writes a subfile that runs template in the job directory of each task
+
+    The directory of each task is read from its line of the manifest. Output
+    is written to the file the template names, inside the job directory, as
+    it would be if the template were submitted from the job directory
+
+    Args:
+        template: The subfile template shared by every job in the array
+        manifest_path: The path to the manifest of the job array
+        script_path: Where to write the subfile
+    """
+    array_dir = os.path.dirname(manifest_path)
+    header: List[str] = []
+    body: List[str] = []
+    output = None
+    error = None
+    for line in template.splitlines(keepends=True):
+        if len(body) > 0 or not (line.startswith("#") or line.strip() == ""):
+            body.append(line)
+            continue
+        output_value = _directive_value(line, "-o", "--output")
+        error_value = _directive_value(line, "-e", "--error")
+        if output_value is not None:
+            output = output_value
+        elif error_value is not None:
+            error = error_value
+        else:
+            header.append(line)
+    while len(header) > 0 and header[-1].strip() == "":
+        header.pop()
+    header.append("#SBATCH -J AM_array\n")
+    header.append(f"#SBATCH --output={os.path.join(array_dir, '%A_%a.out')}\n")
+    setup = [
+        f'cd "$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "{manifest_path}")" || exit 1\n'
+    ]
+    if output is not None and error is not None and output != error:
+        setup.append(f'exec >"{output}" 2>"{error}"\n')
+    elif output is not None or error is not None:
+        setup.append(f'exec >"{output or error}" 2>&1\n')
+    setup.append("\n")
+    with open(script_path, "w") as f:
+        f.writelines(header + setup + body)
+
+
+def submit_array(job_dirs: List[str], template: str, array_dir: str) -> Optional[str]:
+    """Submits jobs that share a subfile template as a single job array
+
+    A manifest holding the job directory of each task is written to
+    array_dir, and kept under the id of the job array so take_snapshot can
+    map each task back to its job directory
+
+    Args:
+        job_dirs: The job directories to submit, in task order
+        template: The subfile template shared by every job, from array_template
+        array_dir: The directory to keep the manifest, script and output in
+    Returns:
+        The id of the job array, or None if sbatch failed
+    """
+    logger = logging.getLogger()
+    os.makedirs(array_dir, exist_ok=True)
+    fd, manifest_path = tempfile.mkstemp(
+        suffix=".txt", prefix="array_", dir=array_dir, text=True
+    )
+    with os.fdopen(fd, "w") as manifest:
+        manifest.writelines(job_dir + "\n" for job_dir in job_dirs)
+    script_path = os.path.splitext(manifest_path)[0] + ".sub"
+    write_array_script(template, manifest_path, script_path)
+    process = subprocess.run(
+        [
+            "sbatch",
+            "--parsable",
+            f"--array=0-{len(job_dirs) - 1}",
+            f"--chdir={array_dir}",
+            script_path,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        logger.warning(
+            f"sbatch exited with error code {process.returncode} for a job array of {len(job_dirs)} jobs: {process.stderr.strip()}"
+        )
+        os.remove(manifest_path)
+        os.remove(script_path)
+        return None
+    array_job_id = process.stdout.strip().split(";")[0]
+    os.symlink(manifest_path, os.path.join(array_dir, array_job_id + ".manifest"))
+    logger.info(f"submitted job array id={array_job_id} of {len(job_dirs)} jobs")
+    return array_job_id
+
+
+class SlurmScheduler:
+    """Submits jobs to slurm with squeue, sbatch and scancel"""
+
+    name = "slurm"
+    error_states = constants.SLURM_ERROR_STATES
+    supports_arrays = True
+
+    def snapshot(self, array_dir: Optional[str] = None) -> SchedulerSnapshot:
+        return take_snapshot(array_dir)
+
+    def submit(self, job_dir: str, subfile: str) -> bool:
+        return submit_job(job_dir, subfile)
+
+    def submit_array(
+            self, job_dirs: List[str], template: str, array_dir: str
+    ) -> Optional[str]:
+        return submit_array(job_dirs, template, array_dir)
+
+    def cancel(self, job_ids: List[str]) -> Dict[str, bool]:
+        return cancel_jobs(job_ids)
+
+
+class SgeScheduler:
+    """Submits jobs to Sun Grid Engine with qstat, qsub and qdel
+
+    This is the scheduler automagician used before slurm. Job arrays are not
+    supported
+    """
+
+    name = "sge"
+    error_states = constants.SGE_ERROR_STATES
+    supports_arrays = False
+
+    def snapshot(self, array_dir: Optional[str] = None) -> SchedulerSnapshot:
+        """Reads every job in the queue with qstat
+
+        qstat does not list the directory of jobs, so a second qstat reads
+        the details of every job at once
+
+        Args:
+            array_dir: Unused, as job arrays are not supported
+        Returns:
+            The jobs in the queue, from every user, and the current user"""
+        logger = logging.getLogger()
+        queue = subprocess.run(
+            ["qstat", "-u", "*"], capture_output=True, text=True, check=True
+        ).stdout
+        details = subprocess.run(
+            ["qstat", "-j", "*"], capture_output=True, text=True
+        ).stdout
+        jobs = parse_qstat(queue, parse_qstat_workdirs(details))
+        logger.debug(f"{len(jobs)} jobs in the queue")
+        return SchedulerSnapshot(jobs=jobs, user=os.environ["USER"])
+
+    def submit(self, job_dir: str, subfile: str) -> bool:
+        logger = logging.getLogger()
+        qsub_process = subprocess.run(
+            ["qsub", os.path.join(job_dir, subfile)], cwd=job_dir
+        )
+        if qsub_process.returncode != 0:
+            logger.warning(
+                f"qsub exited with error code {qsub_process.returncode} for the job in {job_dir}. "
+            )
+        return qsub_process.returncode != 0
+
+    def submit_array(
+            self, job_dirs: List[str], template: str, array_dir: str
+    ) -> Optional[str]:
+        return None
+
+    def cancel(self, job_ids: List[str]) -> Dict[str, bool]:
+        """Cancels jobs, giving qdel up to constants.SCANCEL_BATCH_SIZE ids at a time
+
+        qdel does not say which job it could not cancel, so if it fails every
+        job in the batch is counted as not cancelled"""
+        logger = logging.getLogger()
+        cancelled: Dict[str, bool] = {}
+        for start in range(0, len(job_ids), constants.SCANCEL_BATCH_SIZE):
+            batch = job_ids[start : start + constants.SCANCEL_BATCH_SIZE]
+            process = subprocess.run(["qdel", *batch], capture_output=True, text=True)
+            for job_id in batch:
+                cancelled[job_id] = process.returncode == 0
+                if cancelled[job_id]:
+                    logger.info(f"cancelled job id={job_id}")
+                else:
+                    logger.warning(f"could not cancel job id={job_id}")
+        return cancelled
+
+
+def parse_qstat(output: str, workdirs: Dict[str, str]) -> List[SchedulerJob]:
+    """Parses the output of qstat
+
+    Args:
+        output: What qstat printed, including its two header lines
+        workdirs: The directory each job was submitted from, keyed by job id.
+            Jobs not in it have a work_dir of constants.INVALID_DIR
+    Returns:
+        A SchedulerJob for each job. The partition is the queue a running job
+        is in, or "" for a job that is waiting
+    """
+    jobs = []
+    for line in output.splitlines()[2:]:
+        parts = line.split()
+        if len(parts) < 5:
+            continue
+        job_id = parts[0]
+        # Waiting jobs have no queue, so have one less column
+        queue = parts[7] if len(parts) >= 9 else ""
+        jobs.append(
+            SchedulerJob(
+                job_id=job_id,
+                state=parts[4],
+                partition=queue.split("@")[0],
+                user=parts[3],
+                work_dir=workdirs.get(job_id, constants.INVALID_DIR),
+                array_job_id=job_id,
+            )
+        )
+    return jobs
+
+
+def parse_qstat_workdirs(output: str) -> Dict[str, str]:
+    """Reads the directory each job was submitted from out of qstat -j
+
+    Args:
+        output: What qstat -j printed
+    Returns:
+        The directory each job was submitted from, keyed by job id
+    """
+    workdirs: Dict[str, str] = {}
+    job_id = None
+    for line in output.splitlines():
+        key, _, value = line.partition(":")
+        if key == "job_number":
+            job_id = value.strip()
+        elif key == "sge_o_workdir" and job_id is not None:
+            workdirs[job_id] = value.strip()
+    return workdirs
+
+
+def get_scheduler(name: str) -> Scheduler:
+    """Returns the scheduler with the given name, "slurm", "sge" or "simulated"
+
+    The simulated scheduler is only imported when it is asked for, as it is
+    meant for tests and benchmarks
+
+    Raises:
+        ValueError: If there is not a scheduler with that name"""
+    if name == "slurm":
+        return SlurmScheduler()
+    if name == "sge":
+        return SgeScheduler()
+    if name == "simulated":
+        from automagician.simulated_scheduler import SimulatedScheduler
+
+        return SimulatedScheduler()
+    raise ValueError(f"unknown scheduler {name}")
@@ -0,0 +1,124 @@
+import dataclasses
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import automagician.constants as constants
+from automagician.classes import SchedulerJob, SchedulerSnapshot
+
+
+class SimulatedScheduler:
+    """A scheduler kept in memory, used to test and benchmark automagician offline
+
+    Nothing is run. Submitted jobs wait in the queue until they are changed
+    with set_state or taken out with finish. Every call sleeps for a
+    configurable latency first, to stand in for the time a real scheduler
+    takes to answer. Jobs can be submitted from several threads at once.
+
+    Attributes:
+        user: The user every job is submitted as
+        query_latency: Seconds snapshot takes
+        submit_latency: Seconds submit and submit_array take
+        cancel_latency: Seconds cancel takes
+        fail_dirs: Job directories that fail to be submitted
+        jobs: Every job in the queue, keyed by job id
+    """
+
+    name = "simulated"
+    error_states = constants.SLURM_ERROR_STATES
+    supports_arrays = True
+
+    user: str
+    query_latency: float
+    submit_latency: float
+    cancel_latency: float
+    fail_dirs: List[str]
+    jobs: Dict[str, SchedulerJob]
+
+    def __init__(
+            self,
+            user: Optional[str] = None,
+            query_latency: float = 0.0,
+            submit_latency: float = 0.0,
+            cancel_latency: float = 0.0,
+            fail_dirs: Optional[List[str]] = None,
+    ):
+        self.user = user if user is not None else os.environ["USER"]
+        self.query_latency = query_latency
+        self.submit_latency = submit_latency
+        self.cancel_latency = cancel_latency
+        self.fail_dirs = fail_dirs if fail_dirs is not None else []
+        self.jobs = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def snapshot(self, array_dir: Optional[str] = None) -> SchedulerSnapshot:
+        """Returns a copy of the queue
+
+        Args:
+            array_dir: Unused, job array tasks already know their job directory
+        """
+        time.sleep(self.query_latency)
+        with self._lock:
+            jobs = [dataclasses.replace(job) for job in self.jobs.values()]
+        return SchedulerSnapshot(jobs=jobs, user=self.user)
+
+    def submit(self, job_dir: str, subfile: str) -> bool:
+        time.sleep(self.submit_latency)
+        if job_dir in self.fail_dirs:
+            return True
+        with self._lock:
+            job_id = self._take_id()
+            self.jobs[job_id] = SchedulerJob(
+                job_id=job_id,
+                state="PD",
+                partition="simulated",
+                user=self.user,
+                work_dir=job_dir,
+                array_job_id=job_id,
+            )
+        return False
+
+    def submit_array(
+            self, job_dirs: List[str], template: str, array_dir: str
+    ) -> Optional[str]:
+        time.sleep(self.submit_latency)
+        if any(job_dir in self.fail_dirs for job_dir in job_dirs):
+            return None
+        with self._lock:
+            array_job_id = self._take_id()
+            for task_id, job_dir in enumerate(job_dirs):
+                job_id = f"{array_job_id}_{task_id}"
+                self.jobs[job_id] = SchedulerJob(
+                    job_id=job_id,
+                    state="PD",
+                    partition="simulated",
+                    user=self.user,
+                    work_dir=job_dir,
+                    array_job_id=array_job_id,
+                    array_task_id=task_id,
+                )
+        return array_job_id
+
+    def cancel(self, job_ids: List[str]) -> Dict[str, bool]:
+        time.sleep(self.cancel_latency)
+        with self._lock:
+            return {
+                job_id: self.jobs.pop(job_id, None) is not None for job_id in job_ids
+            }
+
+    def set_state(self, job_id: str, state: str) -> None:
+        """Sets the state of a job in the queue, ex "R" or "F" """
+        with self._lock:
+            self.jobs[job_id].state = state
+
+    def finish(self, job_id: str) -> None:
+        """Takes a job out of the queue, as if it ended"""
+        with self._lock:
+            del self.jobs[job_id]
+
+    def _take_id(self) -> str:
+        job_id = str(self._next_id)
+        self._next_id += 1
+        return job_id
@@ -0,0 +1,241 @@
+import contextlib
+import logging
+import secrets
+import threading
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional
+
+import automagician.constants as constants
+
+try:
+    from paramiko.ssh_exception import SSHException  # type: ignore
+except ImportError:
+    SSHException = OSError
+
+
+@dataclass
+class RemoteResult:
+    """What a command run by SshPool.run printed and exited with"""
+
+    command: str
+    return_code: int
+    stdout: str
+    stderr: str
+
+    @property
+    def ok(self) -> bool:
+        return self.return_code == 0
+
+    @property
+    def failed(self) -> bool:
+        return self.return_code != 0
+
+
+class SshPool:
+    """Runs commands on another machine over channels of one SSH connection
+
+    The connection is authenticated once, and every command gets its own
+    channel on it, so commands from several threads run at the same time
+    without paying for a new handshake each. At most max_channels channels
+    are open at once, the rest wait for one to close. Keepalives are sent
+    on the connection so it is not dropped while idle. If the connection
+    has died, it is opened again the next time a channel is needed.
+
+    Attributes:
+        connection: The fabric Connection to the other machine. Only its
+            open, close and client.get_transport are used
+        max_channels: The most channels open at the same time. sshd refuses
+            more than MaxSessions, 10 by default
+        keepalive: Seconds between keepalives, 0 to not send any
+        retries: How many times opening a channel is tried again on a new
+            connection before giving up
+    """
+
+    connection: Any
+    max_channels: int
+    keepalive: int
+    retries: int
+
+    def __init__(
+            self,
+            connection: Any,
+            max_channels: int = constants.SSH_MAX_CHANNELS,
+            keepalive: int = constants.SSH_KEEPALIVE_SECONDS,
+            retries: int = constants.SSH_RETRIES,
+    ):
+        self.connection = connection
+        self.max_channels = max_channels
+        self.keepalive = keepalive
+        self.retries = retries
+        self._slots = threading.BoundedSemaphore(max_channels)
+        self._lock = threading.Lock()
+        self._transport: Optional[Any] = None
+
+    def _get_transport(self) -> Any:
+        """Returns the transport of the connection, connecting again if it died"""
+        with self._lock:
+            if self._transport is not None and self._transport.is_active():
+                return self._transport
+            if self._transport is not None:
+                logging.getLogger().warning("ssh connection lost, reconnecting")
+                self.connection.close()
+            self._transport = None
+            self.connection.open()
+            transport = self.connection.client.get_transport()
+            if self.keepalive > 0:
+                transport.set_keepalive(self.keepalive)
+            self._transport = transport
+            return transport
+
+    def _drop(self, transport: Any) -> None:
+        """Forgets transport so the next channel is opened on a new connection"""
+        with self._lock:
+            if self._transport is transport:
+                self.connection.close()
+                self._transport = None
+
+    def _open_channel(self) -> Any:
+        """Opens a new channel, reconnecting up to retries times if that fails
+
+        Raises:
+            SSHException, OSError or EOFError: If no channel could be opened
+        """
+        for attempt in range(self.retries + 1):
+            transport = None
+            try:
+                transport = self._get_transport()
+                return transport.open_session()
+            except (SSHException, OSError, EOFError) as e:
+                if attempt == self.retries:
+                    raise
+                logging.getLogger().warning(f"opening ssh channel failed: {e}")
+                self._drop(transport)
+        raise AssertionError("unreachable")
+
+    @contextlib.contextmanager
+    def session(self, command: str) -> Iterator[Any]:
+        """Runs command on a new channel, which is closed on leaving the block
+
+        Only opening the channel is retried. Once command has started it is
+        not run again if the connection drops, since it may not be safe to
+        run twice
+
+        Args:
+            command: The shell command to run on the other machine
+        Yields:
+            The paramiko Channel the command runs on
+        """
+        with self._slots:
+            channel = self._open_channel()
+            try:
+                channel.exec_command(command)
+                yield channel
+            finally:
+                channel.close()
+
+    def run(self, command: str, stdin: bytes = b"") -> RemoteResult:
+        """Runs command on the other machine and waits for it to finish
+
+        Args:
+            command: The shell command to run on the other machine
+            stdin: Sent to command before its input is closed
+        Returns:
+            The output and exit code of command. A command that fails is
+            not an error here, check RemoteResult.ok
+        """
+        with self.session(command) as channel:
+            if len(stdin) > 0:
+                channel.sendall(stdin)
+            channel.shutdown_write()
+            stdout = channel.makefile("rb").read()
+            stderr = channel.makefile_stderr("rb").read()
+            return_code = channel.recv_exit_status()
+        return RemoteResult(
+            command=command,
+            return_code=return_code,
+            stdout=stdout.decode(errors="replace"),
+            stderr=stderr.decode(errors="replace"),
+        )
+
+    def close(self) -> None:
+        """Closes the connection. Later commands open it again"""
+        with self._lock:
+            self.connection.close()
+            self._transport = None
+
+
+class RemoteBatch:
+    """Shell commands collected to be run on the other machine in one go
+
+    Every command added is run in order by a single sh over one channel, so
+    a phase of small commands costs one round trip instead of one each.
+    Each command runs in its own subshell with no input, and the ones after
+    it run whether it failed or not, so only add commands that do not
+    depend on an earlier one succeeding. Chain those with && in one command
+
+    Attributes:
+        commands: The shell commands to run, in order
+    """
+
+    commands: List[str]
+
+    def __init__(self) -> None:
+        self.commands = []
+
+    def add(self, command: str) -> int:
+        """Adds command to the batch
+
+        Returns:
+            The index of the result of command in the list run returns
+        """
+        self.commands.append(command)
+        return len(self.commands) - 1
+
+    def script(self, marker: str) -> str:
+        """Returns the sh script that runs every command
+
+        After each command marker and its exit code are printed to stdout,
+        and marker to stderr, between NULs, so the output of the commands
+        can be told apart
+        """
+        lines = []
+        for command in self.commands:
+            lines.append("(\n" + command + "\n) </dev/null")
+            lines.append(f"printf '\\0{marker} %d\\0' $?")
+            lines.append(f"printf '\\0{marker}\\0' >&2")
+        return "\n".join(lines) + "\n"
+
+    def run(self, pool: SshPool) -> List[RemoteResult]:
+        """Runs every command on the other machine over a single channel
+
+        Args:
+            pool: The connection to the other machine
+        Returns:
+            The result of each command, in the order they were added. If
+            the script stopped early, the commands that did not run have a
+            return code of -1
+        """
+        if len(self.commands) == 0:
+            return []
+        marker = "automagician_" + secrets.token_hex(8)
+        result = pool.run("sh -s", self.script(marker).encode())
+        stdouts = result.stdout.split(f"\0{marker} ")
+        stderrs = result.stderr.split(f"\0{marker}\0")
+        results = []
+        output = stdouts[0]
+        for i, command in enumerate(self.commands):
+            return_code = -1
+            next_output = ""
+            if i + 1 < len(stdouts):
+                code, _, next_output = stdouts[i + 1].partition("\0")
+                return_code = int(code)
+            results.append(
+                RemoteResult(
+                    command=command,
+                    return_code=return_code,
+                    stdout=output,
+                    stderr=stderrs[i] if i < len(stderrs) else "",
+                )
+            )
+            output = next_output
+        return results
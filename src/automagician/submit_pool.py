@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import automagician.constants as constants
+from automagician.classes import Machine
+
+
+class SubmitTarget:
+    """Limits how jobs are submitted to a single place, ex the local scheduler
+
+    Attributes:
+        slots: Held while a job is being submitted, so at most max_concurrent
+            jobs are submitted to this target at the same time
+        min_interval: The least amount of seconds between two submissions
+            starting
+    """
+
+    slots: threading.Semaphore
+    min_interval: float
+
+    def __init__(self, max_concurrent: int, min_interval: float):
+        self.slots = threading.Semaphore(max_concurrent)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_turn(self) -> None:
+        """Sleeps until a submission may start without passing min_interval"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class SubmitPool:
+    """Submits jobs on a pool of threads
+
+    Each submission is a function that submits a single job and returns if
+    submitting it failed. Submissions go to a target, with its own limit on
+    concurrent submissions and how quickly they can be started, so transfers
+    to another machine can overlap with local sbatch calls without flooding
+    either.
+
+    Submissions must not change the working directory, as every thread shares
+    it, and must not change job collections. results gives back what each
+    submission returned so the caller can update the jobs.
+
+    Attributes:
+        targets: The limits for each target, keyed by name
+    """
+
+    targets: Dict[str, SubmitTarget]
+
+    def __init__(
+            self,
+            max_workers: int = constants.SUBMIT_WORKERS,
+            target_limits: Dict[str, Tuple[int, float]] = constants.SUBMIT_TARGET_LIMITS,
+    ):
+        """Starts the pool
+
+        Args:
+            max_workers: How many jobs can be submitted at the same time, over
+                every target
+            target_limits: The most jobs submitted at the same time and the
+                least seconds between submissions starting, keyed by target
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.targets = {
+            name: SubmitTarget(max_concurrent, min_interval)
+            for name, (max_concurrent, min_interval) in target_limits.items()
+        }
+        self._pending: List[Tuple[str, Machine, Future[bool]]] = []
+
+    def submit(
+            self,
+            target: str,
+            job_dir: str,
+            job_machine: Machine,
+            submit: Callable[[], bool],
+    ) -> None:
+        """Queues a job to be submitted
+
+        Args:
+            target: The name of the target the job is submitted to
+            job_dir: The directory of the job
+            job_machine: The machine the job will run on
+            submit: Submits the job, returning True if it failed
+        """
+        limits = self.targets[target]
+
+        def run() -> bool:
+            with limits.slots:
+                limits.wait_turn()
+                return submit()
+
+        self._pending.append((job_dir, job_machine, self._executor.submit(run)))
+
+    def results(self) -> List[Tuple[str, Machine, bool]]:
+        """Waits for every queued job to be submitted
+
+        A submission that raised an exception is logged and counted as failed
+
+        Returns:
+            The directory, machine and if submitting failed for each job, in
+            the order they were queued
+        """
+        logger = logging.getLogger()
+        results = []
+        for job_dir, job_machine, future in self._pending:
+            try:
+                error = future.result()
+            except Exception as e:
+                logger.warning(f"could not submit the job in {job_dir}: {e}")
+                error = True
+            results.append((job_dir, job_machine, error))
+        self._pending = []
+        return results
+
+    def close(self) -> None:
+        """Waits for queued jobs and stops the threads of the pool"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,315 @@
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+from typing import IO, Any, Dict, List, Optional
+
+import automagician.constants as constants
+from automagician.classes import FileState
+from automagician.ssh_pool import SshPool
+
+TAR_COMPRESSION_FLAGS = {"none": [], "gzip": ["-z"], "zstd": ["--zstd"]}
+SYNC_STAGING_PREFIX = ".automagician_sync_"
+
+
+class TransferError(Exception):
+    """What happens if tar fails on either side of a transfer"""
+
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+def _tar_flags(compression: str) -> List[str]:
+    """Returns the flags tar needs to use compression, see TAR_COMPRESSION_FLAGS
+
+    Raises:
+        ValueError: If compression is not one of TAR_COMPRESSION_FLAGS"""
+    if compression not in TAR_COMPRESSION_FLAGS:
+        raise ValueError(f"unknown compression {compression}")
+    return TAR_COMPRESSION_FLAGS[compression]
+
+
+def _pump(source: IO[bytes], write: Any) -> None:
+    """Copies everything from source with write, in chunks of TRANSFER_CHUNK_SIZE"""
+    while True:
+        chunk = source.read(constants.TRANSFER_CHUNK_SIZE)
+        if not chunk:
+            return
+        write(chunk)
+
+
+def put_dir(
+        local: str,
+        remote: str,
+        pool: SshPool,
+        compression: str = constants.TRANSFER_COMPRESSION,
+) -> None:
+    """Copies everything inside local into remote, as a single tar stream
+
+    local is archived by tar and unpacked by tar on the remote machine, over
+    one SSH channel. Modification times are kept, so caches keyed on mtime
+    stay valid. remote is created if it does not exist
+
+    Args:
+        local: The directory on this machine to copy from
+        remote: The directory on the remote machine to copy into
+        pool: The ssh connection to the remote machine
+        compression: How the stream is compressed, a key of
+            TAR_COMPRESSION_FLAGS
+    Raises:
+        TransferError: If tar failed on either machine
+    """
+    logger = logging.getLogger()
+    flags = _tar_flags(compression)
+    quoted = shlex.quote(remote)
+    remote_command = " ".join(["mkdir -p", quoted, "&& tar -x", *flags, "-C", quoted])
+    with pool.session(remote_command) as channel:
+        archive = subprocess.Popen(
+            ["tar", "-c", *flags, "-C", local, "."],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        assert archive.stdout is not None and archive.stderr is not None
+        try:
+            _pump(archive.stdout, channel.sendall)
+        finally:
+            channel.shutdown_write()
+            archive.stdout.close()
+            local_status = archive.wait()
+            remote_status = channel.recv_exit_status()
+    if local_status != 0:
+        raise TransferError(
+            f"tar exited with {local_status} archiving {local}: "
+            + archive.stderr.read().decode(errors="replace")
+        )
+    if remote_status != 0:
+        raise TransferError(
+            f"remote tar exited with {remote_status} unpacking {remote}"
+        )
+    logger.debug(f"put {local} to {remote}")
+
+
+def get_dir(
+        remote: str,
+        local: str,
+        pool: SshPool,
+        compression: str = constants.TRANSFER_COMPRESSION,
+        paths: Optional[List[str]] = None,
+) -> None:
+    """Copies everything inside remote into local, as a single tar stream
+
+    The reverse of put_dir. local is created if it does not exist
+
+    Args:
+        remote: The directory on the remote machine to copy from
+        local: The directory on this machine to copy into
+        pool: The ssh connection to the remote machine
+        compression: How the stream is compressed, a key of
+            TAR_COMPRESSION_FLAGS
+        paths: If set, only these files are copied. Relative to remote
+    Raises:
+        TransferError: If tar failed on either machine
+    """
+    logger = logging.getLogger()
+    flags = _tar_flags(compression)
+    os.makedirs(local, exist_ok=True)
+    command = ["tar -c", *flags, "-C", shlex.quote(remote)]
+    command += ["."] if paths is None else ["--null -T -"]
+    with pool.session(" ".join(command)) as channel:
+        if paths is not None:
+            channel.sendall("".join(path + "\0" for path in paths).encode())
+        channel.shutdown_write()
+        unpack = subprocess.Popen(
+            ["tar", "-x", *flags, "-C", local],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        assert unpack.stdin is not None and unpack.stderr is not None
+        try:
+            _pump(channel.makefile("rb"), unpack.stdin.write)
+        finally:
+            unpack.stdin.close()
+            local_status = unpack.wait()
+            remote_status = channel.recv_exit_status()
+    if remote_status != 0:
+        raise TransferError(
+            f"remote tar exited with {remote_status} archiving {remote}"
+        )
+    if local_status != 0:
+        raise TransferError(
+            f"tar exited with {local_status} unpacking {local}: "
+            + unpack.stderr.read().decode(errors="replace")
+        )
+    logger.debug(f"got {remote} to {local}")
+
+
+def _run_remote(pool: SshPool, command: str, stdin: bytes = b"") -> bytes:
+    """Runs command on the remote machine, returning what it printed
+
+    Unlike SshPool.run the output is not decoded, so file names that are not
+    valid utf-8 survive
+
+    Raises:
+        TransferError: If command did not exit with 0"""
+    with pool.session(command) as channel:
+        channel.sendall(stdin)
+        channel.shutdown_write()
+        output: bytes = channel.makefile("rb").read()
+        status = channel.recv_exit_status()
+    if status != 0:
+        raise TransferError(f"{command} exited with {status}")
+    return output
+
+
+def read_remote_manifest(remote: str, pool: SshPool) -> Dict[str, FileState]:
+    """Lists every file under remote on the remote machine with one find
+
+    Args:
+        remote: The directory on the remote machine to list
+        pool: The ssh connection to the remote machine
+    Returns:
+        The size and mtime of every file, keyed by path relative to remote
+    """
+    output = _run_remote(
+        pool,
+        f"cd {shlex.quote(remote)} && find . -type f -printf '%P\\0%s\\0%T@\\0'",
+    )
+    fields = output.decode(errors="surrogateescape").split("\0")
+    manifest = {}
+    for i in range(0, len(fields) - 2, 3):
+        manifest[fields[i]] = FileState(
+            size=int(fields[i + 1]), mtime=int(float(fields[i + 2]))
+        )
+    return manifest
+
+
+def read_local_manifest(local: str) -> Dict[str, FileState]:
+    """Lists every file under local, like read_remote_manifest
+
+    Args:
+        local: The directory to list
+    Returns:
+        The size and mtime of every file, keyed by path relative to local
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(local):
+        dirs[:] = [d for d in dirs if not d.startswith(SYNC_STAGING_PREFIX)]
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.islink(path):
+                # find -type f skips symlinks on the remote machine too
+                continue
+            manifest[os.path.relpath(path, local)] = FileState(
+                size=stat.st_size, mtime=int(stat.st_mtime)
+            )
+    return manifest
+
+
+def _remote_hashes(remote: str, paths: List[str], pool: SshPool) -> Dict[str, str]:
+    """Returns the sha256 of each file in paths on the remote machine"""
+    if len(paths) == 0:
+        return {}
+    output = _run_remote(
+        pool,
+        f"cd {shlex.quote(remote)} && xargs -0 sha256sum --",
+        "".join(path + "\0" for path in paths).encode(),
+    )
+    hashes = {}
+    for line in output.decode(errors="surrogateescape").splitlines():
+        digest, _, path = line.partition("  ")
+        hashes[path] = digest
+    return hashes
+
+
+def _local_hash(path: str) -> str:
+    """Returns the sha256 of the file at path"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(constants.TRANSFER_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def sync_dir(
+        remote: str,
+        local: str,
+        pool: SshPool,
+        use_hash: bool = constants.SYNC_USE_HASH,
+        compression: str = constants.TRANSFER_COMPRESSION,
+) -> List[str]:
+    """Makes local a copy of remote, copying only files that changed
+
+    A file is copied if it is not in local, or its size or mtime differ. If
+    use_hash is set, files with the same size but a different mtime are
+    only copied if their sha256 differs too. Changed files are unpacked
+    into a staging directory next to local, and only moved into local once
+    every one of them arrived, so a failed transfer leaves local as it was.
+    Files in local that are not in remote are then removed
+
+    Args:
+        remote: The directory on the remote machine to copy from
+        local: The directory on this machine to make a copy of it
+        pool: The ssh connection to the remote machine
+        use_hash: If files whose mtime changed are compared by content
+        compression: How the stream is compressed, a key of
+            TAR_COMPRESSION_FLAGS
+    Returns:
+        The files that were copied, relative to local
+    Raises:
+        TransferError: If listing or copying the files failed. local is not
+            changed when this is raised
+    """
+    logger = logging.getLogger()
+    remote_manifest = read_remote_manifest(remote, pool)
+    local_manifest = read_local_manifest(local)
+    changed = []
+    maybe_same = []
+    for path, state in remote_manifest.items():
+        local_state = local_manifest.get(path)
+        if local_state is None or local_state.size != state.size:
+            changed.append(path)
+        elif local_state.mtime != state.mtime:
+            maybe_same.append(path)
+    if use_hash:
+        remote_hashes = _remote_hashes(remote, maybe_same, pool)
+        for path in maybe_same:
+            if remote_hashes.get(path) != _local_hash(os.path.join(local, path)):
+                changed.append(path)
+            else:
+                os.utime(
+                    os.path.join(local, path),
+                    (remote_manifest[path].mtime, remote_manifest[path].mtime),
+                )
+    else:
+        changed += maybe_same
+
+    os.makedirs(local, exist_ok=True)
+    if len(changed) > 0:
+        staging = tempfile.mkdtemp(
+            prefix=SYNC_STAGING_PREFIX, dir=os.path.dirname(os.path.normpath(local))
+        )
+        try:
+            get_dir(remote, staging, pool, compression, changed)
+            for path in changed:
+                destination = os.path.join(local, path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(os.path.join(staging, path), destination)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    for path in local_manifest:
+        if path not in remote_manifest:
+            os.remove(os.path.join(local, path))
+    logger.debug(
+        f"synced {remote} to {local}, copied {len(changed)} of "
+        f"{len(remote_manifest)} files"
+    )
+    return changed
@@ -5,12 +5,14 @@ import re
 import subprocess
 import traceback
 from os.path import exists
-from typing import Dict, Optional, TextIO
+from typing import Dict, List, MutableMapping, Optional, TextIO
 
 import automagician.constants as constants
 import automagician.finish_job as finish_job
+import automagician.output_scan as output_scan
 import automagician.process_job as process_job
-from automagician.classes import DosJob, JobStatus, Machine, OptJob, WavJob
+import automagician.transfer as transfer
+from automagician.classes import DosJob, JobStatus, LlOutScan, Machine, OptJob, WavJob
 
 try:
     from automagician.classes import SshScp
@@ -19,16 +21,13 @@ try:
     def scp_get_dir(remote: str, local: str, ssh_scp: SshScp) -> None:
         """Puts files inside the remote directory to the local directory
 
+        Everything is sent as a single tar stream, see transfer.get_dir
+
         Args:
         remote (str): the directory on the remote machine to transfer files from
         local (str): the directory on the local machine to transfer files to
         """
-        for f in ssh_scp.ssh.run(
-                "cd " + remote + "; find . -type f | cut -c 2-"
-        ).stdout.split("\n"):
-            if len(f) < 1:
-                continue
-            ssh_scp.scp.get(remote + f, local + f)
+        transfer.get_dir(remote, local, ssh_scp.pool)
 
 except ImportError:
     pass
@@ -47,12 +46,16 @@ def add_preliminary_results(
 
 
 # generate a permanent error log
-def log_error(job_directory: str, home: str) -> None:
+def log_error(
+        job_directory: str, home: str, ll_out_scan: Optional[LlOutScan] = None
+) -> None:
     """Writes error messages in the job directory to error_log.dat. Appends
 
     Args:
       job_directory (str): A path to the directory that contains a job which has an error
       home (str): The home of the user
+      ll_out_scan (LlOutScan): A scan of the ll_out in job_directory. If None,
+        ll_out is scanned
     Returns:
       None
     Changes:
@@ -70,44 +73,44 @@ def log_error(job_directory: str, home: str) -> None:
 
     # TODO: verify that this change doesn't
     with open(os.path.join(home, "error_log.dat"), "a+") as error_log:
-        for error_message in get_error_message(job_directory):
+        for error_message in get_error_message(job_directory, ll_out_scan):
             error_log.write(
                 f"{str(datetime.datetime.now())} {job_directory} {error_message} \n"
             )
 
 
-def get_error_message(job_directory: str) -> list[str]:
+def get_error_message(
+        job_directory: str, ll_out_scan: Optional[LlOutScan] = None
+) -> List[str]:
     """Gets the error message from ll_out and returns all found
     Args:
       job_directory (str): A path to the directory that contains a job which has an error
+      ll_out_scan (LlOutScan): A scan of the ll_out in job_directory. Its
+        messages are used if it found an error, otherwise ll_out is read
     Returns:
-      list(str): A list of error messages found. If none were found, contains a single str
-      saying "message not found"
-    Changes:
-      Changes current working direcctory to job_directory"""
-    ll_out = open(os.path.join(job_directory, "ll_out"), "r")
-    messages = []
-    for line in ll_out:
-        if ("ERROR" in line) or ("error" in line):
-            messages.append(line.strip("| \n"))
+      list(str): A list of error messages found. Empty if none were found"""
+    if ll_out_scan is not None and ll_out_scan.has_error:
+        return ll_out_scan.error_messages
     # if len(messages) == 0:
     #     messages.append("error message not found!")
-    return messages
+    return output_scan.read_error_messages(os.path.join(job_directory, "ll_out"))
 
 
 def fix_error(
         job_directory: str,
+        ll_out_scan: Optional[LlOutScan] = None,
 ) -> bool:
     """Attempts to fix the error in job_direcory. Fixes ZBRINT, and number of potentials incompatable.
     Args:
       job_directory (str): A path to the directory that contains a job which has an error
-      home_dir (str): A path that contains the files "/kingRaychardsArsenal/sogetsoftpbe.py" and "/kingRaychardsArsenal/sortpos.py"
+      ll_out_scan (LlOutScan): A scan of the ll_out in job_directory. If None,
+        ll_out is scanned
     Returns:
       True if a fix was attempted,
     Changes:
       Resubmits the job iff a fix was attempted"""
     logger = logging.getLogger()
-    error_messages = get_error_message(job_directory)
+    error_messages = get_error_message(job_directory, ll_out_scan)
     for error_message in error_messages:
         if "ZBRENT" in error_message:
             contcar_path = os.path.join(job_directory, "CONTCAR")
@@ -248,9 +251,9 @@ def switch_subfile(
 def set_status_for_newly_submitted_job(
         job_dir: str,
         job_machine: Machine,
-        dos_jobs: Dict[str, DosJob],
-        wav_jobs: Dict[str, WavJob],
-        opt_jobs: Dict[str, OptJob],
+        dos_jobs: MutableMapping[str, DosJob],
+        wav_jobs: MutableMapping[str, WavJob],
+        opt_jobs: MutableMapping[str, OptJob],
         error: bool,
 ) -> None:
     """Sets the job status to that of special jobs that no longer need to be optoomised
@@ -0,0 +1,111 @@
+"""Measures the memory held by the job collections for many synthetic jobs
+
+Compares the job records as they were, plain dataclasses with a __dict__ per
+job and a fresh string per directory, with the current slotted records and
+interned directories.
+
+Run with `python test/benchmarks/bench_job_memory.py [job count]`
+"""
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Tuple
+
+from automagician.classes import DosJob, JobStatus, Machine, OptJob, WavJob
+
+
+@dataclass
+class DictOptJob:
+    status: JobStatus
+    home_machine: Machine
+    last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
+
+
+@dataclass
+class DictDosJob:
+    opt_id: int
+    sc_status: JobStatus
+    dos_status: JobStatus
+    sc_last_on: Machine
+    dos_last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
+
+
+@dataclass
+class DictWavJob:
+    opt_id: int
+    wav_status: JobStatus
+    wav_last_on: Machine
+    dirty: bool = field(default=True, compare=False, repr=False)
+
+
+def job_dir(i: int) -> str:
+    """Returns a new string holding a directory like the ones users register"""
+    return "".join(
+        [
+            "/home/a_user/projects/adsorption/surfaces/",
+            f"batch_{i // 1000:03d}/structure_{i:06d}",
+        ]
+    )
+
+
+def make_jobs(count: int, slotted: bool, interned: bool) -> Tuple[Dict, ...]:
+    """Makes opt, dos, and wav jobs for count directories, plus the opt queue
+
+    Every directory is made twice, like when a directory is read both from the
+    database and from a directory listing
+    """
+    opt_class: Callable[..., Any] = OptJob if slotted else DictOptJob
+    dos_class: Callable[..., Any] = DosJob if slotted else DictDosJob
+    wav_class: Callable[..., Any] = WavJob if slotted else DictWavJob
+    intern = sys.intern if interned else str
+    opt_jobs = {}
+    dos_jobs = {}
+    wav_jobs = {}
+    opt_queue = []
+    for i in range(count):
+        opt_dir = intern(job_dir(i))
+        opt_jobs[opt_dir] = opt_class(JobStatus.CONVERGED, Machine.FRI, Machine.FRI)
+        if i % 4 == 0:
+            dos_jobs[intern(os.path.join(opt_dir, "dos"))] = dos_class(
+                i, JobStatus.CONVERGED, JobStatus.CONVERGED, Machine.FRI, Machine.FRI
+            )
+        if i % 8 == 0:
+            wav_jobs[intern(os.path.join(opt_dir, "wav"))] = wav_class(
+                i, JobStatus.CONVERGED, Machine.FRI
+            )
+        opt_queue.append(intern(job_dir(i)))
+    return opt_jobs, dos_jobs, wav_jobs, {"opt_queue": opt_queue}
+
+
+def measure(count: int, slotted: bool, interned: bool) -> int:
+    """Returns how many bytes the jobs made by make_jobs hold"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    jobs = make_jobs(count, slotted, interned)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del jobs
+    return after - before
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{count} jobs")
+    baseline = measure(count, slotted=False, interned=False)
+    for name, slotted, interned in [
+        ("dict records, fresh strings", False, False),
+        ("slotted records, fresh strings", True, False),
+        ("slotted records, interned strings", True, True),
+    ]:
+        size = measure(count, slotted, interned)
+        print(
+            f"{name:36} {size / 2**20:8.1f} MiB {size / count:8.1f} B/job "
+            f"{size / baseline:6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Measures how long submitting and reading back many jobs takes
+
+Jobs are submitted to a SimulatedScheduler that sleeps for a fixed latency on
+every call, standing in for sbatch and squeue. Submitting one job at a time is
+compared with the thread pool used by submit_queue, and with job arrays.
+
+Run with `python test/benchmarks/bench_submit.py [job count] [latency in seconds]`
+"""
+import os
+import sys
+import tempfile
+import time
+
+# process_job is imported before database, which imports it part way through
+import automagician.process_job as process_job
+from automagician.classes import JobStatus, Machine, OptJob, SSHConfig
+from automagician.database import Database
+from automagician.simulated_scheduler import SimulatedScheduler
+
+
+def make_jobs(root: str, count: int) -> list:
+    """Makes count job directories under root, each with the same subfile"""
+    job_paths = []
+    for i in range(count):
+        job_path = os.path.join(root, f"job{i:06d}")
+        os.mkdir(job_path)
+        with open(os.path.join(job_path, "fri.sub"), "w") as f:
+            f.write(f"#!/bin/bash\n#SBATCH -J AM_{i}\n\nmpirun vasp\n")
+        job_paths.append(job_path)
+    return job_paths
+
+
+def measure(count: int, latency: float, max_workers: int, array: bool) -> float:
+    """Returns the seconds taken to submit count jobs and read the queue back"""
+    with tempfile.TemporaryDirectory() as root:
+        job_paths = make_jobs(root, count)
+        opt_jobs = {
+            job_path: OptJob(JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI)
+            for job_path in job_paths
+        }
+        backend = SimulatedScheduler(
+            user="bench", query_latency=latency, submit_latency=latency
+        )
+        database = Database(os.path.join(root, "bench_db"))
+        start = time.perf_counter()
+        process_job.submit_queue(
+            machine=Machine.FRI,
+            balance=False,
+            ssh_config=SSHConfig("NoSSH"),
+            sub_queue=job_paths,
+            home=root,
+            tacc_queue_sizes=[0, 0, 0],
+            opt_jobs=opt_jobs,
+            dos_jobs={},
+            wav_jobs={},
+            database=database,
+            limit=count + 1,
+            snapshot=backend.snapshot(),
+            array=array,
+            max_workers=max_workers,
+            backend=backend,
+        )
+        process_job.get_submitted_jobs(
+            Machine.FRI, opt_jobs, {}, {}, [0, 0, 0], backend.snapshot(), backend
+        )
+        elapsed = time.perf_counter() - start
+        database.db.connection.close()
+        return elapsed
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    print(f"{count} jobs, {latency}s per scheduler call")
+    for name, max_workers, array in [
+        ("one at a time", 1, False),
+        ("thread pool", 8, False),
+        ("job arrays", 8, True),
+    ]:
+        print(f"{name:16} {measure(count, latency, max_workers, array):8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,9 @@ import pytest
 
 from automagician.classes import JobLimitError
 from automagician.create_job import (
+    COPY_METHODS,
     add_to_sub_queue,
+    copy_input,
     create_dos_from_sc,
     create_sc,
     create_wav,
@@ -266,3 +268,100 @@ def test_create_sc_contcar(tmp_path):
     assert "NSW=0" in incar_text
     expected_sub_quene = [sc_job_path]
     assert sub_quene == expected_sub_quene
+
+
+def test_create_dos_from_sc_shares_chgcar(tmp_path):
+    sc_job_path = os.path.join(tmp_path, "sc")
+    dos_job_path = os.path.join(tmp_path, "dos")
+    shutil.copytree("test/test_files/h2_sc", sc_job_path)
+
+    create_dos_from_sc(sc_job_path, False, 2, [], 0, False)
+
+    sc_chgcar = os.stat(os.path.join(sc_job_path, "CHGCAR"))
+    assert os.stat(os.path.join(dos_job_path, "CHGCAR")).st_ino == sc_chgcar.st_ino
+    assert sc_chgcar.st_mode & 0o200
+    assert (
+        os.stat(os.path.join(dos_job_path, "INCAR")).st_ino
+        != os.stat(os.path.join(sc_job_path, "INCAR")).st_ino
+    )
+    with open(os.path.join(dos_job_path, "INCAR")) as f:
+        assert "LCHARG=.FALSE." in f.read()
+    with open(os.path.join(sc_job_path, "INCAR")) as f:
+        assert "ICHARGE=11" not in f.read()
+
+
+def test_create_dos_then_wav_from_one_job(tmp_path):
+    job_path = os.path.join(tmp_path, "opt")
+    shutil.copytree("test/test_files/h2_sc", job_path)
+
+    create_dos_from_sc(job_path, False, 99, [], 0, False)
+    create_wav(job_path, False, 99, [], 0, False)
+
+    chgcar = os.stat(os.path.join(job_path, "CHGCAR"))
+    wav_chgcar = os.stat(os.path.join(tmp_path, "wav", "CHGCAR"))
+    assert chgcar.st_nlink == 2
+    assert chgcar.st_mode & 0o200
+    assert wav_chgcar.st_ino != chgcar.st_ino
+    assert wav_chgcar.st_mode & 0o200
+
+
+def test_copy_is_user_writable(tmp_path):
+    src = os.path.join(tmp_path, "CHGCAR")
+    with open(src, "w") as f:
+        f.write("1.0\n")
+    os.chmod(src, 0o444)
+    copy_input(src, os.path.join(tmp_path, "copy"), "copy")
+    assert os.stat(os.path.join(tmp_path, "copy")).st_mode & 0o200
+
+
+def test_create_sc_copies_chgcar(tmp_path):
+    job_path = os.path.join(tmp_path, "opt")
+    shutil.copytree("test/test_files/h2_sc", job_path)
+
+    create_sc(job_path, False, 2, [], 0, False)
+
+    chgcar = os.stat(os.path.join(job_path, "CHGCAR"))
+    sc_chgcar = os.stat(os.path.join(tmp_path, "sc", "CHGCAR"))
+    assert sc_chgcar.st_ino != chgcar.st_ino
+    assert sc_chgcar.st_mode & 0o200 and chgcar.st_mode & 0o200
+
+
+@pytest.mark.parametrize(
+    "strategy,expected",
+    [
+        ("copy", ["copy"]),
+        ("hardlink", ["reflink", "copy"]),
+        ("symlink", ["reflink", "copy"]),
+    ],
+)
+def test_copy_input_falls_back(tmp_path, monkeypatch, strategy, expected):
+    def refuse(src, dst):
+        open(dst, "w").close()
+        raise OSError("not here")
+
+    monkeypatch.setitem(COPY_METHODS, "hardlink", refuse)
+    monkeypatch.setitem(COPY_METHODS, "symlink", refuse)
+    src = os.path.join(tmp_path, "CHGCAR")
+    with open(src, "w") as f:
+        f.write("1.0 2.0\n")
+    method = copy_input(src, os.path.join(tmp_path, "copy"), strategy)
+
+    assert method in expected
+    with open(os.path.join(tmp_path, "copy")) as f:
+        assert f.read() == "1.0 2.0\n"
+    assert os.stat(src).st_mode & 0o200
+
+
+def test_copy_input_symlink(tmp_path):
+    os.mkdir(os.path.join(tmp_path, "dos"))
+    src = os.path.join(tmp_path, "CHGCAR")
+    open(src, "w").close()
+    dst = os.path.join(tmp_path, "dos", "CHGCAR")
+    assert copy_input(src, dst, "symlink") == "symlink"
+    assert os.readlink(dst) == os.path.join("..", "CHGCAR")
+    assert os.stat(src).st_mode & 0o200
+
+
+def test_copy_input_unknown_strategy(tmp_path):
+    with pytest.raises(ValueError):
+        copy_input(str(tmp_path), str(tmp_path), "rsync")
@@ -1,10 +1,11 @@
 import os
+import sqlite3
 
 import pytest
 
 import automagician.classes
 from automagician.classes import DosJob, GoneJob, JobStatus, Machine, OptJob, WavJob
-from automagician.database import Database
+from automagician.database import Database, DatabaseVersionError
 
 
 def test_db_init_empty_file(tmp_path):
@@ -15,7 +16,7 @@ def test_db_init_empty_file(tmp_path):
     assert check_db_tables(names)
     # Test to see if something was present if it gets overwriten
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", automagician.classes.JobStatus.CONVERGED.value, 0, 0),
     )
     database.db.connection.commit()
@@ -84,11 +85,11 @@ def test_delpwd_remove_one(tmp_path):
 
     database = Database(database_path)
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", automagician.classes.JobStatus.CONVERGED.value, 2, 4),
     )
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp/automagician", automagician.classes.JobStatus.NOT_FOUND.value, 1, 3),
     )
     database.db.connection.commit()
@@ -107,7 +108,7 @@ def test_delpwd_remove_none(tmp_path):
 
     database = Database(database_path)
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp/automagician", automagician.classes.JobStatus.NOT_FOUND.value, 1, 3),
     )
     database.db.connection.commit()
@@ -124,16 +125,22 @@ def test_delpwd_remove_none(tmp_path):
 def test_delpwd_remove_all(tmp_path):
     database_path = os.path.join(tmp_path, "test_db")
 
-    database = Database(database_path)
-    database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+    # Databases made before dir was unique can have the same dir twice
+    legacy = sqlite3.connect(database_path)
+    legacy.execute(
+        "create table opt_jobs (dir text, status int, home_machine int, last_on int)"
+    )
+    legacy.execute(
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", automagician.classes.JobStatus.CONVERGED.value, 2, 4),
     )
-    database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+    legacy.execute(
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", automagician.classes.JobStatus.NOT_FOUND.value, 1, 3),
     )
-    database.db.connection.commit()
+    legacy.commit()
+    legacy.close()
+    database = Database(database_path)
     database.delpwd("/tmp")
     entries = database.db.execute("select * from opt_jobs").fetchall()
     print(entries)
@@ -335,7 +342,7 @@ def test_get_opt_jobs(tmp_path):
 
     database = Database(database_path)
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/tmp",
             JobStatus.CONVERGED.value,
@@ -344,7 +351,7 @@ def test_get_opt_jobs(tmp_path):
         ),
     )
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/hi",
             JobStatus.NOT_FOUND.value,
@@ -356,7 +363,7 @@ def test_get_opt_jobs(tmp_path):
     database.db.execute(
         "INSERT into dos_jobs values (?,?,?,?, ?)",
         (
-            "/hi",
+            2,
             -1,
             JobStatus.NOT_FOUND.value,
             Machine.STAMPEDE2_TACC.value,
@@ -385,12 +392,12 @@ def test_get_dos_jobs(tmp_path):
 
     database = Database(database_path)
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", JobStatus.CONVERGED.value, Machine.FRI, Machine.HALIFAX),
     )
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/tmp/hi",
             JobStatus.RUNNING.value,
@@ -457,12 +464,12 @@ def test_get_wav_jobs(tmp_path):
 
     database = Database(database_path)
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp", JobStatus.CONVERGED.value, Machine.FRI, Machine.HALIFAX),
     )
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         ("/tmp/hi", JobStatus.RUNNING.value, Machine.FRI, Machine.HALIFAX),
     )
     database.db.connection.commit()
@@ -508,7 +515,7 @@ def test_write_job_status_dos_and_wav(tmp_path):
     database = Database(database_path)
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/home/jw53959/opt_job_1",
             JobStatus.RUNNING.value,
@@ -518,7 +525,7 @@ def test_write_job_status_dos_and_wav(tmp_path):
     )
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/home/jw53959/opt_job_2",
             JobStatus.CONVERGED.value,
@@ -719,7 +726,7 @@ def test_write_job_status_update_all(tmp_path):
     opt_job_2 = OptJob(JobStatus.CONVERGED, Machine.FRI, Machine.FRONTERA_TACC)
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/home/jw53959/opt_job_1",
             JobStatus.RUNNING.value,
@@ -729,7 +736,7 @@ def test_write_job_status_update_all(tmp_path):
     )
 
     database.db.execute(
-        "INSERT into opt_jobs values (?,?,?,?)",
+        "INSERT into opt_jobs (dir, status, home_machine, last_on) values (?,?,?,?)",
         (
             "/home/jw53959/opt_job_2",
             JobStatus.CONVERGED.value,
@@ -1391,3 +1398,276 @@ def check_db_tables(names: list[str]):
         else:
             tables |= 32
     return tables == 31
+
+
+def test_db_init_removes_duplicates(tmp_path):
+    database_path = os.path.join(tmp_path, "test_db")
+    legacy = sqlite3.connect(database_path)
+    legacy.execute(
+        "create table opt_jobs (dir text, status int, home_machine int, last_on int)"
+    )
+    legacy.execute(
+        "create table dos_jobs (opt_id int, sc_status int, dos_status int, sc_last_on int, dos_last_on int)"
+    )
+    legacy.execute(
+        "create table wav_jobs (opt_id int, wav_status int, wav_last_on int)"
+    )
+    legacy.executemany(
+        "insert into opt_jobs values (?, ?, ?, ?)",
+        [
+            ("/home/jw53959/opt_job_1", JobStatus.RUNNING.value, 0, 0),
+            ("/home/jw53959/opt_job_1", JobStatus.INCOMPLETE.value, 0, 0),
+            ("/home/jw53959/opt_job_2", JobStatus.CONVERGED.value, 0, 0),
+        ],
+    )
+    # Points at the duplicate of opt_job_1 that will be removed
+    legacy.execute("insert into dos_jobs values (2, 0, 0, 0, 0)")
+    legacy.execute("insert into wav_jobs values (3, 0, 0)")
+    legacy.execute("insert into wav_jobs values (3, 1, 1)")
+    legacy.commit()
+    legacy.close()
+
+    database = Database(database_path)
+    assert database.get_opt_jobs() == {
+        "/home/jw53959/opt_job_1": OptJob(JobStatus.RUNNING, 0, 0),
+        "/home/jw53959/opt_job_2": OptJob(JobStatus.CONVERGED, 0, 0),
+    }
+    assert database.get_dos_jobs() == {
+        "/home/jw53959/opt_job_1/dos": DosJob(1, 0, 0, 0, 0),
+    }
+    assert database.get_wav_jobs() == {
+        "/home/jw53959/opt_job_2/wav": WavJob(3, 1, 1),
+    }
+    with pytest.raises(sqlite3.IntegrityError):
+        database.db.execute(
+            "insert into opt_jobs (dir, status, home_machine, last_on) "
+            "values (?, ?, ?, ?)",
+            ("/home/jw53959/opt_job_2", 0, 0, 0),
+        )
+
+
+def test_write_job_status_many_jobs(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    opt_jobs = {
+        f"/home/jw53959/opt_job_{i}": OptJob(
+            JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI
+        )
+        for i in range(2000)
+    }
+    dos_jobs = {
+        f"/home/jw53959/opt_job_{i}/dos": DosJob(
+            -1, JobStatus.RUNNING, JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI
+        )
+        for i in range(1000)
+    }
+    database.write_job_statuses(opt_jobs, dos_jobs, {})
+    for job in opt_jobs.values():
+        job.status = JobStatus.CONVERGED
+    database.write_job_statuses(opt_jobs, dos_jobs, {})
+
+    assert database.get_opt_jobs() == opt_jobs
+    assert database.get_dos_jobs() == dos_jobs
+    assert database.get_string_from_db("select count(*) from dos_jobs") == "1000"
+
+
+def test_db_migrates_legacy_schema(tmp_path):
+    database_path = os.path.join(tmp_path, "test_db")
+    legacy = sqlite3.connect(database_path)
+    legacy.execute(
+        "create table opt_jobs (dir text, status int, home_machine int, last_on int)"
+    )
+    legacy.execute(
+        "create table dos_jobs (opt_id int, sc_status int, dos_status int, sc_last_on int, dos_last_on int)"
+    )
+    legacy.executemany(
+        "insert into opt_jobs values (?, ?, ?, ?)",
+        [("/tmp/removed", 0, 0, 0), ("/tmp/opt_job_1", 1, 1, 1)],
+    )
+    legacy.execute("delete from opt_jobs where dir = '/tmp/removed'")
+    legacy.execute("insert into dos_jobs values (2, 0, 1, 2, 3)")
+    # Has no opt_job
+    legacy.execute("insert into dos_jobs values (7, 0, 1, 2, 3)")
+    legacy.commit()
+    legacy.close()
+
+    database = Database(database_path)
+    assert database.get_string_from_db("pragma user_version") == "1"
+    assert database.get_string_from_db("pragma foreign_keys") == "1"
+    assert database.get_string_from_db(
+        "select id from opt_jobs where dir = '/tmp/opt_job_1'"
+    ) == "2"
+    assert database.get_dos_jobs() == {
+        "/tmp/opt_job_1/dos": DosJob(2, 0, 1, 2, 3),
+    }
+    indexes = {
+        row[0]
+        for row in database.db.execute(
+            "select name from sqlite_master where type = 'index'"
+        )
+    }
+    assert {"opt_jobs_dir", "opt_jobs_status", "gone_jobs_dir"} <= indexes
+
+    # dos_jobs are removed with their opt_job
+    database.delpwd("/tmp/opt_job_1")
+    assert database.get_string_from_db("select count(*) from dos_jobs") == "0"
+
+
+def test_db_new_is_current_version(tmp_path):
+    database_path = os.path.join(tmp_path, "test_db")
+    Database(database_path).db.connection.close()
+    database = Database(database_path)
+    assert database.get_string_from_db("pragma user_version") == "1"
+    with pytest.raises(sqlite3.IntegrityError):
+        database.db.execute("insert into wav_jobs values (5, 0, 0)")
+
+
+def test_get_dos_and_wav_jobs_single_query(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    opt_jobs = {
+        f"/tmp/opt_job_{i}": OptJob(JobStatus.CONVERGED, Machine.FRI, Machine.FRI)
+        for i in range(20)
+    }
+    dos_jobs = {
+        f"{job_dir}/dos": DosJob(
+            -1, JobStatus.RUNNING, JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI
+        )
+        for job_dir in opt_jobs
+    }
+    wav_jobs = {
+        f"{job_dir}/wav": WavJob(-1, JobStatus.RUNNING, Machine.FRI)
+        for job_dir in opt_jobs
+    }
+    database.write_job_statuses(opt_jobs, dos_jobs, wav_jobs)
+
+    statements = []
+    database.db.connection.set_trace_callback(statements.append)
+    assert database.get_dos_jobs() == dos_jobs
+    assert database.get_wav_jobs() == wav_jobs
+    assert len(statements) == 2
+
+
+def test_write_job_status_only_dirty(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    database.write_job_statuses(
+        {
+            "/tmp/opt_job_1": OptJob(JobStatus.RUNNING, Machine.FRI, Machine.FRI),
+            "/tmp/opt_job_2": OptJob(JobStatus.RUNNING, Machine.FRI, Machine.FRI),
+        },
+        {},
+        {},
+    )
+    opt_jobs = database.get_opt_jobs()
+    assert not any(job.dirty for job in opt_jobs.values())
+    opt_jobs["/tmp/opt_job_2"].last_on = Machine.FRI
+    assert not opt_jobs["/tmp/opt_job_2"].dirty
+    opt_jobs["/tmp/opt_job_1"].status = JobStatus.CONVERGED
+    assert opt_jobs["/tmp/opt_job_1"].dirty
+    # Changed by someone else, and not by this run
+    database.db.execute(
+        "update opt_jobs set status = ? where dir = ?",
+        (JobStatus.ERROR.value, "/tmp/opt_job_2"),
+    )
+
+    statements = []
+    database.db.connection.set_trace_callback(statements.append)
+    database.write_job_statuses(opt_jobs, {}, {})
+    assert len([s for s in statements if "opt_jobs" in s]) == 1
+    assert not opt_jobs["/tmp/opt_job_1"].dirty
+    assert database.get_opt_jobs() == {
+        "/tmp/opt_job_1": OptJob(JobStatus.CONVERGED, Machine.FRI, Machine.FRI),
+        "/tmp/opt_job_2": OptJob(JobStatus.ERROR, Machine.FRI, Machine.FRI),
+    }
+
+
+def test_db_wal(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"), wal=True)
+    assert database.get_string_from_db("pragma journal_mode") == "wal"
+    # synchronous = normal
+    assert database.get_string_from_db("pragma synchronous") == "1"
+
+
+def test_db_read_only_while_writing(tmp_path):
+    database_path = os.path.join(tmp_path, "test_db")
+    database = Database(database_path, wal=True)
+    database.write_job_statuses(
+        {"/tmp/opt_job_1": OptJob(JobStatus.RUNNING, Machine.FRI, Machine.FRI)},
+        {},
+        {},
+    )
+    # An uncommitted write, like one in the middle of a pass
+    database.db.execute(
+        "update opt_jobs set status = ?", (JobStatus.CONVERGED.value,)
+    )
+
+    reader = Database(database_path, read_only=True)
+    assert reader.get_opt_jobs() == {
+        "/tmp/opt_job_1": OptJob(JobStatus.RUNNING, Machine.FRI, Machine.FRI)
+    }
+    plain_text_path = os.path.join(tmp_path, "plain_text_db")
+    reader.write_plain_text_db(plain_text_path)
+    assert os.path.exists(plain_text_path)
+    with pytest.raises(sqlite3.OperationalError):
+        reader.db.execute("delete from opt_jobs")
+
+
+def test_db_read_only_not_migrated(tmp_path):
+    database_path = os.path.join(tmp_path, "test_db")
+    legacy = sqlite3.connect(database_path)
+    legacy.execute(
+        "create table opt_jobs (dir text, status int, home_machine int, last_on int)"
+    )
+    legacy.commit()
+    legacy.close()
+    with pytest.raises(DatabaseVersionError):
+        Database(database_path, read_only=True)
+    assert Database(database_path).get_string_from_db("pragma user_version") == "1"
+    Database(database_path, read_only=True)
+
+
+def test_db_read_only_missing(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        Database(os.path.join(tmp_path, "test_db"), read_only=True)
+    assert not os.path.exists(os.path.join(tmp_path, "test_db"))
+
+
+def test_iter_opt_jobs_pages(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    opt_jobs = {
+        f"/tmp/opt_job_{i}": OptJob(
+            JobStatus.INCOMPLETE if i % 2 == 0 else JobStatus.CONVERGED,
+            Machine.FRI,
+            Machine.FRI,
+        )
+        for i in range(7)
+    }
+    database.write_job_statuses(opt_jobs, {}, {})
+    assert dict(database.iter_opt_jobs(page_size=3)) == opt_jobs
+    assert dict(database.iter_opt_jobs(JobStatus.INCOMPLETE, page_size=2)) == {
+        job_dir: job
+        for job_dir, job in opt_jobs.items()
+        if job.status == JobStatus.INCOMPLETE
+    }
+    assert database.count_jobs("opt_jobs") == 7
+    assert database.count_jobs("opt_jobs", JobStatus.CONVERGED) == 3
+
+
+def test_get_single_jobs(tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    opt_job = OptJob(JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI)
+    dos_job = DosJob(
+        -1, JobStatus.CONVERGED, JobStatus.RUNNING, Machine.FRI, Machine.FRI
+    )
+    wav_job = WavJob(-1, JobStatus.ERROR, Machine.HALIFAX)
+    database.write_job_statuses(
+        {"/tmp/opt_job": opt_job},
+        {"/tmp/opt_job/dos": dos_job},
+        {"/tmp/opt_job/wav": wav_job},
+    )
+    assert database.get_opt_job("/tmp/opt_job") == opt_job
+    assert database.get_opt_job("/tmp/other_job") is None
+    assert database.get_dos_job("/tmp/opt_job/dos") == dos_job
+    assert database.get_dos_job("/tmp/opt_job") is None
+    assert database.get_wav_job("/tmp/opt_job/wav") == wav_job
+    assert database.get_wav_job("/tmp/opt_job/dos") is None
+    assert dict(database.iter_dos_jobs(page_size=1)) == database.get_dos_jobs()
+    assert dict(database.iter_wav_jobs(page_size=1)) == database.get_wav_jobs()
@@ -0,0 +1,149 @@
+import os
+import shutil
+
+from automagician.classes import DirectoryScan
+from automagician.directory_index import DirectoryIndex
+from automagician.register import scan_directory, scan_tree
+
+
+def make_scan(path: str) -> DirectoryScan:
+    return DirectoryScan(
+        path=path,
+        subdirs=["dos", "run0"],
+        has_opt=True,
+        is_neb=False,
+        has_dos=True,
+        has_wav=False,
+        exclude=False,
+    )
+
+
+def test_directory_index_save_and_reopen(tmp_path):
+    index_path = os.path.join(tmp_path, "index.db")
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    index.save()
+    index.close()
+
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    assert index.lookup(job_dir, "fri.sub", os.stat(job_dir)) == make_scan(job_dir)
+
+
+def test_directory_index_lookup_missing(tmp_path):
+    index = DirectoryIndex(os.path.join(tmp_path, "index.db"))
+    assert index.lookup(str(tmp_path), "fri.sub", os.stat(tmp_path)) is None
+
+
+def test_directory_index_lookup_other_subfile(tmp_path):
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(os.path.join(tmp_path, "index.db"))
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    assert index.lookup(job_dir, "halifax.sub", os.stat(job_dir)) is None
+
+
+def test_directory_index_lookup_changed_dir(tmp_path):
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(os.path.join(tmp_path, "index.db"))
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    with open(os.path.join(job_dir, "POSCAR"), "w"):
+        pass
+    assert index.lookup(job_dir, "fri.sub", os.stat(job_dir)) is None
+
+
+def test_directory_index_lookup_changed_note(tmp_path):
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    note_path = os.path.join(job_dir, "automagic_note")
+    with open(note_path, "w") as f:
+        f.write("dos\n")
+    index = DirectoryIndex(os.path.join(tmp_path, "index.db"), racy_window_ns=0)
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), os.stat(note_path))
+    assert index.lookup(job_dir, "fri.sub", os.stat(job_dir)) == make_scan(job_dir)
+    with open(note_path, "a") as f:
+        f.write("wav\n")
+    os.utime(note_path, ns=(0, 0))
+    assert index.lookup(job_dir, "fri.sub", os.stat(job_dir)) is None
+
+
+def test_directory_index_forget_missing(tmp_path):
+    index_path = os.path.join(tmp_path, "index.db")
+    root = os.path.join(tmp_path, "root")
+    os.mkdir(root)
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    for job_dir in [root, os.path.join(root, "a"), os.path.join(tmp_path, "other")]:
+        index.record(make_scan(job_dir), "fri.sub", os.stat(root), None)
+    index.forget_missing(root, [root])
+    index.save()
+    index.close()
+
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    assert set(index.entries) == {root, os.path.join(tmp_path, "other")}
+
+
+def test_directory_index_skips_racy_dir(tmp_path):
+    index_path = os.path.join(tmp_path, "index.db")
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(index_path)
+    # job_dir changed in the same second the index was opened, so a change
+    # made after this scan could leave its mtime and ctime the same
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    assert index.lookup(job_dir, "fri.sub", os.stat(job_dir)) is None
+    index.save()
+    index.close()
+
+    index = DirectoryIndex(index_path)
+    assert job_dir not in index.entries
+
+
+def test_directory_index_racy_rescan_drops_entry(tmp_path):
+    index_path = os.path.join(tmp_path, "index.db")
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    index.save()
+    index.close()
+
+    index = DirectoryIndex(index_path)
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    assert job_dir not in index.entries
+    index.save()
+    index.close()
+
+    index = DirectoryIndex(index_path)
+    assert job_dir not in index.entries
+
+
+def test_scan_directory_uses_index(tmp_path):
+    job_dir = os.path.join(tmp_path, "job")
+    os.mkdir(job_dir)
+    index = DirectoryIndex(os.path.join(tmp_path, "index.db"), racy_window_ns=0)
+    index.record(make_scan(job_dir), "fri.sub", os.stat(job_dir), None)
+    # The recorded scan says this is an opt job, so the directory was not listed
+    assert scan_directory(job_dir, "fri.sub", index) == make_scan(job_dir)
+
+
+def test_scan_tree_with_index_sees_changes(tmp_path):
+    root = os.path.join(tmp_path, "root")
+    job_dir = os.path.join(root, "job")
+    os.makedirs(os.path.join(root, "empty"))
+    shutil.copytree("test/test_files/h2", job_dir)
+    os.remove(os.path.join(job_dir, "POSCAR"))
+    index_path = os.path.join(tmp_path, "index.db")
+
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    first = scan_tree(root, "fri.sub", directory_index=index)
+    index.save()
+    index.close()
+    assert [scan.has_opt for scan in first] == [False, False, False]
+
+    shutil.copy("test/test_files/h2/POSCAR", job_dir)
+    index = DirectoryIndex(index_path, racy_window_ns=0)
+    second = scan_tree(root, "fri.sub", directory_index=index)
+    assert [scan.path for scan in second] == [scan.path for scan in first]
+    assert {scan.path: scan.has_opt for scan in second}[job_dir] is True
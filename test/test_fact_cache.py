@@ -0,0 +1,88 @@
+import os
+import shutil
+import sqlite3
+
+from automagician.fact_cache import FactCache
+from automagician.process_job import determine_convergence, is_isif3, scan_job_ll_out
+
+
+def open_cache(tmp_path) -> FactCache:
+    return FactCache(sqlite3.connect(os.path.join(tmp_path, "facts.db")).cursor())
+
+
+def test_fact_cache_computes_once(tmp_path):
+    path = os.path.join(tmp_path, "INCAR")
+    with open(path, "w") as f:
+        f.write("ISIF = 3\n")
+    calls = []
+    cache = open_cache(tmp_path)
+    assert cache.get(path, "kind", lambda: calls.append(1) or 5) == 5
+    assert cache.get(path, "kind", lambda: calls.append(1) or 6) == 5
+    assert len(calls) == 1
+
+
+def test_fact_cache_file_changed(tmp_path):
+    path = os.path.join(tmp_path, "INCAR")
+    with open(path, "w") as f:
+        f.write("ISIF = 3\n")
+    cache = open_cache(tmp_path)
+    assert cache.get(path, "kind", lambda: 1) == 1
+    with open(path, "a") as f:
+        f.write("IBRION = 2\n")
+    assert cache.get(path, "kind", lambda: 2) == 2
+
+
+def test_fact_cache_missing_file(tmp_path):
+    cache = open_cache(tmp_path)
+    path = os.path.join(tmp_path, "INCAR")
+    assert cache.get(path, "kind", lambda: 1) == 1
+    assert cache.facts == {}
+
+
+def test_fact_cache_save_and_reload(tmp_path):
+    path = os.path.join(tmp_path, "INCAR")
+    with open(path, "w") as f:
+        f.write("ISIF = 3\n")
+    cache = open_cache(tmp_path)
+    cache.get(path, "kind", lambda: {"a": [1, 2]})
+    cache.save()
+    cache.db.connection.close()
+
+    cache = open_cache(tmp_path)
+    assert cache.get(path, "kind", lambda: None) == {"a": [1, 2]}
+
+
+def test_is_isif3_cached(tmp_path):
+    shutil.copy("test/test_files/failed_u_run/INCAR", tmp_path)
+    cache = open_cache(tmp_path)
+    assert is_isif3(tmp_path, cache) is False
+    # A stale fact would be returned if the INCAR had not changed
+    cache.facts[(os.path.join(tmp_path, "INCAR"), "isif3")].value = True
+    assert is_isif3(tmp_path, cache) is True
+    with open(os.path.join(tmp_path, "INCAR"), "a") as f:
+        f.write("ISIF = 3\n")
+    assert is_isif3(tmp_path, cache) is True
+    assert cache.facts[(os.path.join(tmp_path, "INCAR"), "isif3")].value is True
+
+
+def test_scan_job_ll_out_cached(tmp_path):
+    shutil.copy("test/test_files/failed_u_run/ll_out", tmp_path)
+    cache = open_cache(tmp_path)
+    first = scan_job_ll_out(tmp_path, cache)
+    cache.save()
+    cache.db.connection.close()
+
+    cache = open_cache(tmp_path)
+    assert scan_job_ll_out(tmp_path, cache) == first
+    assert first == scan_job_ll_out(tmp_path)
+
+
+def test_determine_convergence_cached_isif_3(tmp_path):
+    job_dir = os.path.join(tmp_path, "job_dir")
+    shutil.copytree("test/test_files/h2_completed_run", job_dir)
+    with open(os.path.join(job_dir, "INCAR"), "a+") as f:
+        f.write("ISIF = 3")
+    cache = open_cache(tmp_path)
+    assert determine_convergence(job_dir, fact_cache=cache) is False
+    assert cache.facts[(os.path.join(job_dir, "fe.dat"), "line_count")].value == 5
+    assert determine_convergence(job_dir, fact_cache=cache) is False
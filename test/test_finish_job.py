@@ -1,3 +1,4 @@
+import gzip
 import os
 import shutil
 import time
@@ -5,8 +6,10 @@ import time
 import automagician.constants as constants
 
 from automagician.finish_job import (
+    combine_XDAT_FE,
     dos_is_complete,
     give_certificate,
+    read_combine_state,
     sc_is_complete,
     wav_is_complete,
     wrap_up,
@@ -158,4 +161,76 @@ def test_give_duplicate_certificate(tmp_path):
     open(
         os.path.join(tmp_path, constants.CONVERGENCE_CERTIFICATE_NAME), "x"
     )
-    assert give_certificate(tmp_path) == 1
\ No newline at end of file
+    assert give_certificate(tmp_path) == 1
+
+def make_run(job_path, run, gzipped=False):
+    run_dir = os.path.join(job_path, run)
+    os.makedirs(run_dir)
+    for name in ["XDATCAR", "OUTCAR"]:
+        source = os.path.join("test/test_files/h2_completed_run", name)
+        if gzipped:
+            with open(source, "rb") as f, gzip.open(
+                os.path.join(run_dir, name + ".gz"), "wb"
+            ) as f_gz:
+                shutil.copyfileobj(f, f_gz)
+        else:
+            shutil.copy(source, run_dir)
+
+
+def read_lines(path):
+    with open(path, "r") as f:
+        return f.readlines()
+
+
+def test_combine_XDAT_FE_no_runs(tmp_path):
+    state = combine_XDAT_FE(tmp_path)
+    assert (state.step, state.force, state.energy) == (0, 0.0, 0.0)
+    assert not os.path.exists(os.path.join(tmp_path, constants.CMB_FE_NAME))
+
+
+def test_combine_XDAT_FE_two_runs(tmp_path):
+    make_run(tmp_path, "run0")
+    make_run(tmp_path, "run1", gzipped=True)
+    state = combine_XDAT_FE(tmp_path)
+
+    xdatcar = read_lines("test/test_files/h2_completed_run/XDATCAR")
+    cmb_xdatcar = read_lines(os.path.join(tmp_path, constants.CMB_XDATCAR_NAME))
+    # The second run starts at its second configuration
+    assert cmb_xdatcar == xdatcar + xdatcar[10:]
+    cmb_fe = read_lines(os.path.join(tmp_path, constants.CMB_FE_NAME))
+    assert len(cmb_fe) == 10
+    assert cmb_fe[5].split()[:4] == ["5", "0", "0.501336", "-6.745937"]
+    assert (state.step, state.force, state.energy) == (9, 0.002109, -6.749227)
+    assert read_combine_state(tmp_path) == state
+
+
+def test_combine_XDAT_FE_incremental(tmp_path):
+    make_run(tmp_path, "run0")
+    combine_XDAT_FE(tmp_path)
+    make_run(tmp_path, "run1")
+    # Already combined runs are not read again
+    with open(os.path.join(tmp_path, "run0", "fe.dat"), "a") as f:
+        f.write("not read\n")
+    os.truncate(os.path.join(tmp_path, "run0", "XDATCAR"), 0)
+    state = combine_XDAT_FE(tmp_path)
+    assert state.line_count == 11
+    cmb_fe = read_lines(os.path.join(tmp_path, constants.CMB_FE_NAME))
+    assert cmb_fe[5] == "5  not read\n"
+
+    state = combine_XDAT_FE(tmp_path, rebuild=True)
+    assert state.line_count == 11
+    xdatcar = read_lines("test/test_files/h2_completed_run/XDATCAR")
+    cmb_xdatcar = read_lines(os.path.join(tmp_path, constants.CMB_XDATCAR_NAME))
+    assert cmb_xdatcar == xdatcar[10:]
+
+
+def test_combine_XDAT_FE_run_order(tmp_path):
+    make_run(tmp_path, "run10")
+    make_run(tmp_path, "run2")
+    with open(os.path.join(tmp_path, "run2", "fe.dat"), "w") as f:
+        f.write("    0    1.000000    -1.000000    0\n")
+    state = combine_XDAT_FE(tmp_path)
+    assert list(state.runs) == ["run2", "run10"]
+    cmb_fe = read_lines(os.path.join(tmp_path, constants.CMB_FE_NAME))
+    assert cmb_fe[0] == "0      0    1.000000    -1.000000    0\n"
+    assert len(cmb_fe) == 6
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from automagician.classes import DosJob, JobStatus, Machine, OptJob
+from automagician.database import Database
+
+
+def make_database(tmp_path, count: int) -> Database:
+    database = Database(os.path.join(tmp_path, "test_db"))
+    database.write_job_statuses(
+        {
+            f"/tmp/opt_job_{i}": OptJob(JobStatus.CONVERGED, Machine.FRI, Machine.FRI)
+            for i in range(count)
+        },
+        {},
+        {},
+    )
+    return database
+
+
+def test_job_store_loads_on_demand(tmp_path):
+    database = make_database(tmp_path, 10)
+    opt_jobs = database.get_opt_job_store(capacity=3)
+    assert len(opt_jobs._cache) == 0
+    assert opt_jobs["/tmp/opt_job_4"] == OptJob(
+        JobStatus.CONVERGED, Machine.FRI, Machine.FRI
+    )
+    assert "/tmp/opt_job_5" in opt_jobs
+    assert "/tmp/missing" not in opt_jobs
+    with pytest.raises(KeyError):
+        opt_jobs["/tmp/missing"]
+    assert len(opt_jobs) == 10
+
+
+def test_job_store_keeps_dirty_jobs(tmp_path):
+    database = make_database(tmp_path, 10)
+    opt_jobs = database.get_opt_job_store(capacity=2)
+    opt_jobs["/tmp/opt_job_0"].status = JobStatus.INCOMPLETE
+    opt_jobs["/tmp/new_job"] = OptJob(JobStatus.RUNNING, Machine.FRI, Machine.FRI)
+    for job_dir in opt_jobs:
+        opt_jobs[job_dir]
+    assert len(opt_jobs._cache) <= 3
+    assert set(dict(opt_jobs.dirty_items())) == {"/tmp/opt_job_0", "/tmp/new_job"}
+    assert len(opt_jobs) == 11
+    assert len(list(opt_jobs)) == 11
+
+    database.write_job_statuses(opt_jobs, {}, {})
+    assert opt_jobs.dirty_items() == []
+    assert database.get_opt_job("/tmp/opt_job_0").status == JobStatus.INCOMPLETE
+    assert database.get_opt_job("/tmp/new_job").status == JobStatus.RUNNING
+    assert len(opt_jobs) == 11
+    assert len(list(opt_jobs)) == 11
+
+
+def test_job_store_delete(tmp_path):
+    database = make_database(tmp_path, 3)
+    opt_jobs = database.get_opt_job_store()
+    opt_jobs.pop("/tmp/opt_job_1")
+    assert "/tmp/opt_job_1" not in opt_jobs
+    assert len(opt_jobs) == 2
+    assert set(opt_jobs) == {"/tmp/opt_job_0", "/tmp/opt_job_2"}
+    with pytest.raises(KeyError):
+        del opt_jobs["/tmp/opt_job_1"]
+
+
+def test_job_store_dos_jobs(tmp_path):
+    database = make_database(tmp_path, 1)
+    dos_jobs = database.get_dos_job_store()
+    dos_jobs["/tmp/opt_job_0/dos"] = DosJob(
+        -1, JobStatus.RUNNING, JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI
+    )
+    database.write_job_statuses({}, dos_jobs, {})
+    assert database.get_opt_job_store()["/tmp/opt_job_0"].status == (
+        JobStatus.CONVERGED
+    )
+    assert database.get_dos_job_store()["/tmp/opt_job_0/dos"].sc_status == (
+        JobStatus.RUNNING
+    )
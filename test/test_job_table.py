@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import automagician.job_table as job_table
+from automagician.classes import DosJob, JobStatus, Machine, OptJob
+from automagician.database import Database
+from automagician.job_table import JobTable
+from automagician.process_job import reset_running_jobs
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(job_table, "np", None)
+    return request.param
+
+
+def make_opt_jobs(count: int, dirty: bool = False):
+    return {
+        f"/tmp/opt_job_{i}": OptJob(
+            JobStatus.RUNNING if i % 3 == 0 else JobStatus.CONVERGED,
+            Machine.FRI,
+            Machine(2 + i % 3),
+            dirty=dirty,
+        )
+        for i in range(count)
+    }
+
+
+def test_job_table_dict_view(backend):
+    opt_jobs = make_opt_jobs(40)
+    table = JobTable(OptJob, opt_jobs.items())
+    assert len(table) == 40
+    assert dict(table) == opt_jobs
+    assert "/tmp/opt_job_3" in table
+    assert "/tmp/missing" not in table
+    assert table["/tmp/opt_job_3"].status == JobStatus.RUNNING
+    assert table["/tmp/opt_job_3"].last_on == Machine.STAMPEDE2_TACC
+    assert table.dirty_items() == []
+    table["/tmp/opt_job_3"].last_on = Machine.STAMPEDE2_TACC
+    assert table.dirty_items() == []
+
+    table["/tmp/opt_job_3"].status = JobStatus.ERROR
+    table["/tmp/new_job"] = OptJob(JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI)
+    assert [job_dir for job_dir, _ in table.dirty_items()] == [
+        "/tmp/opt_job_3",
+        "/tmp/new_job",
+    ]
+    assert table["/tmp/opt_job_3"] == OptJob(
+        JobStatus.ERROR, Machine.FRI, Machine.STAMPEDE2_TACC
+    )
+
+
+def test_job_table_delete(backend):
+    table = JobTable(OptJob, make_opt_jobs(3).items())
+    last = table["/tmp/opt_job_2"].to_job()
+    del table["/tmp/opt_job_0"]
+    assert set(table) == {"/tmp/opt_job_1", "/tmp/opt_job_2"}
+    assert table["/tmp/opt_job_2"] == last
+    with pytest.raises(KeyError):
+        table["/tmp/opt_job_0"]
+    table.pop("/tmp/opt_job_2")
+    assert list(table) == ["/tmp/opt_job_1"]
+
+
+def test_job_table_select_count_update(backend):
+    table = JobTable(OptJob, make_opt_jobs(30).items())
+    running = table.select(status=JobStatus.RUNNING)
+    assert list(running) == list(range(0, 30, 3))
+    assert table.count(running, "last_on") == {Machine.STAMPEDE2_TACC: 10}
+    assert list(table.select(running, last_on=Machine.LS6_TACC)) == []
+    table.update_rows(running, status=JobStatus.INCOMPLETE)
+    assert list(table.select(status=JobStatus.RUNNING)) == []
+    assert len(table.dirty_items()) == 10
+
+
+@pytest.mark.parametrize("as_table", [True, False])
+def test_reset_running_jobs(backend, as_table):
+    opt_jobs = make_opt_jobs(9)
+    jobs = JobTable(OptJob, opt_jobs.items()) if as_table else opt_jobs
+    opt_jobs["/tmp/opt_job_1"].status = JobStatus.RUNNING
+    if as_table:
+        jobs["/tmp/opt_job_1"] = opt_jobs["/tmp/opt_job_1"]
+    counts = reset_running_jobs(jobs, "status", "last_on", Machine.STAMPEDE2_TACC)
+    assert counts == {Machine.STAMPEDE2_TACC: 3, Machine.FRONTERA_TACC: 1}
+    assert {
+        job_dir for job_dir, job in jobs.items() if job.status == JobStatus.RUNNING
+    } == {"/tmp/opt_job_1"}
+    reset_running_jobs(jobs, "status", "last_on", None)
+    assert all(job.status != JobStatus.RUNNING for job in jobs.values())
+
+
+def test_job_table_write_job_statuses(backend, tmp_path):
+    database = Database(os.path.join(tmp_path, "test_db"))
+    database.write_job_statuses(make_opt_jobs(4, dirty=True), {}, {})
+    opt_jobs = JobTable(OptJob, database.iter_opt_jobs())
+    dos_jobs = JobTable(DosJob, database.iter_dos_jobs())
+    opt_jobs["/tmp/opt_job_1"].status = JobStatus.ERROR
+    dos_jobs["/tmp/opt_job_1/dos"] = DosJob(
+        -1, JobStatus.RUNNING, JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI
+    )
+    database.write_job_statuses(opt_jobs, dos_jobs, {})
+    assert opt_jobs.dirty_items() == []
+    assert dos_jobs.dirty_items() == []
+    assert dos_jobs["/tmp/opt_job_1/dos"].opt_id == 2
+    assert database.get_opt_jobs() == dict(opt_jobs)
+    assert database.get_dos_jobs() == dict(dos_jobs)
@@ -0,0 +1,192 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from automagician.classes import LlOutScan
+from automagician.output_scan import (
+    read_error_messages,
+    read_force_energy,
+    read_lines_reversed,
+    scan_ll_out,
+    write_fe_dat,
+)
+
+
+def test_scan_ll_out_converged(tmp_path):
+    shutil.copy("test/test_files/h2/ll_out", tmp_path)
+    scan = scan_ll_out(os.path.join(tmp_path, "ll_out"))
+    assert scan == LlOutScan(
+        has_error=False, converged=True, error_messages=[], last_step=5
+    )
+
+
+def test_scan_ll_out_error(tmp_path):
+    shutil.copy("test/test_files/failed_u_run/ll_out", tmp_path)
+    scan = scan_ll_out(os.path.join(tmp_path, "ll_out"))
+    assert scan == LlOutScan(
+        has_error=True,
+        converged=False,
+        error_messages=["ZBRENT: fatal error in bracketing"],
+        last_step=171,
+    )
+
+
+def test_scan_ll_out_no_trailing_newline(tmp_path):
+    ll_out_path = os.path.join(tmp_path, "ll_out")
+    with open(ll_out_path, "w") as ll_out:
+        ll_out.write("   1 F= -.67E+01 E0= -.67E+01  d E =-.67E+01\nerror A test error")
+    scan = scan_ll_out(ll_out_path)
+    assert scan.error_messages == []
+    assert scan.last_step == 1
+    assert read_error_messages(ll_out_path) == ["error A test error"]
+
+
+def test_scan_ll_out_stops_at_marker(tmp_path):
+    ll_out_path = os.path.join(tmp_path, "ll_out")
+    with open(ll_out_path, "wb") as ll_out:
+        # Not valid utf-8, and never reached when reading from the end
+        ll_out.write(b"\xff\xfe garbage\n" * 1000)
+        ll_out.write(b"   7 F= -.67E+01 E0= -.67E+01  d E =-.67E+01\n")
+        ll_out.write(
+            b" reached required accuracy - stopping structural energy minimisation\n"
+        )
+    scan = scan_ll_out(ll_out_path)
+    assert scan.converged is True
+    assert scan.has_error is False
+    assert scan.last_step == 7
+
+
+def test_scan_ll_out_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        scan_ll_out(os.path.join(tmp_path, "ll_out"))
+
+
+def test_scan_ll_out_empty(tmp_path):
+    ll_out_path = os.path.join(tmp_path, "ll_out")
+    open(ll_out_path, "w").close()
+    assert scan_ll_out(ll_out_path) == LlOutScan(
+        has_error=False, converged=False, error_messages=[], last_step=0
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 4096])
+@pytest.mark.parametrize(
+    "contents", ["", "\n", "a", "a\n", "a\nbc\n\ndef", "a\nbc\n\ndef\n\n"]
+)
+def test_read_lines_reversed(tmp_path, contents, chunk_size):
+    path = os.path.join(tmp_path, "file")
+    with open(path, "w") as f:
+        f.write(contents)
+    with open(path, "r") as f:
+        expected = [line.rstrip("\n") for line in f]
+    assert list(read_lines_reversed(path, chunk_size)) == expected[::-1]
+
+
+H2_FORCE_ENERGY = [
+    (0, 0.501336, -6.74593721),
+    (1, 0.129118, -6.74899365),
+    (2, 0.012076, -6.74922709),
+    (3, 0.005203, -6.74922542),
+    (4, 0.002109, -6.74922744),
+]
+
+
+def test_read_force_energy(tmp_path):
+    rows = read_force_energy("test/test_files/h2_completed_run/OUTCAR")
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY
+    assert rows[0][3] == 0
+    assert rows[4][3] == pytest.approx(-6.74922744 + 6.74593721)
+
+
+def test_read_force_energy_without_vtst(tmp_path):
+    outcar_path = os.path.join(tmp_path, "OUTCAR")
+    with open("test/test_files/h2_completed_run/OUTCAR", "r") as outcar:
+        lines = [line for line in outcar if "FORCES: max atom" not in line]
+    with open(outcar_path, "w") as outcar:
+        outcar.writelines(lines)
+    rows = read_force_energy(outcar_path)
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY
+
+
+def test_read_force_energy_gzip(tmp_path):
+    with open("test/test_files/h2_completed_run/OUTCAR", "rb") as outcar:
+        with gzip.open(os.path.join(tmp_path, "OUTCAR.gz"), "wb") as outcar_gz:
+            shutil.copyfileobj(outcar, outcar_gz)
+    rows = read_force_energy(os.path.join(tmp_path, "OUTCAR"))
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY
+
+
+def test_read_force_energy_no_outcar(tmp_path):
+    assert read_force_energy(os.path.join(tmp_path, "OUTCAR")) == []
+
+
+def truncate_outcar(tmp_path, marker, keep, vtst=True):
+    """Writes the h2 OUTCAR to tmp_path up to keep characters into the last
+    line containing marker"""
+    with open("test/test_files/h2_completed_run/OUTCAR", "r") as outcar:
+        lines = [line for line in outcar if vtst or "FORCES: max atom" not in line]
+    cut = max(i for i, line in enumerate(lines) if marker in line)
+    outcar_path = os.path.join(tmp_path, "OUTCAR")
+    with open(outcar_path, "w") as outcar:
+        outcar.writelines(lines[:cut])
+        outcar.write(lines[cut][:keep])
+    return outcar_path
+
+
+def test_read_force_energy_truncated_in_force_block(tmp_path):
+    outcar_path = truncate_outcar(tmp_path, "0.002109      0.000000", 60, vtst=False)
+    rows = read_force_energy(outcar_path)
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY[:4]
+
+
+def test_read_force_energy_truncated_before_block_ends(tmp_path):
+    outcar_path = truncate_outcar(tmp_path, "-0.002109     -0.000000", 1000, vtst=False)
+    rows = read_force_energy(outcar_path)
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY[:4]
+
+
+def test_read_force_energy_truncated_energy_line(tmp_path):
+    outcar_path = truncate_outcar(tmp_path, "energy  without entropy", 30)
+    rows = read_force_energy(outcar_path)
+    assert [row[:3] for row in rows] == H2_FORCE_ENERGY[:4]
+
+
+def test_write_fe_dat(tmp_path):
+    shutil.copy("test/test_files/h2_completed_run/OUTCAR", tmp_path)
+    write_fe_dat(tmp_path)
+    with open(os.path.join(tmp_path, "fe.dat"), "r") as fe_dat:
+        lines = fe_dat.readlines()
+    assert len(lines) == 5
+    assert lines[0] == "    0             0.501336            -6.745937                    0\n"
+    assert lines[4].split()[:3] == ["4", "0.002109", "-6.749227"]
+    assert not os.path.exists(os.path.join(tmp_path, "fe.dat.tmp"))
+
+
+def test_write_fe_dat_keeps_old_on_failure(tmp_path, monkeypatch):
+    shutil.copy("test/test_files/h2_completed_run/OUTCAR", tmp_path)
+    fe_dat_path = os.path.join(tmp_path, "fe.dat")
+    with open(fe_dat_path, "w") as fe_dat:
+        fe_dat.write("already written\n")
+    os.utime(fe_dat_path, ns=(0, 0))
+
+    def fail(outcar_path):
+        raise OSError("read failed")
+
+    monkeypatch.setattr("automagician.output_scan.read_force_energy", fail)
+    with pytest.raises(OSError):
+        write_fe_dat(tmp_path)
+    with open(fe_dat_path, "r") as fe_dat:
+        assert fe_dat.read() == "already written\n"
+
+
+def test_write_fe_dat_skips_when_newer(tmp_path):
+    shutil.copy("test/test_files/h2_completed_run/OUTCAR", tmp_path)
+    fe_dat_path = os.path.join(tmp_path, "fe.dat")
+    with open(fe_dat_path, "w") as fe_dat:
+        fe_dat.write("already written\n")
+    os.utime(os.path.join(tmp_path, "OUTCAR"), ns=(0, 0))
+    write_fe_dat(tmp_path)
+    with open(fe_dat_path, "r") as fe_dat:
+        assert fe_dat.read() == "already written\n"
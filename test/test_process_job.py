@@ -14,6 +14,7 @@ from automagician.process_job import (
     classify_job_dir,
     determine_box_convergence,
     determine_convergence,
+    get_residueSFE,
     gone_job_check,
     grep_ll_out_convergence,
     is_isif3,
@@ -74,6 +75,11 @@ def test_check_error_has_no_error(tmp_path):
     assert error is False
 
 
+def test_check_error_no_ll_out(tmp_path):
+    error = check_error(tmp_path)
+    assert error is False
+
+
 def test_grep_ll_out_convergence_converged(tmp_path):
     shutil.copy("test/test_files/h2/ll_out", tmp_path)
     cwd = os.getcwd()
@@ -90,6 +96,18 @@ def test_grep_ll_out_convergence_error(tmp_path):
     assert grep_return_code is False
 
 
+def test_get_residueSFE_no_runs(tmp_path):
+    assert get_residueSFE(tmp_path) == (0, 0.0, 0.0)
+
+
+def test_get_residueSFE_combines_runs(tmp_path):
+    shutil.copytree("test/test_files/h2_completed_run", os.path.join(tmp_path, "run0"))
+    assert get_residueSFE(tmp_path) == (4, 0.002109, -6.749227)
+    # Read from the saved state afterwards
+    shutil.rmtree(os.path.join(tmp_path, "run0"))
+    assert get_residueSFE(tmp_path) == (4, 0.002109, -6.749227)
+
+
 def test_is_isif3_non_isif3(tmp_path):
     shutil.copy("test/test_files/failed_u_run/INCAR", tmp_path)
     isif3_ret_val = is_isif3(tmp_path)
@@ -223,7 +241,8 @@ def test_process_unconverged_files_present(tmp_path):
     assert sub_quene == [job_path]
     with open(os.path.join(job_path, "prelminary_results.txt"), "r") as f:
         file = f.read()
-        assert file == f"{job_path}\n     0     0.0     0.0\n"
+        # The last step of the OUTCAR wrapped up into run0
+        assert file == f"{job_path}\n     4     0.002109     -6.749227\n"
     assert os.path.isdir(os.path.join(job_path, "run0"))
 
 
@@ -2,7 +2,13 @@ import os
 import shutil
 
 from automagician.classes import DosJob, JobStatus, OptJob, SSHConfig, WavJob
-from automagician.register import exclude_regex, process_queue, register
+from automagician.register import (
+    exclude_regex,
+    process_queue,
+    register,
+    scan_directory,
+    scan_tree,
+)
 
 
 def test_process_queue_nothing(tmp_path):
@@ -502,3 +508,80 @@ def test_exclude_regex_band():
 
 def test_exclude_regex_home():
     assert exclude_regex("/home") is False
+
+
+def test_scan_directory_opt_job(tmp_path):
+    job_dir = os.path.join(tmp_path, "opt_job_1")
+    shutil.copytree("test/test_files/h2", job_dir)
+    os.mkdir(os.path.join(job_dir, "dos"))
+    scan = scan_directory(job_dir, "fri.sub")
+    assert scan.path == job_dir
+    assert scan.subdirs == ["dos"]
+    assert scan.has_opt is True
+    assert scan.is_neb is False
+    assert scan.has_dos is False
+    assert scan.has_wav is False
+    assert scan.exclude is False
+
+
+def test_scan_directory_wrong_subfile(tmp_path):
+    job_dir = os.path.join(tmp_path, "opt_job_1")
+    shutil.copytree("test/test_files/h2", job_dir)
+    scan = scan_directory(job_dir, "halifax.sub")
+    assert scan.has_opt is False
+
+
+def test_scan_directory_note(tmp_path):
+    job_dir = os.path.join(tmp_path, "opt_job_1")
+    shutil.copytree("test/test_files/h2", job_dir)
+    with open(os.path.join(job_dir, "automagic_note"), "w+") as f:
+        f.write("wav\n")
+        f.write("dos\n")
+    scan = scan_directory(job_dir, "fri.sub")
+    assert scan.has_dos is False
+    assert scan.has_wav is True
+    assert scan.exclude is False
+
+
+def test_scan_directory_neb(tmp_path):
+    job_dir = os.path.join(tmp_path, "opt_job_1")
+    shutil.copytree("test/test_files/h2", job_dir)
+    os.mkdir(os.path.join(job_dir, "Band"))
+    os.mkdir(os.path.join(job_dir, "INI"))
+    os.mkdir(os.path.join(job_dir, "fin"))
+    scan = scan_directory(job_dir, "fri.sub")
+    assert scan.is_neb is True
+
+
+def test_scan_directory_missing(tmp_path):
+    scan = scan_directory(os.path.join(tmp_path, "not_here"), "fri.sub")
+    assert scan.subdirs == []
+    assert scan.has_opt is False
+
+
+def test_scan_tree_matches_os_walk(tmp_path):
+    for path in [
+        "a/b/c",
+        "a/b/d",
+        "a/e",
+        "f/g",
+        "f/run0/h",
+        "f/dos",
+        "i",
+    ]:
+        os.makedirs(os.path.join(tmp_path, path))
+    expected = [
+        job_dir
+        for job_dir, _, _ in os.walk(tmp_path, followlinks=True)
+        if not exclude_regex(job_dir)
+    ]
+    scans = scan_tree(str(tmp_path), "fri.sub", max_workers=4)
+    assert [scan.path for scan in scans] == expected
+    assert os.path.join(tmp_path, "f/run0/h") not in expected
+
+
+def test_scan_tree_follows_links(tmp_path):
+    os.makedirs(os.path.join(tmp_path, "real/job"))
+    os.symlink(os.path.join(tmp_path, "real"), os.path.join(tmp_path, "link"))
+    scans = scan_tree(str(tmp_path), "fri.sub")
+    assert os.path.join(tmp_path, "link", "job") in [scan.path for scan in scans]
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+import automagician.machine as machine_file
+from automagician.classes import JobStatus, Machine, OptJob, SSHConfig
+from automagician.database import Database
+from automagician.main import main_wrapper, set_up_parser
+from automagician.process_job import get_submitted_jobs, submit_queue
+from automagician.scheduler import get_scheduler
+from automagician.simulated_scheduler import SimulatedScheduler
+
+
+def make_jobs(tmp_path, count):
+    job_paths = []
+    for i in range(count):
+        job_path = os.path.join(tmp_path, f"job{i}")
+        os.mkdir(job_path)
+        with open(os.path.join(job_path, "fri.sub"), "w") as f:
+            f.write("#!/bin/bash\n#SBATCH -J AM_job\n\nmpirun vasp\n")
+        job_paths.append(job_path)
+    return job_paths
+
+
+def submit(backend, job_paths, opt_jobs, tmp_path, array=False):
+    submit_queue(
+        machine=Machine.FRI,
+        balance=False,
+        ssh_config=SSHConfig("NoSSH"),
+        sub_queue=list(job_paths),
+        home=tmp_path,
+        tacc_queue_sizes=[0, 0, 0],
+        opt_jobs=opt_jobs,
+        dos_jobs={},
+        wav_jobs={},
+        database=Database(os.path.join(tmp_path, "test_db")),
+        limit=99999,
+        snapshot=backend.snapshot(),
+        array=array,
+        backend=backend,
+    )
+
+
+def test_full_pass(tmp_path):
+    backend = SimulatedScheduler(user="me", submit_latency=0.001)
+    job_paths = make_jobs(tmp_path, 50)
+    backend.fail_dirs = [job_paths[3]]
+    opt_jobs = {
+        job_path: OptJob(JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI)
+        for job_path in job_paths
+    }
+    submit(backend, job_paths, opt_jobs, tmp_path)
+    assert len(backend.jobs) == 49
+    assert opt_jobs[job_paths[3]].status == JobStatus.ERROR
+    assert opt_jobs[job_paths[0]].status == JobStatus.RUNNING
+
+    failed_id = next(
+        job.job_id for job in backend.jobs.values() if job.work_dir == job_paths[1]
+    )
+    finished_id = next(
+        job.job_id for job in backend.jobs.values() if job.work_dir == job_paths[2]
+    )
+    backend.set_state(failed_id, "F")
+    backend.finish(finished_id)
+    get_submitted_jobs(
+        Machine.FRI, opt_jobs, {}, {}, [0, 0, 0], backend.snapshot(), backend
+    )
+    assert opt_jobs[job_paths[1]].status == JobStatus.ERROR
+    assert opt_jobs[job_paths[2]].status == JobStatus.INCOMPLETE
+    assert opt_jobs[job_paths[4]].status == JobStatus.RUNNING
+    assert failed_id not in backend.jobs
+
+
+def test_array_tasks_map_to_job_dirs(tmp_path):
+    backend = SimulatedScheduler(user="me")
+    job_paths = make_jobs(tmp_path, 5)
+    opt_jobs = {
+        job_path: OptJob(JobStatus.INCOMPLETE, Machine.FRI, Machine.FRI)
+        for job_path in job_paths
+    }
+    submit(backend, job_paths, opt_jobs, tmp_path, array=True)
+    snapshot = backend.snapshot()
+    assert [job.array_task_id for job in snapshot.jobs] == [0, 1, 2, 3, 4]
+    assert [job.work_dir for job in snapshot.jobs] == job_paths
+    for job_path in job_paths:
+        opt_jobs[job_path].status = JobStatus.INCOMPLETE
+    get_submitted_jobs(Machine.FRI, opt_jobs, {}, {}, [0, 0, 0], snapshot, backend)
+    assert all(job.status == JobStatus.RUNNING for job in opt_jobs.values())
+
+
+def test_get_scheduler_simulated():
+    assert isinstance(get_scheduler("simulated"), SimulatedScheduler)
+
+
+def test_main_refuses_simulated_without_db(monkeypatch, caplog):
+    def fail():
+        pytest.fail("main went past checking the scheduler")
+
+    monkeypatch.setattr(machine_file, "get_machine_number", fail)
+    main_wrapper(set_up_parser().parse_args(["--scheduler", "simulated"]))
+    assert "needs a separate database" in caplog.text
@@ -0,0 +1,235 @@
+import io
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from automagician.ssh_pool import RemoteBatch, SshPool
+
+
+class FakeChannel:
+    """Answers every command with its own text, after a short wait"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.closed = False
+
+    def exec_command(self, command):
+        self.command = command
+        with self.transport.lock:
+            self.transport.open_channels += 1
+            self.transport.most_channels = max(
+                self.transport.most_channels, self.transport.open_channels
+            )
+
+    def sendall(self, data):
+        self.stdin = data
+
+    def shutdown_write(self):
+        pass
+
+    def makefile(self, mode):
+        time.sleep(self.transport.delay)
+        return io.BytesIO(self.command.encode())
+
+    def makefile_stderr(self, mode):
+        return io.BytesIO(b"")
+
+    def recv_exit_status(self):
+        return 1 if self.command == "false" else 0
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            with self.transport.lock:
+                self.transport.open_channels -= 1
+
+
+class FakeTransport:
+    def __init__(self, delay=0.0):
+        self.active = True
+        self.keepalive = 0
+        self.delay = delay
+        self.open_channels = 0
+        self.most_channels = 0
+        self.lock = threading.Lock()
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, seconds):
+        self.keepalive = seconds
+
+    def open_session(self):
+        if not self.active:
+            raise EOFError()
+        return FakeChannel(self)
+
+
+class FakeConnection:
+    """Stands in for a fabric Connection, making a new transport on each open"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.transports = []
+        self.client = self
+
+    def open(self):
+        self.transports.append(FakeTransport(self.delay))
+
+    def close(self):
+        if len(self.transports) > 0:
+            self.transports[-1].active = False
+
+    def get_transport(self):
+        return self.transports[-1]
+
+
+def test_run():
+    connection = FakeConnection()
+    pool = SshPool(connection, keepalive=15)
+    result = pool.run("echo hi")
+    assert result.ok and result.stdout == "echo hi" and result.stderr == ""
+    assert pool.run("false").failed
+    assert len(connection.transports) == 1
+    assert connection.transports[0].keepalive == 15
+    assert connection.transports[0].open_channels == 0
+
+
+def test_reconnects_when_connection_dies():
+    connection = FakeConnection()
+    pool = SshPool(connection)
+    pool.run("hostname")
+    connection.transports[0].active = False
+    assert pool.run("hostname").ok
+    assert len(connection.transports) == 2
+
+
+def test_reconnects_when_channel_fails():
+    connection = FakeConnection()
+    pool = SshPool(connection)
+    pool.run("hostname")
+
+    def refuse():
+        raise EOFError()
+
+    connection.transports[0].open_session = refuse
+    assert pool.run("hostname").ok
+    assert len(connection.transports) == 2
+
+
+def test_gives_up_after_retries():
+    connection = FakeConnection()
+    pool = SshPool(connection, retries=2)
+
+    def open():
+        connection.transports.append(FakeTransport())
+        connection.transports[-1].active = False
+
+    connection.open = open
+    with pytest.raises(EOFError):
+        pool.run("hostname")
+    assert len(connection.transports) == 3
+
+
+def test_channels_run_in_parallel():
+    connection = FakeConnection(delay=0.05)
+    pool = SshPool(connection, max_channels=4)
+    threads = [
+        threading.Thread(target=pool.run, args=(f"sbatch {i}",)) for i in range(12)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - start < 0.05 * 12 / 2
+    assert connection.transports[0].most_channels == 4
+    assert len(connection.transports) == 1
+
+
+class ShellChannel:
+    """Runs the command with sh on this machine, as the other machine would"""
+
+    def __init__(self, commands):
+        commands.append(None)
+        self.commands = commands
+
+    def exec_command(self, command):
+        self.commands[-1] = command
+        self.process = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+
+    def shutdown_write(self):
+        self.process.stdin.close()
+
+    def makefile(self, mode):
+        return self.process.stdout
+
+    def makefile_stderr(self, mode):
+        return self.process.stderr
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        pass
+
+
+def shell_pool(commands):
+    transport = SimpleNamespace(
+        open_session=lambda: ShellChannel(commands),
+        is_active=lambda: True,
+        set_keepalive=lambda seconds: None,
+    )
+    return SshPool(
+        SimpleNamespace(
+            open=lambda: None,
+            close=lambda: None,
+            client=SimpleNamespace(get_transport=lambda: transport),
+        )
+    )
+
+
+def test_batch_runs_in_one_channel(tmp_path):
+    commands = []
+    batch = RemoteBatch()
+    batch.add(f"mkdir -p {tmp_path}/lock")
+    batch.add(f"test -e {tmp_path}/lock/file && cat {tmp_path}/lock/file")
+    batch.add(f"cd {tmp_path}/lock && pwd")
+    batch.add("echo out; echo err >&2; exit 3")
+    batch.add("cat; pwd")
+    results = batch.run(shell_pool(commands))
+    assert len(commands) == 1
+    assert [result.return_code for result in results] == [0, 1, 0, 3, 0]
+    assert results[2].stdout == f"{tmp_path}/lock\n"
+    assert results[3].stdout == "out\n" and results[3].stderr == "err\n"
+    assert results[4].stdout != results[2].stdout
+    assert all(result.stderr == "" for result in results[:3])
+    assert [result.command for result in results] == batch.commands
+
+
+def test_batch_stopped_early():
+    batch = RemoteBatch()
+    batch.add("echo one")
+    batch.add("kill -9 $$")
+    batch.add("echo three")
+    results = batch.run(shell_pool([]))
+    assert results[0].ok and results[0].stdout == "one\n"
+    assert results[1].return_code == -1 and results[2].return_code == -1
+
+
+def test_empty_batch():
+    commands = []
+    assert RemoteBatch().run(shell_pool(commands)) == []
+    assert commands == []
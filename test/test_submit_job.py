@@ -1,17 +1,64 @@
 import os
 from unittest.mock import MagicMock, call, patch
 
-from automagician.classes import DosJob, JobStatus, Machine, OptJob, SSHConfig, WavJob
+from automagician.classes import (
+    DosJob,
+    JobStatus,
+    Machine,
+    OptJob,
+    SchedulerJob,
+    SchedulerSnapshot,
+    SSHConfig,
+    WavJob,
+)
 from automagician.database import Database
 from automagician.process_job import get_submitted_jobs, submit_queue
+from automagician.scheduler import (
+    SgeScheduler,
+    array_template,
+    cancel_jobs,
+    get_user_jobs,
+    map_array_tasks,
+    parse_qstat,
+    parse_qstat_workdirs,
+    parse_squeue,
+)
+
+
+CANCELLED_JOB_IDS = [
+    "53244",
+    "53245",
+    "53246",
+    "53247",
+    "53248",
+    "53249",
+    "53251",
+    "53252",
+    "53253",
+    "53254",
+    "53255",
+    "53256",
+    "53258",
+    "53259",
+    "53260",
+    "53261",
+    "53262",
+    "53263",
+    "53265",
+    "53266",
+    "53267",
+    "53268",
+    "53269",
+    "53270",
+]
+
+
+def read_snapshot(path: str, user: str) -> SchedulerSnapshot:
+    with open(path, "r") as f:
+        return SchedulerSnapshot(parse_squeue(f.read()), user)
 
 
 def fix_subprocess(*args, **kwargs):
-    if args[0][0] == "squeue":
-        with open("test/test_files/sample_squeue", "r") as f:
-            mock = MagicMock()
-            mock.stdout = f.read()
-            return mock
     if args[0][0] == "sbatch":
         mock = MagicMock()
         print(args[0][1])
@@ -23,7 +70,7 @@ def fix_subprocess(*args, **kwargs):
     raise AssertionError()
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_no_jobs(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -46,12 +93,13 @@ def test_submit_queue_no_jobs(monkeypatch, tmp_path):
         dos_jobs=dos_jobs,
         database=db,
         limit=999,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
-    monkeypatch.run.assert_called_once_with(["squeue"], capture_output=True)
+    monkeypatch.run.assert_not_called()
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_1_job(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -77,18 +125,18 @@ def test_submit_queue_1_job(monkeypatch, tmp_path):
         dos_jobs=dos_jobs,
         database=db,
         limit=999,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
     monkeypatch.run.assert_has_calls(
         [
-            call(["squeue"], capture_output=True),
-            call(["sbatch", os.path.join(job1_path, "fri.sub")]),
+            call(["sbatch", os.path.join(job1_path, "fri.sub")], cwd=job1_path),
         ]
     )
     assert opt_jobs == {job1_path: OptJob(JobStatus.RUNNING, 0, 0)}
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_2_jobs(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -117,12 +165,12 @@ def test_submit_queue_2_jobs(monkeypatch, tmp_path):
         dos_jobs=dos_jobs,
         database=db,
         limit=999,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
     monkeypatch.run.assert_has_calls(
         [
-            call(["squeue"], capture_output=True),
-            call(["sbatch", os.path.join(job1_path, "fri.sub")]),
+            call(["sbatch", os.path.join(job1_path, "fri.sub")], cwd=job1_path),
         ]
     )
     assert opt_jobs == {
@@ -131,7 +179,7 @@ def test_submit_queue_2_jobs(monkeypatch, tmp_path):
     }
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_2_jobs_sbatch_error(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -167,15 +215,16 @@ def test_submit_queue_2_jobs_sbatch_error(monkeypatch, tmp_path):
         dos_jobs=dos_jobs,
         database=db,
         limit=999,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
     monkeypatch.run.assert_has_calls(
         [
-            call(["squeue"], capture_output=True),
-            call(["sbatch", os.path.join(job1_path, "fri.sub")]),
-            call(["sbatch", os.path.join(job2_path, "fri.sub")]),
-            call(["sbatch", os.path.join(job_err_path, "fri.sub")]),
-        ]
+            call(["sbatch", os.path.join(job1_path, "fri.sub")], cwd=job1_path),
+            call(["sbatch", os.path.join(job2_path, "fri.sub")], cwd=job2_path),
+            call(["sbatch", os.path.join(job_err_path, "fri.sub")], cwd=job_err_path),
+        ],
+        any_order=True,
     )
     assert opt_jobs == {
         job1_path: OptJob(JobStatus.RUNNING, 0, 0),
@@ -184,7 +233,7 @@ def test_submit_queue_2_jobs_sbatch_error(monkeypatch, tmp_path):
     }
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_2_jobs_limit_1(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -213,6 +262,7 @@ def test_submit_queue_2_jobs_limit_1(monkeypatch, tmp_path):
         dos_jobs=dos_jobs,
         database=db,
         limit=1,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
     monkeypatch.run.assert_not_called()
@@ -222,7 +272,7 @@ def test_submit_queue_2_jobs_limit_1(monkeypatch, tmp_path):
     }
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_submit_queue_2_jobs_acutally_submitted_hit_limit(monkeypatch, tmp_path):
     monkeypatch.run = MagicMock(side_effect=fix_subprocess)
     db = Database(os.path.join(tmp_path, "test_db"))
@@ -251,6 +301,7 @@ def test_submit_queue_2_jobs_acutally_submitted_hit_limit(monkeypatch, tmp_path)
         dos_jobs=dos_jobs,
         database=db,
         limit=2,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
     )
     assert cwd == os.getcwd()
     monkeypatch.run.assert_not_called()
@@ -260,13 +311,10 @@ def test_submit_queue_2_jobs_acutally_submitted_hit_limit(monkeypatch, tmp_path)
     }
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_get_submitted_job_not_in_dictionary(monkeypatch):
-    mock_squeue = ""
-    with open("test/test_files/sample_squeue_submit_job", "r") as f:
-        mock_squeue = f.read()
-    monkeypatch.check_output = MagicMock(return_value=mock_squeue)
-    monkeypatch.call = MagicMock(return_value="")
+    snapshot = read_snapshot("test/test_files/sample_squeue_submit_job", "dx858")
+    monkeypatch.run = MagicMock(return_value=MagicMock(returncode=0, stderr=""))
     opt_jobs = {"/home/jw53959/test": OptJob(JobStatus.RUNNING, 0, 0)}
     dos_jobs = {
         "/home/jw53959/test": DosJob(-1, JobStatus.RUNNING, JobStatus.RUNNING, 0, 0)
@@ -274,12 +322,9 @@ def test_get_submitted_job_not_in_dictionary(monkeypatch):
     wav_jobs = {"/home/jw53959/test": WavJob(-1, JobStatus.RUNNING, 0)}
     tacc_quene_sizes = [0, 0, 0]
 
-    get_submitted_jobs(0, opt_jobs, dos_jobs, wav_jobs, tacc_quene_sizes)
+    get_submitted_jobs(0, opt_jobs, dos_jobs, wav_jobs, tacc_quene_sizes, snapshot)
 
     assert tacc_quene_sizes == [0, 0, 0]
-    monkeypatch.check_output.assert_called_once_with(
-        ["squeue", "-u", os.environ["USER"], "-o", "%A %t %Z"]
-    )
     assert opt_jobs == {
         "/home/jw53959/test": OptJob(JobStatus.INCOMPLETE, 0, 0),
         "/home/dx858/ZTEST/12to8": OptJob(JobStatus.RUNNING, 0, 0),
@@ -318,42 +363,15 @@ def test_get_submitted_job_not_in_dictionary(monkeypatch):
         "/home/dx858/ZTEST/12to22": WavJob(-1, JobStatus.ERROR, 0),
     }
 
-    scancel_calls = [
-        call(["scancel", "53244"]),
-        call(["scancel", "53245"]),
-        call(["scancel", "53246"]),
-        call(["scancel", "53247"]),
-        call(["scancel", "53248"]),
-        call(["scancel", "53249"]),
-        call(["scancel", "53251"]),
-        call(["scancel", "53252"]),
-        call(["scancel", "53253"]),
-        call(["scancel", "53254"]),
-        call(["scancel", "53255"]),
-        call(["scancel", "53256"]),
-        call(["scancel", "53258"]),
-        call(["scancel", "53259"]),
-        call(["scancel", "53260"]),
-        call(["scancel", "53261"]),
-        call(["scancel", "53262"]),
-        call(["scancel", "53263"]),
-        call(["scancel", "53265"]),
-        call(["scancel", "53266"]),
-        call(["scancel", "53267"]),
-        call(["scancel", "53268"]),
-        call(["scancel", "53269"]),
-        call(["scancel", "53270"]),
-    ]
-    monkeypatch.call.assert_has_calls(scancel_calls)
+    monkeypatch.run.assert_called_once_with(
+        ["scancel", *CANCELLED_JOB_IDS], capture_output=True, text=True
+    )
 
 
-@patch("automagician.process_job.subprocess")
+@patch("automagician.scheduler.subprocess")
 def test_get_submitted_job_in_dictionary(monkeypatch):
-    mock_squeue = ""
-    with open("test/test_files/sample_squeue_submit_job", "r") as f:
-        mock_squeue = f.read()
-    monkeypatch.check_output = MagicMock(return_value=mock_squeue)
-    monkeypatch.call = MagicMock(return_value="")
+    snapshot = read_snapshot("test/test_files/sample_squeue_submit_job", "dx858")
+    monkeypatch.run = MagicMock(return_value=MagicMock(returncode=0, stderr=""))
     opt_jobs = {
         "/home/dx858/ZTEST/12to8": OptJob(JobStatus.INCOMPLETE, 1, 2),
         "/home/dx858/ZTEST/13to17": OptJob(JobStatus.INCOMPLETE, 3, 4),
@@ -400,7 +418,7 @@ def test_get_submitted_job_in_dictionary(monkeypatch):
     }
     tacc_quene_sizes = [0, 0, 0]
 
-    get_submitted_jobs(0, opt_jobs, dos_jobs, wav_jobs, tacc_quene_sizes)
+    get_submitted_jobs(0, opt_jobs, dos_jobs, wav_jobs, tacc_quene_sizes, snapshot)
 
     assert tacc_quene_sizes == [0, 0, 0]
 
@@ -437,30 +455,225 @@ def test_get_submitted_job_in_dictionary(monkeypatch):
         "/home/dx858/ZTEST/12to22": WavJob(-1, JobStatus.ERROR, 0),
     }
 
-    scancel_calls = [
-        call(["scancel", "53244"]),
-        call(["scancel", "53245"]),
-        call(["scancel", "53246"]),
-        call(["scancel", "53247"]),
-        call(["scancel", "53248"]),
-        call(["scancel", "53249"]),
-        call(["scancel", "53251"]),
-        call(["scancel", "53252"]),
-        call(["scancel", "53253"]),
-        call(["scancel", "53254"]),
-        call(["scancel", "53255"]),
-        call(["scancel", "53256"]),
-        call(["scancel", "53258"]),
-        call(["scancel", "53259"]),
-        call(["scancel", "53260"]),
-        call(["scancel", "53261"]),
-        call(["scancel", "53262"]),
-        call(["scancel", "53263"]),
-        call(["scancel", "53265"]),
-        call(["scancel", "53266"]),
-        call(["scancel", "53267"]),
-        call(["scancel", "53268"]),
-        call(["scancel", "53269"]),
-        call(["scancel", "53270"]),
+    monkeypatch.run.assert_called_once_with(
+        ["scancel", *CANCELLED_JOB_IDS], capture_output=True, text=True
+    )
+
+
+def test_parse_squeue():
+    snapshot = read_snapshot("test/test_files/sample_squeue_submit_job", "dx858")
+    assert len(snapshot.jobs) == 32
+    assert snapshot.jobs[3] == SchedulerJob(
+        job_id="53241",
+        state="R",
+        partition="normal",
+        user="mr62688",
+        work_dir="/home/mr62688/other_user_job",
+        array_job_id="53241",
+    )
+    user_jobs = get_user_jobs(snapshot)
+    assert len(user_jobs) == 31
+    assert all(job.user == "dx858" for job in user_jobs)
+    assert parse_squeue("") == []
+    assert parse_squeue("1|R|normal|me|1|N/A|/home/me/a|b\n")[0].work_dir == "/home/me/a|b"
+
+
+def test_parse_squeue_array_task():
+    jobs = parse_squeue("7|PD|normal|me|5|2|/home/me/.automagician_arrays\n")
+    assert jobs == [
+        SchedulerJob(
+            job_id="5_2",
+            state="PD",
+            partition="normal",
+            user="me",
+            work_dir="/home/me/.automagician_arrays",
+            array_job_id="5",
+            array_task_id=2,
+        )
     ]
-    monkeypatch.call.assert_has_calls(scancel_calls)
+
+
+def test_map_array_tasks(tmp_path):
+    array_dir = os.path.join(tmp_path, "arrays")
+    os.mkdir(array_dir)
+    with open(os.path.join(array_dir, "array_a.txt"), "w") as f:
+        f.write("/home/me/job0\n/home/me/job1\n")
+    os.symlink(
+        os.path.join(array_dir, "array_a.txt"), os.path.join(array_dir, "5.manifest")
+    )
+    for name in ["array_b.txt", "array_b.sub", "6_0.out"]:
+        open(os.path.join(array_dir, name), "w").close()
+    os.symlink(
+        os.path.join(array_dir, "array_b.txt"), os.path.join(array_dir, "6.manifest")
+    )
+    jobs = parse_squeue(
+        f"5_0|R|normal|me|5|0|{array_dir}\n"
+        f"5_1|PD|normal|me|5|1|{array_dir}\n"
+        "9|R|normal|me|9|N/A|/home/me/job9\n"
+    )
+    map_array_tasks(jobs, array_dir)
+    assert [job.work_dir for job in jobs] == [
+        "/home/me/job0",
+        "/home/me/job1",
+        "/home/me/job9",
+    ]
+    assert sorted(os.listdir(array_dir)) == ["5.manifest", "array_a.txt"]
+
+
+def fix_sbatch_array(*args, **kwargs):
+    if args[0][:2] != ["sbatch", "--parsable"]:
+        return fix_subprocess(*args, **kwargs)
+    mock = MagicMock()
+    mock.returncode = 0
+    mock.stdout = "123\n"
+    return mock
+
+
+@patch("automagician.scheduler.subprocess")
+def test_submit_queue_array(monkeypatch, tmp_path):
+    monkeypatch.run = MagicMock(side_effect=fix_sbatch_array)
+    db = Database(os.path.join(tmp_path, "test_db"))
+    job_paths = [os.path.join(tmp_path, f"job{i}") for i in range(3)]
+    subfiles = [
+        "#!/bin/bash\n#SBATCH -J AM_0\n#SBATCH --output=ll_out\n\nmpirun vasp\n",
+        "#!/bin/bash\n#SBATCH -J AM_1\n#SBATCH --output=ll_out\n\nmpirun vasp\n",
+        "#!/bin/bash\n#SBATCH -J AM_2\n#SBATCH --output=ll_out\n\nmpirun other\n",
+    ]
+    for job_path, subfile in zip(job_paths, subfiles):
+        os.mkdir(job_path)
+        with open(os.path.join(job_path, "fri.sub"), "w") as f:
+            f.write(subfile)
+    opt_jobs = {
+        job_path: OptJob(JobStatus.INCOMPLETE, 0, 0) for job_path in job_paths
+    }
+    cwd = os.getcwd()
+    submit_queue(
+        machine=Machine.FRI,
+        balance=False,
+        ssh_config=SSHConfig("NoSSH"),
+        sub_queue=list(job_paths),
+        home=tmp_path,
+        tacc_queue_sizes=[0, 0, 0],
+        opt_jobs=opt_jobs,
+        wav_jobs={},
+        dos_jobs={},
+        database=db,
+        limit=999,
+        snapshot=read_snapshot("test/test_files/sample_squeue", "jw53959"),
+        array=True,
+    )
+    assert cwd == os.getcwd()
+    assert monkeypatch.run.call_count == 2
+    monkeypatch.run.assert_called_with(
+        ["sbatch", os.path.join(job_paths[2], "fri.sub")], cwd=job_paths[2]
+    )
+    array_dir = os.path.join(tmp_path, ".automagician_arrays")
+    sbatch_args = monkeypatch.run.call_args_list[0][0][0]
+    assert sbatch_args[2:4] == ["--array=0-1", f"--chdir={array_dir}"]
+    with open(sbatch_args[4], "r") as f:
+        script = f.read()
+    assert "#SBATCH --output=ll_out" not in script
+    assert 'exec >"ll_out" 2>&1\n' in script
+    assert script.endswith("mpirun vasp\n")
+    with open(os.path.join(array_dir, "123.manifest"), "r") as f:
+        assert f.read().splitlines() == job_paths[:2]
+    assert opt_jobs == {
+        job_path: OptJob(JobStatus.RUNNING, 0, 0) for job_path in job_paths
+    }
+
+
+def test_array_template_keeps_body(tmp_path):
+    subfile = os.path.join(tmp_path, "fri.sub")
+    with open(subfile, "w") as f:
+        f.write(
+            "#!/bin/bash\n#SBATCH -J AM_0\n#SBATCH --job-name=AM_0\n"
+            "#SBATCH -N 1\n\nmpirun -J4 vasp --job-name=x\n"
+        )
+    assert array_template(subfile) == (
+        "#!/bin/bash\n#SBATCH -N 1\n\nmpirun -J4 vasp --job-name=x\n"
+    )
+
+
+def fix_scancel(*args, **kwargs):
+    assert args[0][0] == "scancel"
+    mock = MagicMock()
+    mock.returncode = 0
+    mock.stderr = ""
+    if "2" in args[0]:
+        mock.returncode = 1
+        mock.stderr = (
+            "scancel: error: Kill job error on job id 2: "
+            "Job/step already completing or completed\n"
+        )
+    return mock
+
+
+@patch("automagician.scheduler.subprocess")
+@patch("automagician.constants.SCANCEL_BATCH_SIZE", 3)
+def test_cancel_jobs_batches(monkeypatch):
+    monkeypatch.run = MagicMock(side_effect=fix_scancel)
+    cancelled = cancel_jobs(["1", "2", "3", "4", "5"])
+    assert monkeypatch.run.call_count == 2
+    monkeypatch.run.assert_has_calls(
+        [
+            call(["scancel", "1", "2", "3"], capture_output=True, text=True),
+            call(["scancel", "4", "5"], capture_output=True, text=True),
+        ]
+    )
+    assert cancelled == {"1": True, "2": False, "3": True, "4": True, "5": True}
+
+
+@patch("automagician.scheduler.subprocess")
+def test_cancel_jobs_none(monkeypatch):
+    assert cancel_jobs([]) == {}
+    monkeypatch.run.assert_not_called()
+
+
+QSTAT_OUTPUT = """job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID
+-----------------------------------------------------------------------------------------------------------------
+    101 0.55500 AM_a       jw53959      r     01/01/2020 10:00:00 all.q@compute-0-1.local           24
+    102 0.55500 AM_b       jw53959      Eqw   01/01/2020 10:00:00                                   24
+    103 0.00000 AM_c       mr62688      qw    01/01/2020 10:00:00                                   24
+"""
+
+QSTAT_J_OUTPUT = """==============================================================
+job_number:                 101
+owner:                      jw53959
+sge_o_workdir:              /home/jw53959/a
+==============================================================
+job_number:                 102
+owner:                      jw53959
+sge_o_workdir:              /home/jw53959/b
+"""
+
+
+def test_parse_qstat():
+    jobs = parse_qstat(QSTAT_OUTPUT, parse_qstat_workdirs(QSTAT_J_OUTPUT))
+    assert jobs == [
+        SchedulerJob("101", "r", "all.q", "jw53959", "/home/jw53959/a", "101"),
+        SchedulerJob("102", "Eqw", "", "jw53959", "/home/jw53959/b", "102"),
+        SchedulerJob("103", "qw", "", "mr62688", "INVALID_DIR", "103"),
+    ]
+
+
+@patch("automagician.scheduler.subprocess")
+def test_get_submitted_jobs_sge(monkeypatch):
+    monkeypatch.run = MagicMock(return_value=MagicMock(returncode=0, stderr=""))
+    jobs = parse_qstat(QSTAT_OUTPUT, parse_qstat_workdirs(QSTAT_J_OUTPUT))
+    opt_jobs = {}
+    get_submitted_jobs(
+        Machine.FRI,
+        opt_jobs,
+        {},
+        {},
+        [0, 0, 0],
+        SchedulerSnapshot(jobs, "jw53959"),
+        SgeScheduler(),
+    )
+    assert opt_jobs == {
+        "/home/jw53959/a": OptJob(JobStatus.RUNNING, 0, 0),
+        "/home/jw53959/b": OptJob(JobStatus.ERROR, 0, 0),
+    }
+    monkeypatch.run.assert_called_once_with(
+        ["qdel", "102"], capture_output=True, text=True
+    )
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from automagician.classes import Machine
+from automagician.submit_pool import SubmitPool
+
+
+def test_results_in_queued_order():
+    pool = SubmitPool(max_workers=4, target_limits={"local": (4, 0.0)})
+    for i in range(8):
+        pool.submit("local", f"job{i}", Machine.FRI, lambda i=i: i % 3 == 0)
+    results = pool.results()
+    pool.close()
+    assert results == [(f"job{i}", Machine.FRI, i % 3 == 0) for i in range(8)]
+    assert pool.results() == []
+
+
+def test_exception_is_an_error():
+    def fail() -> bool:
+        raise OSError("no sbatch")
+
+    pool = SubmitPool(max_workers=2, target_limits={"remote": (1, 0.0)})
+    pool.submit("remote", "job0", Machine.HALIFAX, fail)
+    pool.submit("remote", "job1", Machine.HALIFAX, lambda: False)
+    assert pool.results() == [
+        ("job0", Machine.HALIFAX, True),
+        ("job1", Machine.HALIFAX, False),
+    ]
+    pool.close()
+
+
+def test_target_limits_concurrency():
+    lock = threading.Lock()
+    running = {"local": 0, "remote": 0}
+    most = {"local": 0, "remote": 0}
+
+    def submit(target: str) -> bool:
+        with lock:
+            running[target] += 1
+            most[target] = max(most[target], running[target])
+        time.sleep(0.01)
+        with lock:
+            running[target] -= 1
+        return False
+
+    pool = SubmitPool(
+        max_workers=8, target_limits={"local": (3, 0.0), "remote": (1, 0.0)}
+    )
+    for i in range(12):
+        target = "local" if i % 2 == 0 else "remote"
+        pool.submit(target, f"job{i}", Machine.FRI, lambda t=target: submit(t))
+    pool.results()
+    pool.close()
+    assert most["local"] <= 3
+    assert most["remote"] == 1
+
+
+def test_target_min_interval():
+    starts = []
+    pool = SubmitPool(max_workers=4, target_limits={"local": (4, 0.02)})
+    for i in range(4):
+        pool.submit(
+            "local", f"job{i}", Machine.FRI, lambda: starts.append(time.monotonic())
+        )
+    pool.results()
+    pool.close()
+    starts.sort()
+    assert all(b - a >= 0.015 for a, b in zip(starts, starts[1:]))
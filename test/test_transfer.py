@@ -0,0 +1,148 @@
+import os
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from automagician.ssh_pool import SshPool
+from automagician.transfer import TransferError, get_dir, put_dir, sync_dir
+
+
+class LocalChannel:
+    """Runs the command a remote machine would run on this machine instead"""
+
+    def exec_command(self, command):
+        self.process = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+
+    def shutdown_write(self):
+        self.process.stdin.close()
+
+    def makefile(self, mode):
+        return self.process.stdout
+
+    def makefile_stderr(self, mode):
+        return self.process.stderr
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        pass
+
+
+def local_connection():
+    transport = SimpleNamespace(
+        open_session=LocalChannel,
+        is_active=lambda: True,
+        set_keepalive=lambda seconds: None,
+    )
+    return SshPool(
+        SimpleNamespace(
+            open=lambda: None,
+            close=lambda: None,
+            client=SimpleNamespace(get_transport=lambda: transport),
+        )
+    )
+
+
+def make_job(path):
+    os.makedirs(os.path.join(path, "run0"))
+    files = {"POSCAR": "H2\n", "CHGCAR": "1.0 " * 1000, "run0/OUTCAR": "done\n"}
+    for name, contents in files.items():
+        with open(os.path.join(path, name), "w") as f:
+            f.write(contents)
+        os.utime(os.path.join(path, name), ns=(1_000_000_000, 1_000_000_000))
+    return files
+
+
+def check_copy(path, files):
+    for name, contents in files.items():
+        with open(os.path.join(path, name), "r") as f:
+            assert f.read() == contents
+        assert os.stat(os.path.join(path, name)).st_mtime_ns == 1_000_000_000
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_put_dir(tmp_path, compression):
+    local = os.path.join(tmp_path, "local")
+    remote = os.path.join(tmp_path, "remote", "automagician_jobs", "job")
+    files = make_job(local)
+    put_dir(local, remote, local_connection(), compression)
+    check_copy(remote, files)
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_get_dir(tmp_path, compression):
+    remote = os.path.join(tmp_path, "remote")
+    local = os.path.join(tmp_path, "local", "job")
+    files = make_job(remote)
+    get_dir(remote, local, local_connection(), compression)
+    check_copy(local, files)
+
+
+def test_get_dir_missing_remote(tmp_path):
+    with pytest.raises(TransferError):
+        get_dir(
+            os.path.join(tmp_path, "missing"),
+            os.path.join(tmp_path, "local"),
+            local_connection(),
+        )
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        put_dir(str(tmp_path), str(tmp_path), local_connection(), "rar")
+
+
+def test_sync_dir_copies_only_changes(tmp_path):
+    remote = os.path.join(tmp_path, "remote")
+    local = os.path.join(tmp_path, "local")
+    files = make_job(remote)
+    put_dir(remote, local, local_connection())
+    with open(os.path.join(remote, "CHGCAR"), "a") as f:
+        f.write("2.0\n")
+    os.utime(os.path.join(remote, "CHGCAR"), ns=(1_000_000_000, 1_000_000_000))
+    files["CHGCAR"] += "2.0\n"
+    with open(os.path.join(remote, "run0", "XDATCAR"), "w") as f:
+        f.write("step 1\n")
+    os.utime(os.path.join(remote, "run0", "XDATCAR"), ns=(1_000_000_000,) * 2)
+    files["run0/XDATCAR"] = "step 1\n"
+    with open(os.path.join(local, "stale"), "w") as f:
+        f.write("only here\n")
+    poscar_inode = os.stat(os.path.join(local, "POSCAR")).st_ino
+
+    changed = sync_dir(remote, local, local_connection())
+
+    assert sorted(changed) == ["CHGCAR", "run0/XDATCAR"]
+    check_copy(local, files)
+    assert not os.path.exists(os.path.join(local, "stale"))
+    assert os.stat(os.path.join(local, "POSCAR")).st_ino == poscar_inode
+    assert [name for name in os.listdir(tmp_path) if "sync" in name] == []
+
+
+@pytest.mark.parametrize("use_hash,expected", [(True, []), (False, ["POSCAR"])])
+def test_sync_dir_hash(tmp_path, use_hash, expected):
+    remote = os.path.join(tmp_path, "remote")
+    local = os.path.join(tmp_path, "local")
+    files = make_job(remote)
+    put_dir(remote, local, local_connection())
+    os.utime(os.path.join(local, "POSCAR"), ns=(5_000_000_000, 5_000_000_000))
+    assert sync_dir(remote, local, local_connection(), use_hash) == expected
+    check_copy(local, files)
+
+
+def test_sync_dir_failure_keeps_local(tmp_path):
+    local = os.path.join(tmp_path, "local")
+    files = make_job(local)
+    with pytest.raises(TransferError):
+        sync_dir(os.path.join(tmp_path, "missing"), local, local_connection())
+    check_copy(local, files)